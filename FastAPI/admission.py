@@ -0,0 +1,241 @@
+"""
+Admission control + chế độ degraded cho /chat, /chat/stream (bộ đếm riêng mỗi worker).
+
+- Tối đa max_inflight request chạy cùng lúc, phần dư xếp hàng FIFO. Hàng đầy -> Overloaded 429
+  ngay; chờ quá queue_timeout_s -> Overloaded 503. Cả hai kèm Retry-After.
+- Request được nhận chạy "full" hoặc "degraded" (không gọi LLM), chọn lúc vào: in-flight
+  >= degrade_inflight, chờ trong hàng >= degrade_wait_s, hoặc tỉ lệ lỗi LLM trong cửa sổ gần đây
+  >= error_rate (khi đó giữ degraded thêm hold_s rồi mới thử LLM lại).
+- Chế độ của request hiện tại nằm trong ContextVar (serving_mode()); RAGBot đọc để bỏ lời gọi LLM.
+- Lời gọi LLM lỗi mà câu trả lời dùng bản dự phòng -> note_llm_fallback(); request đó không cache.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Set, Tuple
+
+from config import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_RETRY_AFTER_S,
+    DEGRADE_HOLD_S,
+    DEGRADE_INFLIGHT,
+    DEGRADE_LLM_ERROR_RATE,
+    DEGRADE_LLM_MIN_SAMPLES,
+    DEGRADE_LLM_WINDOW_S,
+    DEGRADE_QUEUE_WAIT_MS,
+)
+from metrics import ADMISSION_SHED, SERVING_MODE
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+DEGRADED = "degraded"
+
+_mode: ContextVar[str] = ContextVar("serving_mode", default=FULL)
+# Tên các lời gọi LLM đã lỗi trong request; set dùng chung nên task con (speculative, single-flight) ghi được
+_fallbacks: ContextVar[Optional[Set[str]]] = ContextVar("llm_fallbacks", default=None)
+
+
+def serving_mode() -> str:
+    return _mode.get()
+
+
+def note_llm_fallback(call: str) -> None:
+    """Lời gọi LLM `call` lỗi, câu trả lời của request dùng bản dự phòng."""
+    calls = _fallbacks.get()
+    if calls is not None:
+        calls.add(call)
+
+
+def llm_fell_back(call: Optional[str] = None) -> bool:
+    """Request đã có lời gọi LLM lỗi (hoặc đúng lời gọi `call`) chưa."""
+    calls = _fallbacks.get()
+    if not calls:
+        return False
+    return call is None or call in calls
+
+
+@contextmanager
+def serving(mode: str) -> Iterator[None]:
+    token = _mode.set(mode)
+    fb_token = _fallbacks.set(set())
+    try:
+        yield
+    finally:
+        try:
+            _fallbacks.reset(fb_token)
+            _mode.reset(token)
+        except ValueError:
+            # Async generator bị đóng ở context khác (GC) -> context cũ đã bỏ, không cần reset
+            pass
+
+
+class Overloaded(Exception):
+    def __init__(self, status: int, reason: str, retry_after_s: int):
+        super().__init__(f"Server overloaded ({reason}), retry later")
+        self.status = status
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class Ticket:
+    """Một slot đã được nhận; release() gọi nhiều lần vẫn chỉ trả slot một lần."""
+    mode: str
+    reason: str
+    wait_ms: float
+    _owner: Optional["AdmissionController"] = field(default=None, repr=False)
+
+    def header(self) -> str:
+        return f"{self.mode}; reason={self.reason}" if self.reason else self.mode
+
+    def release(self) -> None:
+        owner, self._owner = self._owner, None
+        if owner is not None:
+            owner._release_slot()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int = ADMISSION_MAX_INFLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout_s: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000.0,
+        retry_after_s: int = ADMISSION_RETRY_AFTER_S,
+        degrade_inflight: int = DEGRADE_INFLIGHT,
+        degrade_wait_s: float = DEGRADE_QUEUE_WAIT_MS / 1000.0,
+        error_rate: float = DEGRADE_LLM_ERROR_RATE,
+        error_window_s: float = DEGRADE_LLM_WINDOW_S,
+        error_min_samples: int = DEGRADE_LLM_MIN_SAMPLES,
+        hold_s: float = DEGRADE_HOLD_S,
+        enabled: bool = ADMISSION_ENABLED,
+        llm_available: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.retry_after_s = retry_after_s
+        self.degrade_inflight = degrade_inflight
+        self.degrade_wait_s = degrade_wait_s
+        self.error_rate = error_rate
+        self.error_window_s = error_window_s
+        self.error_min_samples = error_min_samples
+        self.hold_s = hold_s
+        self.enabled = enabled
+        self.llm_available = llm_available
+        self._clock = clock
+
+        self.inflight = 0
+        self.waiting = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        # (thời điểm, ok) của các lời gọi LLM gần đây
+        self._llm: Deque[Tuple[float, bool]] = deque()
+        self._llm_errors = 0
+        self._degraded_until = 0.0
+
+    # ---------- Slot ----------
+    async def admit(self) -> Ticket:
+        """Nhận slot (có thể chờ trong hàng) rồi chọn chế độ; raise Overloaded nếu quá tải."""
+        wait_s = await self._take_slot()
+        mode, reason = self._decide(wait_s)
+        SERVING_MODE.inc(mode, reason or "ok")
+        return Ticket(mode, reason, round(wait_s * 1000.0, 1), self)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Ticket]:
+        ticket = await self.admit()
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def _take_slot(self) -> float:
+        if not self.enabled or (self.inflight < self.max_inflight and not self.waiting):
+            self.inflight += 1
+            return 0.0
+        if self.waiting >= self.max_queue:
+            raise self._shed(429, "queue_full")
+
+        t0 = self._clock()
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            raise self._shed(503, "queue_timeout") from None
+        except BaseException:
+            # Bị hủy (client ngắt) đúng lúc vừa được trao slot -> chuyển slot cho người sau
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            self.waiting -= 1
+        return self._clock() - t0
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                # Slot chuyển thẳng cho người chờ lâu nhất, in-flight giữ nguyên
+                fut.set_result(None)
+                return
+        self.inflight -= 1
+
+    def _shed(self, status: int, reason: str) -> Overloaded:
+        ADMISSION_SHED.inc(reason)
+        return Overloaded(status, reason, self.retry_after_s)
+
+    # ---------- Chế độ phục vụ ----------
+    def _decide(self, wait_s: float) -> Tuple[str, str]:
+        if not self.llm_available:
+            return DEGRADED, "llm_disabled"
+        if self._clock() < self._degraded_until:
+            return DEGRADED, "llm_errors"
+        if self.degrade_inflight > 0 and self.inflight >= self.degrade_inflight:
+            return DEGRADED, "inflight"
+        if self.degrade_wait_s > 0 and wait_s >= self.degrade_wait_s:
+            return DEGRADED, "queue_wait"
+        return FULL, ""
+
+    def record_llm(self, ok: bool) -> None:
+        """Kết quả một lời gọi LLM (sau hedge / failover); lỗi nhiều -> degraded trong hold_s."""
+        now = self._clock()
+        self._llm.append((now, ok))
+        self._llm_errors += not ok
+        self._trim(now)
+        n = len(self._llm)
+        if n >= self.error_min_samples and self._llm_errors / n >= self.error_rate:
+            logger.warning(
+                "LLM error rate %.0f%% over %d calls, serving degraded for %.0fs",
+                100.0 * self._llm_errors / n, n, self.hold_s,
+            )
+            self._degraded_until = now + self.hold_s
+            # Hết hold thì đếm lại từ đầu: lời gọi đầu tiên là lượt thử
+            self._llm.clear()
+            self._llm_errors = 0
+
+    def _trim(self, now: float) -> None:
+        while self._llm and now - self._llm[0][0] > self.error_window_s:
+            _, ok = self._llm.popleft()
+            self._llm_errors -= not ok
+
+    def llm_error_rate(self) -> float:
+        self._trim(self._clock())
+        return self._llm_errors / len(self._llm) if self._llm else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "llm_error_rate": round(self.llm_error_rate(), 3),
+            "degraded_hold_s": round(max(0.0, self._degraded_until - self._clock()), 1),
+        }
@@ -0,0 +1,201 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config import (
+    ANN_INDEX_TYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    FAISS_MMAP,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# faiss khuyên >= 39 điểm train cho mỗi centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def _effective_nlist(n: int, nlist: int) -> int:
+    return max(1, min(nlist, n // _MIN_POINTS_PER_CENTROID))
+
+
+def train_rows_needed(kind: str, nlist: int = IVF_NLIST) -> int:
+    """Số vector cần có trước khi train được index (0 = không cần train)."""
+    if (kind or "flat").lower() in ("ivf_flat", "ivf_pq"):
+        return nlist * _MIN_POINTS_PER_CENTROID
+    return 0
+
+
+def build_index(
+    embeddings: np.ndarray,
+    kind: str = ANN_INDEX_TYPE,
+    nlist: int = IVF_NLIST,
+    pq_m: int = PQ_M,
+    pq_nbits: int = PQ_NBITS,
+    hnsw_m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    add: bool = True,
+) -> faiss.Index:
+    """
+    Dựng index inner-product (vector đã L2-normalize -> cosine).
+    kind: flat | ivf_flat | hnsw | ivf_pq. Index IVF được train trên chính `embeddings`.
+    """
+    kind = (kind or "flat").lower()
+    n, dim = embeddings.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif kind == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, _effective_nlist(n, nlist), faiss.METRIC_INNER_PRODUCT)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif kind == "ivf_pq":
+        if dim % pq_m != 0:
+            raise ValueError(f"PQ_M={pq_m} must divide embedding dim {dim}")
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, _effective_nlist(n, nlist), pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT
+        )
+    else:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+    if not index.is_trained:
+        index.train(embeddings)
+    if add:
+        index.add(embeddings)
+    configure_index(index)
+    return index
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """Bóc IndexIDMap / IndexIDMap2 để lấy index lõi."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def with_ids(index: faiss.Index) -> faiss.Index:
+    """
+    Cho phép add_with_ids / remove_ids theo comicId.
+    IVF tự lưu id trong inverted list; flat/HNSW cần bọc IndexIDMap2.
+    """
+    if isinstance(_unwrap(index), faiss.IndexIVF):
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW không hỗ trợ remove_ids -> cập nhật incremental phải build lại."""
+    return not isinstance(_unwrap(index), faiss.IndexHNSW)
+
+
+def reconstruct_all(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """(vectors, labels) của toàn bộ index; label là id lưu trong index (comicId hoặc số dòng)."""
+    outer = faiss.downcast_index(index)
+    core = _unwrap(index)
+
+    if isinstance(core, faiss.IndexIVF):
+        invlists = core.invlists
+        chunks = [
+            faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+            for l in range(core.nlist)
+            if invlists.list_size(l)
+        ]
+        labels = np.concatenate(chunks).astype("int64") if chunks else np.zeros(0, dtype="int64")
+        core.set_direct_map_type(faiss.DirectMap.Hashtable)
+        vecs = np.vstack([core.reconstruct(int(i)) for i in labels]) if len(labels) else np.zeros((0, core.d))
+        return vecs.astype("float32"), labels
+
+    vecs = core.reconstruct_n(0, core.ntotal).astype("float32")
+    if isinstance(outer, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        labels = faiss.vector_to_array(outer.id_map).astype("int64")
+    else:
+        labels = np.arange(core.ntotal, dtype="int64")
+    return vecs, labels
+
+
+def configure_index(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> faiss.Index:
+    """Áp tham số lúc query (nprobe / efSearch) lên index đã load."""
+    core = _unwrap(index)
+    if isinstance(core, faiss.IndexIVF):
+        core.nprobe = min(nprobe or IVF_NPROBE, core.nlist)
+    elif isinstance(core, faiss.IndexHNSW):
+        core.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+def read_index(path: Any, mmap: bool = FAISS_MMAP) -> faiss.Index:
+    """
+    Load + configure_index. mmap: inverted list IVF (và mã của index flat nếu bản faiss có
+    IO_FLAG_MMAP_IFC) map thẳng từ file, nhiều process dùng chung page cache thay vì mỗi bên một bản.
+    """
+    if not mmap:
+        return configure_index(faiss.read_index(str(path)))
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if ifc:
+        try:
+            return configure_index(faiss.read_index(str(path), flags | ifc))
+        except RuntimeError:
+            # IVF: map cả file xung đột với mmap inverted list -> chỉ mmap inverted list
+            pass
+    return configure_index(faiss.read_index(str(path), flags))
+
+
+def describe_index(index: faiss.Index) -> Dict[str, Any]:
+    core = _unwrap(index)
+    info: Dict[str, Any] = {"class": type(core).__name__, "ntotal": int(index.ntotal), "dim": int(index.d)}
+    if isinstance(core, faiss.IndexIVF):
+        info.update(nlist=int(core.nlist), nprobe=int(core.nprobe))
+    elif isinstance(core, faiss.IndexHNSW):
+        info.update(efSearch=int(core.hnsw.efSearch), efConstruction=int(core.hnsw.efConstruction))
+    return info
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """Kích thước serialize ~ bộ nhớ index chiếm khi load."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def search_params(index: faiss.Index, sel: faiss.IDSelector) -> faiss.SearchParameters:
+    """SearchParameters mang IDSelector, giữ nguyên nprobe / efSearch đang cấu hình."""
+    core = _unwrap(index)
+    if isinstance(core, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=int(core.nprobe))
+    if isinstance(core, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=int(core.hnsw.efSearch))
+    return faiss.SearchParameters(sel=sel)
+
+
+def choose_index_type(n: int, dim: int, budget_bytes: float, kind: str = "auto") -> Tuple[str, Dict[str, Any]]:
+    """
+    (kind, tham số build_index) cho n vector trong ngân sách bộ nhớ.
+    auto: flat nếu vừa; không thì ivf_pq với số sub-quantizer lớn nhất mà code + id vẫn vừa.
+    """
+    kind = (kind or "auto").lower()
+    if kind != "auto":
+        return kind, {}
+    if n * dim * 4 <= budget_bytes:
+        return "flat", {}
+    # Mỗi vector IVF-PQ tốn m byte code (nbits=8) + 8 byte id
+    for m in sorted((m for m in range(1, dim + 1) if dim % m == 0), reverse=True):
+        if m <= 64 and n * (m + 8) <= budget_bytes:
+            return "ivf_pq", {"pq_m": m, "pq_nbits": 8}
+    logger.warning("%d vectors do not fit %.0f MB even with IVF-PQ m=1", n, budget_bytes / 1e6)
+    return "ivf_pq", {"pq_m": 1, "pq_nbits": 8}
@@ -0,0 +1,119 @@
+"""
+Gom các lời gọi đồng thời thành một batch.
+
+Thread nền lấy item đầu tiên rồi chờ thêm tối đa `max_wait_ms` (hoặc đến khi đủ
+`max_batch`), gọi `fn(items)` một lần và trả kết quả về Future của từng caller.
+Caller async dùng asyncio.wrap_future, caller đồng bộ gọi .result().
+Sau close(): item còn trong hàng và item submit sau đó nhận RuntimeError, không treo.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar("X")
+Y = TypeVar("Y")
+
+
+class MicroBatcher(Generic[X, Y]):
+    def __init__(self, fn: Callable[[List[X]], List[Y]], max_batch: int, max_wait_ms: float, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._q: "queue.Queue[Optional[Tuple[X, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: X) -> "Future[Y]":
+        fut: "Future[Y]" = Future()
+        with self._lock:
+            if self._closed:
+                fut.set_exception(self._closed_error())
+                return fut
+            self._q.put((item, fut))
+        return fut
+
+    def __call__(self, item: X) -> Y:
+        return self.submit(item).result()
+
+    def close(self) -> None:
+        """Batch đang chạy vẫn trả kết quả; item chưa vào batch nhận RuntimeError."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._fail_pending()
+            self._q.put(None)
+
+    def _closed_error(self) -> RuntimeError:
+        return RuntimeError(f"{self._thread.name} is closed")
+
+    def _fail_pending(self) -> None:
+        while True:
+            try:
+                entry = self._q.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(self._closed_error())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+            }
+
+    def _collect(self, first: Tuple[X, Future]) -> Tuple[List[Tuple[X, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                nxt = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                return batch, True
+            batch.append(nxt)
+        return batch, False
+
+    def _loop(self) -> None:
+        stop = False
+        while not stop:
+            first = self._q.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+
+            # Caller đã hủy (timeout phía async) -> không tốn công encode cho nó
+            live = [(x, f) for x, f in batch if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                results = self.fn([x for x, _ in live])
+            except Exception as e:
+                logger.error("Batch of %d failed: %s", len(live), e)
+                for _, f in live:
+                    f.set_exception(e)
+                continue
+
+            for (_, f), r in zip(live, results):
+                f.set_result(r)
+            with self._lock:
+                self.batches += 1
+                self.items += len(live)
+                self.largest = max(self.largest, len(live))
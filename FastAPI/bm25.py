@@ -0,0 +1,111 @@
+"""
+BM25 dạng inverted index nén (CSR): mỗi token có một dải posting (doc, weight).
+
+Weight của posting đã gồm idf và chuẩn hóa độ dài, nên điểm một query chỉ là
+tổng weight của các token trong query -> cộng vector numpy, không lặp theo doc.
+Token = âm tiết đã bỏ dấu + bigram âm tiết ("nap", "tien", "nap_tien").
+"""
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from text_utils import normalize_text, strip_accents
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str, ngram: int = 2) -> List[str]:
+    words = _TOKEN_RE.findall(strip_accents(normalize_text(text)))
+    tokens = list(words)
+    if ngram >= 2:
+        tokens.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, docs: np.ndarray, weights: np.ndarray, n_docs: int):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        n = len(texts)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(n, dtype="float32")
+        for d, text in enumerate(texts):
+            toks = tokenize(text)
+            lengths[d] = len(toks)
+            for t in toks:
+                tf = postings.setdefault(t, {})
+                tf[d] = tf.get(d, 0) + 1
+
+        avgdl = float(lengths.mean()) if n and lengths.sum() > 0 else 1.0
+        vocab: Dict[str, int] = {}
+        indptr = [0]
+        docs: List[int] = []
+        weights: List[float] = []
+        for t in sorted(postings):
+            tf = postings[t]
+            idf = math.log(1.0 + (n - len(tf) + 0.5) / (len(tf) + 0.5))
+            vocab[t] = len(vocab)
+            for d in sorted(tf):
+                f = tf[d]
+                docs.append(d)
+                weights.append(idf * f * (k1 + 1) / (f + k1 * (1 - b + b * lengths[d] / avgdl)))
+            indptr.append(len(docs))
+
+        return cls(
+            vocab,
+            np.asarray(indptr, dtype="int64"),
+            np.asarray(docs, dtype="int32"),
+            np.asarray(weights, dtype="float32"),
+            n,
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(self.n_docs, dtype="float32")
+        for t in set(tokenize(query)):
+            tid = self.vocab.get(t)
+            if tid is None:
+                continue
+            s, e = self.indptr[tid], self.indptr[tid + 1]
+            # Doc trong một posting là duy nhất -> cộng trực tiếp được
+            out[self.docs[s:e]] += self.weights[s:e]
+        return out
+
+    def top_k(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        sc = self.scores(query)
+        if mask is not None:
+            sc[~mask] = 0.0
+        nz = np.flatnonzero(sc)
+        if len(nz) > k:
+            nz = nz[np.argpartition(-sc[nz], k - 1)[:k]]
+        order = nz[np.argsort(-sc[nz], kind="stable")]
+        return order, sc[order]
+
+    # ---------- (de)serialize: mảng thuần, lưu được bằng np.savez không cần pickle ----------
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        tokens = sorted(self.vocab, key=self.vocab.get)
+        return {
+            "bm25_tokens": np.array(tokens, dtype=str),
+            "bm25_indptr": self.indptr,
+            "bm25_docs": self.docs,
+            "bm25_weights": self.weights,
+            "bm25_n_docs": np.array([self.n_docs], dtype="int64"),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrs: Dict[str, np.ndarray]) -> "BM25Index":
+        tokens = arrs["bm25_tokens"].tolist()
+        return cls(
+            {t: i for i, t in enumerate(tokens)},
+            arrs["bm25_indptr"],
+            arrs["bm25_docs"],
+            arrs["bm25_weights"],
+            int(arrs["bm25_n_docs"][0]),
+        )
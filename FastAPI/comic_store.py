@@ -1,46 +1,482 @@
-import json
+import hashlib
+import logging
 import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from config import EMBEDDING_MODEL_NAME, FAISS_INDEX_PATH, METADATA_PATH, TOP_K_CANDIDATES
+from config import (
+    EMBEDDING_MODEL_NAME,
+    FAISS_INDEX_PATH,
+    METADATA_PATH,
+    METADATA_BIN_PATH,
+    LEXICAL_INDEX_PATH,
+    HYBRID_ENABLED,
+    HYBRID_RRF_K,
+    TOP_K_CANDIDATES,
+    EMBED_CACHE_SIZE,
+    EMBED_CACHE_TTL_S,
+    EMBED_CACHE_PATH,
+    INDEX_WATCH_INTERVAL_S,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    PASSAGE_ENABLED,
+    PASSAGE_INDEX_PATH,
+    PASSAGE_META_PATH,
+    PASSAGE_TOP_K,
+    PASSAGE_POOLING,
+    SIMILAR_ENABLED,
+    SIMILAR_TABLE_PATH,
+)
+from ann_index import describe_index, read_index
+from batcher import MicroBatcher
+from embed_cache import QueryEmbeddingCache
+from embedder import load_embedder
+from filters import NO_FILTER, FilterIndex, SearchFilter, parse_filters
+from lexical import LexicalIndex, rrf_fuse
+from metadata_store import MetadataStore, RESULT_FIELDS
+from metrics import span
+from passages import PassageIndex
+from similar import SimilarTable
+from text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(*paths: Any) -> str:
+    """Phiên bản index = hash (size, mtime) của các file; đổi khi index được build lại."""
+    parts = []
+    for p in paths:
+        st = os.stat(p)
+        parts.append(f"{p}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def metadata_path() -> Any:
+    """Ưu tiên file nhị phân; JSON cũ chỉ còn để tương thích."""
+    return METADATA_BIN_PATH if os.path.exists(METADATA_BIN_PATH) else METADATA_PATH
+
+
+def snapshot_paths() -> List[Any]:
+    """Các file tạo nên một snapshot; fingerprint tính trên tất cả."""
+    paths = [FAISS_INDEX_PATH, metadata_path()]
+    if HYBRID_ENABLED and os.path.exists(LEXICAL_INDEX_PATH):
+        paths.append(LEXICAL_INDEX_PATH)
+    if passages_available():
+        paths.extend([PASSAGE_INDEX_PATH, PASSAGE_META_PATH])
+    if SIMILAR_ENABLED and os.path.exists(SIMILAR_TABLE_PATH):
+        paths.append(SIMILAR_TABLE_PATH)
+    return paths
+
+
+def passages_available() -> bool:
+    return PASSAGE_ENABLED and os.path.exists(PASSAGE_INDEX_PATH) and os.path.exists(PASSAGE_META_PATH)
+
+
+def load_passages(meta: MetadataStore, expected_dim: int) -> Optional[PassageIndex]:
+    """Index passage là phần phụ: lỗi / lệch model thì bỏ qua, search vẫn chạy trên index comic."""
+    if not passages_available():
+        return None
+    try:
+        passages = PassageIndex.load(PASSAGE_INDEX_PATH, PASSAGE_META_PATH)
+        model = passages.header.get("embedding_model")
+        if model and model != EMBEDDING_MODEL_NAME:
+            raise ValueError(f"built with '{model}'")
+        if passages.index.d != expected_dim:
+            raise ValueError(f"dim {passages.index.d} != {expected_dim}")
+    except Exception as e:
+        logger.warning("Passage index ignored: %s", e)
+        return None
+    return passages.bind(meta.row_of_id)
+
+
+def load_similar() -> Optional[SimilarTable]:
+    """Bảng similar cũng là phần phụ: thiếu / lệch model thì /similar trả 404, search không ảnh hưởng.
+    Comic mới hơn bảng chỉ chưa có láng giềng; láng giềng đã bị xóa bị bỏ lúc lookup."""
+    if not SIMILAR_ENABLED or not os.path.exists(SIMILAR_TABLE_PATH):
+        return None
+    try:
+        table = SimilarTable.load(SIMILAR_TABLE_PATH)
+        model = table.header.get("embedding_model")
+        if model and model != EMBEDDING_MODEL_NAME:
+            raise ValueError(f"built with '{model}'")
+    except Exception as e:
+        logger.warning("Similar table ignored: %s", e)
+        return None
+    return table
+
+
+def load_lexical(meta: MetadataStore) -> Optional[LexicalIndex]:
+    if not HYBRID_ENABLED:
+        return None
+    if os.path.exists(LEXICAL_INDEX_PATH):
+        lex = LexicalIndex.load(LEXICAL_INDEX_PATH)
+        # Doc của BM25 phải trùng thứ tự dòng metadata (train script ghi cùng một danh sách)
+        if np.array_equal(lex.doc_ids, meta.comic_ids):
+            return lex
+        logger.warning("Lexical index out of sync with metadata, rebuilding in memory")
+    else:
+        logger.info("No lexical index at %s, building from metadata", LEXICAL_INDEX_PATH)
+    return LexicalIndex.build(meta.to_items())
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Index + metadata của cùng một lần build. Không bao giờ sửa tại chỗ, chỉ thay nguyên khối."""
+    index: faiss.Index
+    meta: MetadataStore
+    # Index build incremental dùng label = comicId; index cũ dùng label = số dòng
+    labels_are_ids: bool
+    version: str
+    lexical: Optional[LexicalIndex] = None
+    filters: Optional[FilterIndex] = None
+    passages: Optional[PassageIndex] = None
+    similar: Optional[SimilarTable] = None
+
+    @property
+    def count(self) -> int:
+        return len(self.meta)
+
+    def row(self, label: int) -> Optional[int]:
+        if self.labels_are_ids:
+            return self.meta.row_of_id(label)
+        return label if 0 <= label < self.count else None
+
+
+def load_snapshot(expected_dim: int) -> IndexSnapshot:
+    """Đọc + kiểm tra index/metadata trên đĩa; lỗi thì raise, snapshot đang chạy giữ nguyên."""
+    meta_path = metadata_path()
+    if not os.path.exists(FAISS_INDEX_PATH) or not os.path.exists(meta_path):
+        raise FileNotFoundError(
+            f"Missing index/metadata. Expected: {FAISS_INDEX_PATH} and {meta_path}"
+        )
+
+    # Lấy fingerprint trước khi đọc: nếu file đổi giữa chừng, lần reload sau sẽ thấy version khác
+    version = file_fingerprint(*snapshot_paths())
+    index = read_index(FAISS_INDEX_PATH)
+
+    if str(meta_path).endswith(".json"):
+        meta = MetadataStore.from_json(meta_path)
+    else:
+        meta = MetadataStore.open(meta_path)
+
+    model = meta.header.get("embedding_model")
+    if model and model != EMBEDDING_MODEL_NAME:
+        raise ValueError(f"Index built with '{model}', server uses '{EMBEDDING_MODEL_NAME}'")
+    if index.d != expected_dim:
+        raise ValueError(f"Index dim {index.d} != embedder dim {expected_dim}")
+    if index.ntotal != len(meta):
+        raise ValueError(f"Index has {index.ntotal} vectors but metadata has {len(meta)} items")
+
+    labels_are_ids = meta.header.get("id_mode") == "comicId"
+    if labels_are_ids and len(np.unique(meta.comic_ids)) != len(meta):
+        raise ValueError("Duplicate comicId in metadata")
+
+    return IndexSnapshot(
+        index=index,
+        meta=meta,
+        labels_are_ids=labels_are_ids,
+        version=version,
+        lexical=load_lexical(meta),
+        filters=FilterIndex(meta, labels_are_ids),
+        passages=load_passages(meta, expected_dim),
+        similar=load_similar(),
+    )
 
 
 class ComicStore:
     def __init__(self):
-        if not os.path.exists(FAISS_INDEX_PATH) or not os.path.exists(METADATA_PATH):
-            raise FileNotFoundError(
-                f"Missing index/metadata. Expected: {FAISS_INDEX_PATH} and {METADATA_PATH}"
+        self.embedder = load_embedder()
+        self.dim = self.embedder.dim
+
+        self._snap = load_snapshot(self.dim)
+        self._reload_lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+        self.query_cache = QueryEmbeddingCache(
+            EMBED_CACHE_SIZE, EMBED_CACHE_TTL_S, EMBED_CACHE_PATH, tag=self.embedder.tag
+        )
+        self.query_cache.load()
+
+        # Request đồng thời gom thành một lần encode / một lần index.search
+        self.encode_batcher: Optional[MicroBatcher] = None
+        self.search_batcher: Optional[MicroBatcher] = None
+        if BATCH_MAX_WAIT_MS > 0 and BATCH_MAX_SIZE > 1:
+            self.encode_batcher = MicroBatcher(self._encode_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, "encode-batcher")
+            self.search_batcher = MicroBatcher(self._search_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, "search-batcher")
+
+    # Đọc qua snapshot hiện tại; code cần nhiều field nhất quán thì lấy self.snapshot một lần
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        return self._snap
+
+    @property
+    def index(self) -> faiss.Index:
+        return self._snap.index
+
+    @property
+    def meta(self) -> MetadataStore:
+        return self._snap.meta
+
+    @property
+    def count(self) -> int:
+        return self._snap.count
+
+    @property
+    def version(self) -> str:
+        return self._snap.version
+
+    @property
+    def batching(self) -> bool:
+        return self.search_batcher is not None
+
+    def batch_stats(self) -> Dict[str, Any]:
+        if not self.batching:
+            return {"enabled": False}
+        return {"enabled": True, "encode": self.encode_batcher.stats(), "search": self.search_batcher.stats()}
+
+    def close(self) -> None:
+        self.stop_watcher()
+        if self.batching:
+            self.encode_batcher.close()
+            self.search_batcher.close()
+        self.query_cache.save()
+
+    # ---------- Hot reload ----------
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Load index/metadata mới ở thread hiện tại rồi đổi tham chiếu.
+        Request đang chạy vẫn giữ snapshot cũ đến khi xong.
+        """
+        with self._reload_lock:
+            old = self._snap
+            if not force and file_fingerprint(*snapshot_paths()) == old.version:
+                return {"reloaded": False, "version": old.version, "count": old.count}
+
+            new = load_snapshot(self.dim)
+            self._snap = new
+            logger.info(
+                "Index hot-swapped %s -> %s (%d items, %s)",
+                old.version, new.version, new.count, describe_index(new.index),
             )
+            return {"reloaded": True, "version": new.version, "previous": old.version, "count": new.count}
+
+    def start_watcher(self, interval_s: float = INDEX_WATCH_INTERVAL_S) -> None:
+        """Poll fingerprint; chỉ reload khi file đã đổi và đứng yên qua hai lần poll liên tiếp."""
+        if interval_s <= 0 or self._watcher is not None:
+            return
+
+        def _loop():
+            pending: Optional[str] = None
+            while not self._watch_stop.wait(interval_s):
+                try:
+                    current = file_fingerprint(*snapshot_paths())
+                except OSError:
+                    continue
+                if current == self._snap.version:
+                    pending = None
+                elif current != pending:
+                    pending = current
+                else:
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        logger.error("Index reload failed, keeping %s: %s", self._snap.version, e)
+                    pending = None
+
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=_loop, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._watch_stop.set()
+        self._watcher = None
+
+    # ---------- Embedding ----------
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Vector (n, dim) float32 đã L2-normalize."""
+        vecs = np.ascontiguousarray(self.embedder.encode(texts), dtype="float32")
+        faiss.normalize_L2(vecs)
+        return vecs
 
-        self.embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        self.index = faiss.read_index(str(FAISS_INDEX_PATH))
+    def warmup(self) -> Dict[str, float]:
+        """Encode + search một lần (bỏ qua cache) để JIT/allocator nóng trước request thật."""
+        t0 = time.perf_counter()
+        vec = self.encode_texts(["truyện tranh hành động phiêu lưu"])
+        t1 = time.perf_counter()
+        self._snap.index.search(vec, TOP_K_CANDIDATES)
+        t2 = time.perf_counter()
+        return {"encode_ms": round((t1 - t0) * 1000, 2), "search_ms": round((t2 - t1) * 1000, 2)}
 
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            meta = json.load(f)
+    def _encode_batch(self, keys: List[str]) -> List[np.ndarray]:
+        with span("embed"):
+            vecs = self.encode_texts(keys)
+        for key, vec in zip(keys, vecs):
+            self.query_cache.put(key, vec)
+        return [vec.reshape(1, -1) for vec in vecs]
 
-        self.items: List[Dict[str, Any]] = meta.get("items", [])
-        self.count = len(self.items)
+    def submit_encode(self, query: str) -> "Future[np.ndarray]":
+        """Như encode_query nhưng trả Future; cache hit thì Future đã xong sẵn."""
+        key = normalize_text(query)
+        vec = self.query_cache.get(key)
+        if vec is not None or self.encode_batcher is None:
+            fut: "Future[np.ndarray]" = Future()
+            try:
+                fut.set_result(vec.reshape(1, -1) if vec is not None else self._encode_batch([key])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        return self.encode_batcher.submit(key)
 
-    def search(self, query: str, top_k: int = TOP_K_CANDIDATES) -> Tuple[List[Dict[str, Any]], List[float]]:
+    def encode_query(self, query: str) -> np.ndarray:
+        """Vector (1, dim) của query; key cache là chuỗi đã chuẩn hóa và cũng là chuỗi được encode."""
+        return self.submit_encode(query).result()
+
+    # ---------- Search ----------
+    def search_many(
+        self, queries: List[str], top_k: int = TOP_K_CANDIDATES, filters: SearchFilter = NO_FILTER
+    ) -> List[Tuple[List[Dict[str, Any]], List[float]]]:
+        """
+        Encode các query chưa có trong cache bằng một lần gọi model, rồi một lần index.search.
+        `filters` áp cho cả batch, lọc ngay trong FAISS qua IDSelector.
+        """
+        out: List[Tuple[List[Dict[str, Any]], List[float]]] = [([], []) for _ in queries]
+        keys = [normalize_text(q or "") for q in queries]
+        rows = [i for i, k in enumerate(keys) if k]
+        if not rows:
+            return out
+
+        vecs: Dict[str, np.ndarray] = {}
+        for i in rows:
+            if keys[i] not in vecs:
+                cached = self.query_cache.get(keys[i])
+                if cached is not None:
+                    vecs[keys[i]] = cached
+        missing = list(dict.fromkeys(keys[i] for i in rows if keys[i] not in vecs))
+        if missing:
+            for key, vec in zip(missing, self._encode_batch(missing)):
+                vecs[key] = vec[0]
+
+        q_mat = np.ascontiguousarray(np.stack([vecs[keys[i]] for i in rows]), dtype="float32")
+        snap = self._snap
+        mask: Optional[np.ndarray] = None
+        with span("faiss"):
+            if filters.is_empty:
+                D, I = snap.index.search(q_mat, top_k)
+            else:
+                mask, params = snap.filters.params(snap.index, filters)
+                D, I = snap.index.search(q_mat, top_k, params=params)
+        if snap.passages is not None:
+            with span("passage_search"):
+                PD, PI = snap.passages.search(q_mat, PASSAGE_TOP_K, mask)
+
+        with span("fuse"):
+            for n, (i, scores_row, labels_row) in enumerate(zip(rows, D.tolist(), I.tolist())):
+                dense: List[Tuple[int, float]] = []
+                for score, label in zip(scores_row, labels_row):
+                    idx = snap.row(label)
+                    if idx is not None:
+                        dense.append((idx, float(score)))
+
+                passage_rows: Optional[List[int]] = None
+                if snap.passages is not None:
+                    pooled = snap.passages.pool(PD[n].tolist(), PI[n].tolist(), PASSAGE_POOLING)
+                    passage_rows = [row for row, _ in pooled[:top_k]]
+
+                if snap.lexical is None and passage_rows is None:
+                    ranked = [(idx, score, False) for idx, score in dense]
+                else:
+                    ranked = self._fuse(snap, queries[i], dense, top_k, mask, passage_rows)
+
+                candidates: List[Dict[str, Any]] = []
+                scores: List[float] = []
+                for idx, score, exact in ranked:
+                    # Chỉ decode field cần cho response, không kéo description lên RAM
+                    rec = snap.meta.record(idx, RESULT_FIELDS)
+                    if exact:
+                        rec["match"] = "exact"
+                    candidates.append(rec)
+                    scores.append(score)
+                out[i] = (candidates, scores)
+        return out
+
+    @staticmethod
+    def _fuse(
+        snap: IndexSnapshot,
+        query: str,
+        dense: List[Tuple[int, float]],
+        top_k: int,
+        mask: Optional[np.ndarray],
+        passage_rows: Optional[List[int]] = None,
+    ) -> List[Tuple[int, float, bool]]:
+        """
+        RRF giữa các thứ hạng theo số dòng metadata: FAISS comic, BM25, passage đã pooling.
+        Trùng tên chính xác luôn đứng đầu.
+        """
+        rankings = [[idx for idx, _ in dense]]
+        exact: List[int] = []
+        lex = snap.lexical
+        if lex is not None:
+            sparse, _ = lex.search(query, top_k, mask)
+            rankings.append(sparse.tolist())
+            exact = [
+                r for r in (snap.meta.row_of_id(cid) for cid in lex.exact_ids(query))
+                if r is not None and (mask is None or mask[r])
+            ]
+        if passage_rows is not None:
+            rankings.append(passage_rows)
+
+        fused = rrf_fuse(rankings, k=HYBRID_RRF_K)
+        exact_set = set(exact)
+        top = len(rankings) / (HYBRID_RRF_K + 1)
+        order = exact + sorted((r for r in fused if r not in exact_set), key=lambda r: -fused[r])
+        return [(r, fused.get(r, 0.0) if r not in exact_set else top, r in exact_set) for r in order[:top_k]]
+
+    def _search_batch(self, queries: List[str]) -> List[Tuple[List[Dict[str, Any]], List[float]]]:
+        return self.search_many(queries, TOP_K_CANDIDATES)
+
+    def submit_search(self, query: str) -> "Future[Tuple[List[Dict[str, Any]], List[float]]]":
+        """Search top-K mặc định qua micro-batcher (chỉ dùng khi self.batching)."""
+        return self.search_batcher.submit(query)
+
+    def search(
+        self, query: str, top_k: int = TOP_K_CANDIDATES, filters: SearchFilter = NO_FILTER
+    ) -> Tuple[List[Dict[str, Any]], List[float]]:
         q = (query or "").strip()
         if not q:
             return [], []
+        if self.batching and top_k == TOP_K_CANDIDATES and filters.is_empty:
+            return self.submit_search(q).result()
+        return self.search_many([q], top_k, filters)[0]
 
-        q_vec = self.embedder.encode([q], convert_to_numpy=True).astype("float32")
-        faiss.normalize_L2(q_vec)
-
-        D, I = self.index.search(q_vec, top_k)
-
-        candidates: List[Dict[str, Any]] = []
-        scores: List[float] = []
+    def similar(
+        self, comic_id: int, limit: int, filters: SearchFilter = NO_FILTER
+    ) -> Optional[Tuple[List[Dict[str, Any]], List[float]]]:
+        """Comic tương tự từ bảng tính sẵn (không encode / FAISS); None nếu comic không có trong bảng."""
+        snap = self._snap
+        if snap.similar is None:
+            return None
+        mask = None if filters.is_empty else snap.filters.selector(filters)[0]
+        hits = snap.similar.lookup(comic_id, limit, snap.meta.row_of_id, mask)
+        if hits is None:
+            return None
+        return [snap.meta.record(row, RESULT_FIELDS) for row, _ in hits], [score for _, score in hits]
 
-        for score, idx in zip(D[0].tolist(), I[0].tolist()):
-            if 0 <= idx < self.count:
-                candidates.append(self.items[idx])
-                scores.append(float(score))
+    def has_exact_name(self, query: str) -> bool:
+        lex = self._snap.lexical
+        return lex is not None and bool(lex.exact_ids(query))
 
-        return candidates, scores
+    def parse_filters(self, message: str) -> SearchFilter:
+        """Filter genre / status / số chương trong câu user, genre theo catalogue của snapshot hiện tại.
+        Câu trùng đúng tên truyện ("Ẩn Long Đô Thị") không lọc: từ khóa filter là một phần của tên."""
+        snap = self._snap
+        flt = parse_filters(message, snap.filters.genres)
+        if not flt.is_empty and snap.lexical is not None and snap.lexical.exact_ids(message):
+            return NO_FILTER
+        return flt
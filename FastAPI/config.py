@@ -10,6 +10,8 @@ DATA_DIR = Path(os.getenv("DATA_DIR", str(BASE_DIR / "data")))
 
 FAISS_INDEX_PATH = Path(os.getenv("FAISS_INDEX_PATH", str(STORAGE_DIR / "comic_faiss.index")))
 METADATA_PATH = Path(os.getenv("METADATA_PATH", str(STORAGE_DIR / "comic_faiss_metadata.json")))
+METADATA_BIN_PATH = Path(os.getenv("METADATA_BIN_PATH", str(STORAGE_DIR / "comic_faiss_metadata.bin")))
+LEXICAL_INDEX_PATH = Path(os.getenv("LEXICAL_INDEX_PATH", str(STORAGE_DIR / "comic_lexical.npz")))
 
 FAQ_JSON_PATH = Path(os.getenv("FAQ_JSON_PATH", str(DATA_DIR / "faq.json")))
 
@@ -22,11 +24,162 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL_NAME = os.getenv("GROQ_MODEL_NAME", "llama-3.1-8b-instant")
+# LLM giả local (llm_stub.py) thay Groq: benchmark / CI không cần mạng, tất định theo prompt
+LLM_STUB = os.getenv("LLM_STUB", "0") == "1"
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "300"))
+LLM_STUB_TOKENS_PER_S = float(os.getenv("LLM_STUB_TOKENS_PER_S", "250"))
+
+# Lớp provider LLM (llm_client.py): thứ tự failover, hedge theo p95, circuit breaker, pool HTTP
+LLM_PROVIDERS = [p.strip() for p in os.getenv("LLM_PROVIDERS", "groq,gemini").split(",") if p.strip()]
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+# Gemini 2.5 mặc định "thinking" (chậm, tốn token); -1 = để mặc định của model
+GEMINI_THINKING_BUDGET = int(os.getenv("GEMINI_THINKING_BUDGET", "0"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "1500"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "200"))
+LLM_HEDGE_MAX_MS = float(os.getenv("LLM_HEDGE_MAX_MS", "4000"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_S = float(os.getenv("LLM_HTTP_KEEPALIVE_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "2.0"))
 
 TOP_K_CANDIDATES = int(os.getenv("TOP_K_CANDIDATES", "10"))
 TOP_N_FINAL = int(os.getenv("TOP_N_FINAL", "3"))
 
 FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", "1"))
 FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "2.0"))
+# Trọng số BM25 (title/content) cộng thêm vào điểm keyword của FAQ; 0 = chỉ dùng keyword
+FAQ_BM25_WEIGHT = float(os.getenv("FAQ_BM25_WEIGHT", "1.5"))
+# Cache câu FAQ do LLM viết lại theo persona (LRU + TTL)
+FAQ_REPLY_CACHE_SIZE = int(os.getenv("FAQ_REPLY_CACHE_SIZE", "512"))
+FAQ_REPLY_CACHE_TTL_S = float(os.getenv("FAQ_REPLY_CACHE_TTL_S", "86400"))
 
 SOCIAL_SKIP_GEMINI = os.getenv("SOCIAL_SKIP_GEMINI", "1") == "1"
+
+# Async pipeline: executor giới hạn cho encode/FAISS và timeout từng stage (giây)
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "2"))
+INTENT_TIMEOUT_S = float(os.getenv("INTENT_TIMEOUT_S", "3.0"))
+SEARCH_TIMEOUT_S = float(os.getenv("SEARCH_TIMEOUT_S", "2.0"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "8.0"))
+
+# Chạy embedding/FAISS + FAQ song song với classify_intent, bỏ nhánh không dùng
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+
+# Intent classifier cục bộ (pattern + nearest-centroid), chỉ gọi LLM khi không chắc
+LOCAL_INTENT_ENABLED = os.getenv("LOCAL_INTENT_ENABLED", "1") == "1"
+INTENT_SEEDS_PATH = Path(os.getenv("INTENT_SEEDS_PATH", str(DATA_DIR / "intent_seeds.json")))
+INTENT_CENTROID_MIN_SIM = float(os.getenv("INTENT_CENTROID_MIN_SIM", "0.45"))
+INTENT_CENTROID_MARGIN = float(os.getenv("INTENT_CENTROID_MARGIN", "0.06"))
+
+# Cache embedding của query (LRU + TTL). EMBED_CACHE_PATH rỗng = không spill ra đĩa
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL_S = float(os.getenv("EMBED_CACHE_TTL_S", "86400"))
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH")) if os.getenv("EMBED_CACHE_PATH") else None
+
+# Cache câu trả lời /chat theo persona + embedding query (cosine >= RESPONSE_CACHE_MIN_SIM)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "1800"))
+RESPONSE_CACHE_MIN_SIM = float(os.getenv("RESPONSE_CACHE_MIN_SIM", "0.95"))
+RESPONSE_CACHE_HISTORY_TURNS = int(os.getenv("RESPONSE_CACHE_HISTORY_TURNS", "2"))
+
+# Gộp các request /chat giống hệt nhau (message chuẩn hóa + persona + history) đang chạy cùng lúc
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+
+# Admission control /chat, /chat/stream (mỗi worker): quá ADMISSION_MAX_INFLIGHT request thì xếp hàng.
+# Hàng đầy (ADMISSION_MAX_QUEUE) -> 429 ngay; chờ quá ADMISSION_QUEUE_TIMEOUT_MS -> 503
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "1"))
+# Chế độ degraded (không gọi LLM: search top kết quả, FAQ trả nguyên content) khi vượt một trong các ngưỡng
+DEGRADE_INFLIGHT = int(os.getenv("DEGRADE_INFLIGHT", "48"))
+DEGRADE_QUEUE_WAIT_MS = float(os.getenv("DEGRADE_QUEUE_WAIT_MS", "500"))
+DEGRADE_LLM_ERROR_RATE = float(os.getenv("DEGRADE_LLM_ERROR_RATE", "0.5"))
+DEGRADE_LLM_WINDOW_S = float(os.getenv("DEGRADE_LLM_WINDOW_S", "30"))
+DEGRADE_LLM_MIN_SAMPLES = int(os.getenv("DEGRADE_LLM_MIN_SAMPLES", "10"))
+# Lỗi LLM vượt ngưỡng -> giữ degraded ít nhất ngần này giây rồi mới thử LLM lại
+DEGRADE_HOLD_S = float(os.getenv("DEGRADE_HOLD_S", "15"))
+
+# History client gửi lên: giữ tối đa HISTORY_MAX_TURNS lượt, mỗi lượt HISTORY_TURN_MAX_CHARS ký tự (prompts.clean_history)
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "10"))
+HISTORY_TURN_MAX_CHARS = int(os.getenv("HISTORY_TURN_MAX_CHARS", "800"))
+# Ngân sách token (ước lượng) cho prompt của từng loại gọi LLM; lượt history cũ bị bỏ trước
+PROMPT_BUDGET_INTENT = int(os.getenv("PROMPT_BUDGET_INTENT", "400"))
+PROMPT_BUDGET_SOCIAL = int(os.getenv("PROMPT_BUDGET_SOCIAL", "900"))
+PROMPT_BUDGET_SEARCH = int(os.getenv("PROMPT_BUDGET_SEARCH", "1200"))
+PROMPT_BUDGET_FAQ = int(os.getenv("PROMPT_BUDGET_FAQ", "700"))
+PROMPT_MIN_CANDIDATES = int(os.getenv("PROMPT_MIN_CANDIDATES", "3"))
+# Token tối đa cho dòng tóm tắt các lượt history bị bỏ
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "60"))
+
+# Loại ANN index: flat | ivf_flat | hnsw | ivf_pq (train + tham số lúc query)
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "48"))
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Hot-reload index: poll file mỗi N giây (0 = tắt), /admin/reload cần header X-Admin-Token
+INDEX_WATCH_INTERVAL_S = float(os.getenv("INDEX_WATCH_INTERVAL_S", "0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Backend embedding: torch | onnx (ONNX Runtime, model export bằng scripts/export_onnx_embedder.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_PATH = Path(os.getenv("ONNX_MODEL_PATH", str(STORAGE_DIR / "embedder" / "model.int8.onnx")))
+EMBED_MAX_SEQ_LEN = int(os.getenv("EMBED_MAX_SEQ_LEN", "128"))
+
+# Micro-batching encode/FAISS cho các request đồng thời. BATCH_MAX_WAIT_MS = 0 -> tắt
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "3"))
+# /search/batch cho job offline
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "256"))
+SEARCH_BATCH_TIMEOUT_S = float(os.getenv("SEARCH_BATCH_TIMEOUT_S", "30.0"))
+
+# Hybrid retrieval: BM25 (title/alternateNames/slug/genre) + FAISS trộn bằng reciprocal rank fusion
+HYBRID_ENABLED = os.getenv("HYBRID_ENABLED", "1") == "1"
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Query trùng đúng tên truyện (title / tên khác) -> trả luôn, không gọi LLM re-rank
+EXACT_MATCH_SKIP_LLM = os.getenv("EXACT_MATCH_SKIP_LLM", "1") == "1"
+
+# Index passage (cửa sổ description + tên chương) -> điểm comic bằng max/sum pooling.
+# Chỉ dùng khi file tồn tại (build bằng scripts/train_comic_faiss.py --passages)
+PASSAGE_ENABLED = os.getenv("PASSAGE_ENABLED", "1") == "1"
+PASSAGE_INDEX_PATH = Path(os.getenv("PASSAGE_INDEX_PATH", str(STORAGE_DIR / "comic_passages.index")))
+PASSAGE_META_PATH = Path(os.getenv("PASSAGE_META_PATH", str(STORAGE_DIR / "comic_passages.npz")))
+PASSAGE_TOP_K = int(os.getenv("PASSAGE_TOP_K", "50"))
+PASSAGE_POOLING = os.getenv("PASSAGE_POOLING", "max")  # max | sum
+# auto: flat nếu vừa ngân sách bộ nhớ, không thì ivf_pq với PQ_M lớn nhất còn vừa
+PASSAGE_INDEX_TYPE = os.getenv("PASSAGE_INDEX_TYPE", "auto")
+PASSAGE_MEMORY_BUDGET_MB = float(os.getenv("PASSAGE_MEMORY_BUDGET_MB", "256"))
+
+# Bảng "truyện tương tự" tính trước (similar.py): top-N comic gần nhất cho /similar/{comicId}.
+# Build cùng index bằng scripts/train_comic_faiss.py; SIMILAR_TOP_N là số láng giềng lưu mỗi comic
+SIMILAR_ENABLED = os.getenv("SIMILAR_ENABLED", "1") == "1"
+SIMILAR_TABLE_PATH = Path(os.getenv("SIMILAR_TABLE_PATH", str(STORAGE_DIR / "comic_similar.npz")))
+SIMILAR_TOP_N = int(os.getenv("SIMILAR_TOP_N", "50"))
+SIMILAR_DEFAULT_LIMIT = int(os.getenv("SIMILAR_DEFAULT_LIMIT", "10"))
+
+# /metrics (Prometheus) luôn bật; header Server-Timing (thời gian từng bước) chỉ bật khi cần soi từ trình duyệt
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "0") == "1"
+
+# Nhiều worker: STORE_MODE=remote -> worker gọi store_service.py (một process giữ model + index) qua Unix socket
+STORE_MODE = os.getenv("STORE_MODE", "local")  # local | remote
+STORE_SERVICE_SOCKET = Path(os.getenv("STORE_SERVICE_SOCKET", str(STORAGE_DIR / "comic_store.sock")))
+# Service unpickle mọi thứ nhận qua socket -> không có key mặc định. Không đặt env thì service sinh key
+# ngẫu nhiên vào STORE_SERVICE_KEY_FILE (quyền 0600), worker cùng user đọc lại file đó
+STORE_SERVICE_AUTHKEY = os.getenv("STORE_SERVICE_AUTHKEY", "").encode("utf-8")
+STORE_SERVICE_KEY_FILE = Path(os.getenv("STORE_SERVICE_KEY_FILE", str(STORAGE_DIR / "comic_store.key")))
+STORE_VERSION_TTL_S = float(os.getenv("STORE_VERSION_TTL_S", "1.0"))
+# Đọc index FAISS bằng mmap (read-only): các process cùng đọc một file dùng chung page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
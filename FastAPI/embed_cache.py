@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Cache LRU + TTL dùng chung: key -> value bất kỳ. Thread-safe.
+    max_entries=0 tắt cache, ttl_s<=0 không hết hạn.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions_lru = 0
+        self.evictions_ttl = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expiry(self) -> float:
+        return time.monotonic() + self.ttl_s if self.ttl_s > 0 else float("inf")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.evictions_ttl += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self._expiry() if expires_at is None else expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions_lru += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions_lru": self.evictions_lru,
+            "evictions_ttl": self.evictions_ttl,
+        }
+
+
+class QueryEmbeddingCache(TTLCache):
+    """
+    Cache LRU + TTL: query đã chuẩn hóa -> vector float32 đã L2-normalize.
+    Thread-safe vì encode chạy trong executor của RAGBot.
+    File spill ghi kèm `tag` của encoder (model, backend, dim); load bỏ file khác tag,
+    tránh dùng vector của encoder cũ sau khi đổi model / backend.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_s: float,
+        spill_path: Optional[Path] = None,
+        tag: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(max_entries, ttl_s)
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.tag = dict(tag or {})
+
+    def put(self, key: str, vec: np.ndarray, expires_at: Optional[float] = None) -> None:
+        if self.max_entries == 0:
+            return
+        vec = np.asarray(vec, dtype="float32").reshape(-1)
+        vec.setflags(write=False)
+        super().put(key, vec, expires_at)
+
+    # ---------- On-disk spill ----------
+    def save(self) -> None:
+        """Ghi các entry còn hạn ra .npz (ghi file tạm rồi os.replace)."""
+        if not self.spill_path:
+            return
+        now_mono, now_wall = time.monotonic(), time.time()
+        with self._lock:
+            live = [(k, v, exp) for k, (v, exp) in self._data.items() if exp > now_mono]
+        if not live:
+            return
+
+        keys = np.array([k for k, _, _ in live], dtype=str)
+        vecs = np.vstack([v for _, v, _ in live]).astype("float32")
+        # Lưu hạn dùng theo wall-clock để còn ý nghĩa sau khi restart
+        expires = np.array(
+            [now_wall + (exp - now_mono) if exp != float("inf") else np.inf for _, _, exp in live],
+            dtype="float64",
+        )
+
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.spill_path.with_suffix(self.spill_path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=keys, vecs=vecs, expires=expires, tag=np.array(json.dumps(self.tag, sort_keys=True)))
+        os.replace(tmp, self.spill_path)
+        logger.info("Embedding cache spilled %d entries to %s", len(live), self.spill_path)
+
+    def load(self) -> int:
+        if not self.spill_path or not self.spill_path.exists():
+            return 0
+        try:
+            with np.load(self.spill_path, allow_pickle=False) as data:
+                keys, vecs, expires = data["keys"], data["vecs"], data["expires"]
+                tag = json.loads(str(data["tag"])) if "tag" in data.files else None
+        except Exception as e:
+            logger.warning("Cannot load embedding cache %s: %s", self.spill_path, e)
+            return 0
+        if tag != self.tag:
+            logger.warning(
+                "Embedding cache %s was written by another encoder (%s, now %s), discarded",
+                self.spill_path, tag, self.tag,
+            )
+            return 0
+
+        now_mono, now_wall = time.monotonic(), time.time()
+        loaded = 0
+        # Thứ tự trong file là LRU -> MRU, put lại theo đúng thứ tự
+        for key, vec, exp in zip(keys.tolist(), vecs, expires.tolist()):
+            if exp <= now_wall:
+                continue
+            self.put(key, vec, expires_at=now_mono + (exp - now_wall) if exp != float("inf") else exp)
+            loaded += 1
+        logger.info("Embedding cache warmed with %d entries from %s", loaded, self.spill_path)
+        return loaded
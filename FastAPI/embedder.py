@@ -0,0 +1,83 @@
+"""
+Backend encode câu cho ComicStore.
+
+- torch: SentenceTransformer (mặc định, giống lúc build index)
+- onnx:  ONNX Runtime + tokenizer HF, mean pooling; file model do
+         scripts/export_onnx_embedder.py tạo ra (có bản int8 quantized)
+
+Cả hai trả về vector float32 chưa normalize; ComicStore tự normalize.
+"""
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_PATH,
+    EMBED_MAX_SEQ_LEN,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TorchEmbedder:
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        # Định danh encoder: vector chỉ dùng lại được (cache spill) khi tag trùng
+        self.tag = {"embedding_model": model_name, "backend": "torch", "dim": self.dim}
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True).astype("float32")
+
+
+class OnnxEmbedder:
+    def __init__(self, model_path=ONNX_MODEL_PATH, model_name: str = EMBEDDING_MODEL_NAME):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.dim = int(self.session.get_outputs()[0].shape[-1])
+        # File ONNX nằm trong tag: bản fp32 và int8 cho vector khác nhau
+        self.tag = {
+            "embedding_model": model_name,
+            "backend": "onnx",
+            "onnx_model": Path(model_path).name,
+            "dim": self.dim,
+        }
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=EMBED_MAX_SEQ_LEN,
+            return_tensors="np",
+        )
+        feeds = {k: v.astype("int64") for k, v in enc.items() if k in self._input_names}
+        token_emb = self.session.run(None, feeds)[0]
+
+        # Mean pooling theo attention mask (giống cấu hình pooling của model gốc)
+        mask = enc["attention_mask"][..., None].astype("float32")
+        summed = (token_emb * mask).sum(axis=1)
+        return (summed / np.clip(mask.sum(axis=1), 1e-9, None)).astype("float32")
+
+
+def load_embedder(backend: str = EMBEDDING_BACKEND):
+    backend = (backend or "torch").lower()
+    if backend == "onnx":
+        logger.info("Embedding backend: onnx (%s)", ONNX_MODEL_PATH)
+        return OnnxEmbedder()
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected torch | onnx")
+    logger.info("Embedding backend: torch (%s)", EMBEDDING_MODEL_NAME)
+    return TorchEmbedder()
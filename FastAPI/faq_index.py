@@ -0,0 +1,138 @@
+"""
+Index FAQ dựng một lần lúc load: chấm điểm mọi FAQ trong một lượt quét query.
+
+- Keyword: automaton Aho–Corasick trên keyword đã chuẩn hóa, hai bản:
+    * có dấu: khớp chuỗi con như cách so `kw in query` trước đây
+    * bỏ dấu: cho user gõ không dấu; chỉ tính khi đoạn khớp trong query gốc
+      cũng không dấu và nằm trọn trong từ ("ví" không khớp "vì sao")
+  Mỗi keyword khớp: +FAQ_KEYWORD_SCORE.
+- BM25 trên title + content (bỏ dấu): chuẩn hóa về [0, 1] theo FAQ cao nhất,
+  nhân FAQ_BM25_WEIGHT. Mặc định 1.5 < FAQ_MIN_SCORE nên BM25 một mình không
+  đủ ngưỡng, chỉ để xếp hạng giữa các FAQ cùng khớp keyword.
+"""
+from collections import deque
+from typing import Any, Dict, Iterator, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from bm25 import BM25Index
+from text_utils import fold_chars, normalize_text
+
+FAQ_KEYWORD_SCORE = 3.0
+
+
+class AhoCorasick:
+    """Automaton nhiều pattern; `iter_matches` trả (start, end, pattern_id) trên một lần duyệt text."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for pid, p in enumerate(self.patterns):
+            node = 0
+            for ch in p:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pid)
+
+        # BFS dựng fail link; output của node gộp luôn output của fail để khỏi đi ngược lúc match
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield i + 1 - len(self.patterns[pid]), i + 1, pid
+
+
+def _is_word_span(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class FaqIndex:
+    def __init__(self, faqs: Sequence[Dict[str, Any]], bm25_weight: float = 1.5):
+        self.faqs = list(faqs)
+        self.bm25_weight = bm25_weight
+
+        # keyword -> các (faq, số thứ tự keyword trong FAQ) dùng nó
+        exact: Dict[str, List[Tuple[int, int]]] = {}
+        folded: Dict[str, List[Tuple[int, int]]] = {}
+        for fi, faq in enumerate(self.faqs):
+            for ki, kw in enumerate(faq.get("keywords") or []):
+                norm = normalize_text(str(kw or ""))
+                if not norm:
+                    continue
+                exact.setdefault(norm, []).append((fi, ki))
+                folded.setdefault(fold_chars(norm), []).append((fi, ki))
+
+        self._exact_kw = list(exact)
+        self._exact_owners = [exact[k] for k in self._exact_kw]
+        self._exact_ac = AhoCorasick(self._exact_kw)
+        self._folded_kw = list(folded)
+        self._folded_owners = [folded[k] for k in self._folded_kw]
+        self._folded_ac = AhoCorasick(self._folded_kw)
+
+        self._bm25 = BM25Index.build(
+            [f'{f.get("title") or ""} {f.get("title") or ""} {f.get("content") or ""}' for f in self.faqs]
+        )
+
+    def __len__(self) -> int:
+        return len(self.faqs)
+
+    def keyword_hits(self, query: str) -> Dict[int, int]:
+        """Số keyword khác nhau của mỗi FAQ xuất hiện trong query."""
+        q = normalize_text(query)
+        qf = fold_chars(q)
+        seen: Set[Tuple[int, int]] = set()
+
+        for _, _, pid in self._exact_ac.iter_matches(q):
+            seen.update(self._exact_owners[pid])
+        for start, end, pid in self._folded_ac.iter_matches(qf):
+            # Đoạn gõ không dấu và đứng thành từ riêng mới tính
+            if q[start:end] == qf[start:end] and _is_word_span(qf, start, end):
+                seen.update(self._folded_owners[pid])
+
+        hits: Dict[int, int] = {}
+        for fi, _ in seen:
+            hits[fi] = hits.get(fi, 0) + 1
+        return hits
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self.faqs), dtype="float32")
+        if not self.faqs or not (query or "").strip():
+            return out
+        for fi, n in self.keyword_hits(query).items():
+            out[fi] += FAQ_KEYWORD_SCORE * n
+        if self.bm25_weight > 0:
+            bm = self._bm25.scores(query)
+            top = float(bm.max())
+            if top > 0:
+                out += self.bm25_weight * (bm / top)
+        return out
+
+    def search(self, query: str, top_k: int, min_score: float) -> List[Dict[str, Any]]:
+        sc = self.scores(query)
+        order = np.argsort(-sc, kind="stable")[:top_k]
+        return [{**self.faqs[i], "score": float(sc[i])} for i in order if sc[i] > 0 and sc[i] >= min_score]
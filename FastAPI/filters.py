@@ -0,0 +1,224 @@
+"""
+Lọc theo genre / status / số chương, đẩy xuống FAISS bằng IDSelectorBitmap.
+
+- SearchFilter: điều kiện (bất biến, dùng làm key cache).
+- FilterIndex: mask theo genre / status dựng sẵn cho từng snapshot; mỗi filter
+  -> bitmap trên label của index (comicId hoặc số dòng) -> IDSelector, nên
+  search có filter vẫn trả đủ top-k mà không phải lấy dư rồi lọc.
+- parse_filters: tách filter từ câu tiếng Việt ("truyện kinh dị đã hoàn thành",
+  "truyện ngắn romance", "trên 100 chương").
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import search_params
+from metadata_store import MetadataStore
+from text_utils import normalize_text, strip_accents
+
+# Ngưỡng giống phân loại độ dài trong profile lúc build index (short < 30 <= medium < 100 <= long)
+SHORT_MAX_CHAPTERS = 29
+LONG_MIN_CHAPTERS = 100
+
+# Từ khóa (không dấu) -> tên genre trong DB; chỉ dùng khi genre có trong catalogue
+GENRE_ALIASES = [
+    (r"hanh dong|action", "Action"),
+    (r"hai huoc|vui nhon|comedy", "Comedy"),
+    (r"gia tuong|ky ao|huyen huyen|fantasy", "Fantasy"),
+    (r"phieu luu|adventure", "Adventure"),
+    (r"lang man|tinh cam|romance", "Romance"),
+    (r"ngon tinh", "Ngôn Tình"),
+    (r"drama", "Drama"),
+    (r"bi kich|tragedy", "Tragedy"),
+    (r"hoc duong|truong hoc|school life", "School Life"),
+    (r"xuyen khong", "Xuyên Không"),
+    (r"chuyen sinh|trong sinh|isekai", "Chuyển Sinh"),
+    (r"bi an|trinh tham|mystery", "Mystery"),
+    (r"sieu nhien|supernatural", "Supernatural"),
+    (r"kinh di|ma quai|horror", "Horror"),
+    (r"vo thuat|kiem hiep|martial arts?", "Martial Arts"),
+    (r"co dai|co trang", "Cổ Đại"),
+    (r"lich su|historical", "Historical"),
+    (r"tam ly|psychological", "Psychological"),
+    (r"the thao|sports?", "Sports"),
+    (r"nau an|am thuc|cooking", "Cooking"),
+    (r"vien tuong|sci-?fi", "Sci-fi"),
+    (r"doi thuong|slice of life", "Slice of Life"),
+    (r"truyen mau", "Truyện Màu"),
+    (r"dam my", "Đam Mỹ"),
+    (r"harem|manhwa|manhua|manga|webtoon|shounen|seinen|shoujo|josei|mecha|one ?shot", None),
+]
+
+# Thứ tự quan trọng: "chưa hoàn thành" phải khớp trước "hoàn thành".
+# Cần ngữ cảnh trạng thái, không nhận từ trần: "đang rảnh", "con rắn", "kết thúc có hậu", "main bị drop"
+_STATUS_SUBJ = r"(?:truyen|bo|manga|manhwa|manhua|series)"
+STATUS_ALIASES = [
+    (
+        r"chua (?:hoan thanh|ket thuc|full|xong)|dang (?:ra|tien hanh|cap nhat)|(?:van )?con ra chuong"
+        r"|van (?:con|dang) ra|ongoing|in progress",
+        "In Progress",
+    ),
+    (rf"tam (?:ngung|dung|hoan)|(?:{_STATUS_SUBJ}|da) bi drop|on hold", "On Hold"),
+    (
+        rf"da (?:hoan thanh|ket thuc|full)|(?:hoan thanh|ket thuc|full) roi|tron bo|completed"
+        rf"|{_STATUS_SUBJ} (?:hoan thanh|da xong)|{_STATUS_SUBJ}(?: \w+){{0,3}} full",
+        "Completed",
+    ),
+]
+
+_NUM = r"(\d{1,5})"
+_RANGE_RE = re.compile(rf"(?:tu )?{_NUM} ?(?:den|toi|-) ?{_NUM} chuong")
+_MIN_RE = re.compile(rf"(?:tren|hon|nhieu hon|it nhat|toi thieu|>=?) ?{_NUM} chuong")
+_MAX_RE = re.compile(rf"(?:duoi|it hon|toi da|khong qua|<=?) ?{_NUM} chuong")
+# Chỉ nhận cụm rõ nghĩa: "long" / "short" / "đại kỳ" trần hay nằm trong tên truyện ("Long Tộc", "hài lòng")
+_LENGTH_NOUN = r"(?:series|story|stories|manga|manhwa|manhua|comics?)"
+_SHORT_RE = re.compile(rf"\b(?:(?:truyen|bo) ngan|it chuong|short {_LENGTH_NOUN})\b")
+_LONG_RE = re.compile(rf"\b(?:(?:truyen|bo) dai|nhieu chuong|long {_LENGTH_NOUN}|long running)\b")
+_MEDIUM_RE = re.compile(r"\b(?:(?:truyen|bo|do dai|so chuong) (?:vua phai|trung binh)|medium length)\b")
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    genres: FrozenSet[str] = field(default_factory=frozenset)
+    statuses: FrozenSet[str] = field(default_factory=frozenset)
+    min_chapters: Optional[int] = None
+    max_chapters: Optional[int] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.genres and not self.statuses and self.min_chapters is None and self.max_chapters is None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "genres": sorted(self.genres),
+            "statuses": sorted(self.statuses),
+            "min_chapters": self.min_chapters,
+            "max_chapters": self.max_chapters,
+        }
+
+
+NO_FILTER = SearchFilter()
+
+
+def parse_filters(message: str, known_genres: Iterable[str] = ()) -> SearchFilter:
+    """Tách filter từ câu user; genre chỉ giữ những cái có trong catalogue (so không phân biệt hoa thường)."""
+    text = strip_accents(normalize_text(message))
+    known = {g.lower(): g for g in known_genres}
+
+    genres = set()
+    for pattern, genre in GENRE_ALIASES:
+        m = re.search(rf"\b(?:{pattern})\b", text)
+        if not m:
+            continue
+        name = genre or m.group(0)
+        if name.lower() in known:
+            genres.add(known[name.lower()])
+
+    statuses = set()
+    rest = text
+    for pattern, status in STATUS_ALIASES:
+        bounded = rf"\b(?:{pattern})\b"
+        if re.search(bounded, rest):
+            statuses.add(status)
+            rest = re.sub(bounded, " ", rest)
+
+    lo: Optional[int] = None
+    hi: Optional[int] = None
+    m = _RANGE_RE.search(text)
+    if m:
+        a, b = sorted((int(m.group(1)), int(m.group(2))))
+        lo, hi = a, b
+    else:
+        m = _MIN_RE.search(text)
+        if m:
+            lo = int(m.group(1)) + (0 if re.match(r"(it nhat|toi thieu|>=)", m.group(0)) else 1)
+        m = _MAX_RE.search(text)
+        if m:
+            # "dưới 0 chương" -> 0, không để số chương âm
+            hi = max(0, int(m.group(1)) - (0 if re.match(r"(toi da|khong qua|<=)", m.group(0)) else 1))
+        if lo is None and hi is None:
+            if _SHORT_RE.search(text):
+                hi = SHORT_MAX_CHAPTERS
+            elif _LONG_RE.search(text):
+                lo = LONG_MIN_CHAPTERS
+            elif _MEDIUM_RE.search(text):
+                lo, hi = SHORT_MAX_CHAPTERS + 1, LONG_MIN_CHAPTERS - 1
+
+    return SearchFilter(frozenset(genres), frozenset(statuses), lo, hi)
+
+
+class FilterIndex:
+    """Mask theo dòng metadata cho một snapshot; selector FAISS cache theo filter."""
+
+    def __init__(self, meta: MetadataStore, labels_are_ids: bool, cache_size: int = 256):
+        self.meta = meta
+        self.labels_are_ids = labels_are_ids
+        self.n = len(meta)
+
+        self.genre_masks: Dict[str, np.ndarray] = {}
+        for row, raw in enumerate(meta.column("genre")):
+            for g in (raw or "").split(","):
+                g = g.strip()
+                if g:
+                    self.genre_masks.setdefault(g, np.zeros(self.n, dtype=bool))[row] = True
+
+        self._cache: "OrderedDict[SearchFilter, Tuple[np.ndarray, faiss.IDSelector]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def genres(self) -> List[str]:
+        return list(self.genre_masks)
+
+    def mask(self, flt: SearchFilter) -> np.ndarray:
+        m = np.ones(self.n, dtype=bool)
+        for g in flt.genres:
+            gm = self.genre_masks.get(g)
+            m &= gm if gm is not None else False
+        if flt.statuses:
+            codes = [i for i, s in enumerate(self.meta.status_labels) if s in flt.statuses]
+            m &= np.isin(self.meta.status_codes, codes)
+        if flt.min_chapters is not None:
+            m &= self.meta.chapter_counts >= flt.min_chapters
+        if flt.max_chapters is not None:
+            m &= self.meta.chapter_counts <= flt.max_chapters
+        return m
+
+    def selector(self, flt: SearchFilter) -> Tuple[np.ndarray, faiss.IDSelector]:
+        """(mask theo dòng, IDSelectorBitmap theo label)."""
+        with self._lock:
+            hit = self._cache.get(flt)
+            if hit is not None:
+                self._cache.move_to_end(flt)
+                return hit
+
+        mask = self.mask(flt)
+        if self.labels_are_ids:
+            ids = self.meta.comic_ids[mask].astype("int64")
+            size = int(self.meta.comic_ids.max()) + 1 if self.n else 0
+        else:
+            ids = np.flatnonzero(mask)
+            size = self.n
+        bits = np.zeros(size, dtype=bool)
+        bits[ids] = True
+        bitmap = np.packbits(bits, bitorder="little")
+        # IDSelectorBitmap chỉ giữ con trỏ -> gắn bitmap vào selector để không bị GC
+        sel = faiss.IDSelectorBitmap(size, faiss.swig_ptr(bitmap))
+        sel.referenced_objects = [bitmap]
+
+        with self._lock:
+            self._cache[flt] = (mask, sel)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return mask, sel
+
+    def params(self, index: faiss.Index, flt: SearchFilter) -> Tuple[np.ndarray, faiss.SearchParameters]:
+        mask, sel = self.selector(flt)
+        params = search_params(index, sel)
+        params.referenced_objects = [sel]
+        return mask, params
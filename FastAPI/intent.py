@@ -0,0 +1,141 @@
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    INTENT_SEEDS_PATH,
+    INTENT_CENTROID_MIN_SIM,
+    INTENT_CENTROID_MARGIN,
+)
+from personas import BASIC_GREETINGS, SOCIAL_PATTERNS
+from text_utils import normalize_text, strip_accents
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("SOCIAL", "FAQ", "SEARCH")
+
+# Pattern viết không dấu, so khớp trên text đã strip_accents -> bắt được cả gõ có dấu lẫn không dấu
+FAQ_PATTERNS = [
+    r"\b(lam (sao|the nao)|cach|huong dan)( de)? (dang ky|dang nhap|nap|mua|mo khoa|doi|lay lai|theo doi|bao loi|tat|bat|huy)\b",
+    r"\b(nap (tien|xu)|mua xu|thanh toan|topup|vi xu)\b",
+    r"\b(dang nhap|dang ky tai khoan|tai khoan|mat khau|password|login|register)\b",
+    r"\b(mo khoa|unlock|chuong (bi )?khoa|tra phi)\b",
+    r"\b(bi loi|loi (anh|chuong|web|trang)|bug|khong (hien|load|tai|vao) duoc|bi treo|bao loi)\b",
+    r"\b(dich gia|nhom dich|translator)\b",
+    r"\b(thong bao|notification)\b",
+    r"\b(web|website|trang web)( nay)? (bi|co|lam sao)\b",
+]
+
+SEARCH_PATTERNS = [
+    r"\b(tim|kiem|goi y|de xuat|recommend|gioi thieu|review)( cho (minh|toi|tui|tao|em))? ?(vai |mot |may )?(truyen|bo|manga|manhwa|manhua)\b",
+    r"\btruyen (gi|nao|hay|ve|the loai|kinh di|tinh cam|ngon tinh|hanh dong|hai|co|moi|full)\b",
+    r"\b(the loai|genre)\b",
+    r"\b(manga|manhwa|manhua|webtoon|isekai|xuyen khong|chuyen sinh|ngon tinh|dam my|tu tien|kiem hiep|harem|romance|action|horror|kinh di|trinh tham|hoc duong|vo thuat)\b",
+    r"\b(main|nu chinh|nam chinh) (ba|manh|yeu|la|bi)\b",
+    r"\b(co|con) (bo|truyen) (nao|gi)\b",
+    r"\b(da hoan thanh|da full|da ket thuc|dang ra)\b",
+    r"\bdoc (gi|truyen|bo) ?(gi|nao)?\b",
+]
+
+
+# BASIC_GREETINGS viết có dấu ("chào") cho is_greeting; tầng rules so trên text đã bỏ dấu
+# nên bỏ dấu luôn pattern (bắt được cả "xin chào" lẫn "xin chao")
+GREETING_PATTERNS = [strip_accents(p) for p in BASIC_GREETINGS]
+
+
+def _match_any(patterns: List[str], text: str) -> bool:
+    return any(re.search(p, text) for p in patterns)
+
+
+def load_intent_seeds() -> Dict[str, List[str]]:
+    try:
+        with open(INTENT_SEEDS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {k: list(v) for k, v in data.items() if k in INTENTS}
+    except Exception:
+        return {}
+
+
+class IntentClassifier:
+    """
+    Phân loại ý định cục bộ nhiều tầng:
+    1. Pattern mở rộng (regex, không dấu)
+    2. Nearest-centroid trên embedding của ComicStore.embedder
+    Trả về None khi không đủ tự tin -> RAGBot gọi LLM.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+        faqs: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self._encode = encode_fn
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+
+        if encode_fn is not None:
+            seeds = load_intent_seeds()
+            # Tiêu đề FAQ cũng là mẫu FAQ tốt
+            faq_titles = [f.get("title") for f in (faqs or []) if f.get("title")]
+            if faq_titles:
+                seeds.setdefault("FAQ", []).extend(faq_titles)
+            self._build_centroids(seeds)
+
+    def _build_centroids(self, seeds: Dict[str, List[str]]) -> None:
+        labels, rows = [], []
+        for intent in INTENTS:
+            examples = [e for e in seeds.get(intent, []) if e]
+            if not examples:
+                continue
+            vecs = self._encode(examples)
+            centroid = vecs.mean(axis=0)
+            centroid /= (np.linalg.norm(centroid) or 1.0)
+            labels.append(intent)
+            rows.append(centroid.astype("float32"))
+
+        if len(labels) >= 2:
+            self.labels = labels
+            self.centroids = np.vstack(rows)
+        logger.info("Intent centroids: %s", self.labels)
+
+    # ---------- Tier 1 ----------
+    def classify_rules(self, message: str) -> Optional[Dict[str, Any]]:
+        text = strip_accents(normalize_text(message))
+        if not text:
+            return None
+
+        hits = {
+            "SOCIAL": _match_any(SOCIAL_PATTERNS, text)
+            or _match_any(GREETING_PATTERNS, text),
+            "FAQ": _match_any(FAQ_PATTERNS, text),
+            "SEARCH": _match_any(SEARCH_PATTERNS, text),
+        }
+        # "chào bot, tìm truyện kinh dị" -> yêu cầu thật thắng câu chào
+        if hits["FAQ"] or hits["SEARCH"]:
+            hits["SOCIAL"] = False
+
+        matched = [k for k, v in hits.items() if v]
+        if len(matched) != 1:
+            return None
+        return {"intent": matched[0], "source": "rule", "confidence": 1.0}
+
+    # ---------- Tier 2 ----------
+    def classify_centroid(self, message: str, q_vec: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        if self.centroids is None:
+            return None
+        if q_vec is None:
+            q_vec = self._encode([message])
+
+        sims = (self.centroids @ q_vec.reshape(-1)).tolist()
+        order = sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)
+        best, second = sims[order[0]], sims[order[1]]
+
+        if best < INTENT_CENTROID_MIN_SIM or best - second < INTENT_CENTROID_MARGIN:
+            return None
+        return {"intent": self.labels[order[0]], "source": "centroid", "confidence": round(best, 4)}
+
+    def classify(self, message: str) -> Optional[Dict[str, Any]]:
+        return self.classify_rules(message) or self.classify_centroid(message)
@@ -0,0 +1,117 @@
+"""
+Index từ vựng cho comic: BM25 trên title / alternateNames / slug / genre và bảng
+tên chính xác (title + từng alternate name + slug, bỏ dấu) -> comicId.
+
+Build bởi scripts/train_comic_faiss.py (storage/comic_lexical.npz), ComicStore
+load cùng snapshot và trộn với FAISS bằng reciprocal rank fusion.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bm25 import BM25Index
+from text_utils import normalize_text, strip_accents
+
+_TOKEN_RE = re.compile(r"\w+")
+# Cụm mở đầu hay gặp trước tên truyện: "tìm truyện naruto", "đọc bộ one piece"
+_LEAD_RE = re.compile(r"^(?:(?:cho|tim|doc|xem|kiem|minh|toi|em|muon|can|giup|truyen|bo|manga|manhwa|manhua|ten)\s+)+")
+
+
+def name_key(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall(strip_accents(normalize_text(text)).replace("_", " ")))
+
+
+def comic_names(item: Dict[str, Any]) -> List[str]:
+    names = [item.get("title") or "", (item.get("slug") or "").replace("-", " ")]
+    names.extend((item.get("alternateNames") or "").split(";"))
+    return [k for k in dict.fromkeys(name_key(n) for n in names) if k]
+
+
+def lexical_text(item: Dict[str, Any]) -> str:
+    # Lặp title để BM25 ưu tiên khớp tên hơn khớp thể loại
+    title = item.get("title") or ""
+    return " ".join([
+        title,
+        title,
+        (item.get("alternateNames") or "").replace(";", " "),
+        (item.get("slug") or "").replace("-", " "),
+        item.get("genre") or "",
+    ])
+
+
+class LexicalIndex:
+    def __init__(self, bm25: BM25Index, doc_ids: np.ndarray, name_keys: np.ndarray, name_ids: np.ndarray,
+                 header: Dict[str, Any]):
+        self.bm25 = bm25
+        self.doc_ids = doc_ids
+        # name_keys đã sort -> tra exact bằng searchsorted
+        self.name_keys = name_keys
+        self.name_ids = name_ids
+        self.header = header
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, items: Sequence[Dict[str, Any]], **header: Any) -> "LexicalIndex":
+        bm25 = BM25Index.build([lexical_text(it) for it in items])
+        doc_ids = np.array([int(it["comicId"]) for it in items], dtype="int32")
+        pairs = sorted((k, int(it["comicId"])) for it in items for k in comic_names(it))
+        name_keys = np.array([k for k, _ in pairs] or [""], dtype=str)[: len(pairs)]
+        name_ids = np.array([cid for _, cid in pairs], dtype="int32")
+        return cls(bm25, doc_ids, name_keys, name_ids, {**header, "count": len(items)})
+
+    def save(self, path: Any) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(
+            tmp,
+            header=np.array(json.dumps(self.header, ensure_ascii=False)),
+            doc_ids=self.doc_ids,
+            name_keys=self.name_keys,
+            name_ids=self.name_ids,
+            **self.bm25.to_arrays(),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Any) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as z:
+            arrs = {k: z[k] for k in z.files}
+        return cls(
+            BM25Index.from_arrays(arrs),
+            arrs["doc_ids"],
+            arrs["name_keys"],
+            arrs["name_ids"],
+            json.loads(str(arrs["header"])),
+        )
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(vị trí doc, điểm BM25) giảm dần; `mask` (bool theo doc) loại doc không thỏa filter."""
+        return self.bm25.top_k(query, k, mask)
+
+    def exact_ids(self, query: str) -> List[int]:
+        """comicId có tên trùng khớp hoàn toàn với query (bỏ dấu, bỏ cụm 'tìm truyện ...')."""
+        key = name_key(query)
+        keys = dict.fromkeys([key, _LEAD_RE.sub("", key)])
+        out: List[int] = []
+        for k in keys:
+            if not k:
+                continue
+            lo = int(np.searchsorted(self.name_keys, k, side="left"))
+            hi = int(np.searchsorted(self.name_keys, k, side="right"))
+            out.extend(int(x) for x in self.name_ids[lo:hi])
+        return list(dict.fromkeys(out))
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> Dict[int, float]:
+    """Reciprocal rank fusion: điểm = tổng 1 / (k + hạng) qua các danh sách."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return fused
@@ -0,0 +1,679 @@
+"""
+Lớp gọi LLM cho RAGBot: nhiều provider (Groq, Gemini) sau một interface,
+dùng chung một httpx.AsyncClient (pool kết nối keep-alive), mỗi lượt gọi một hạn chót.
+
+- Hedge: attempt đầu chưa xong sau ~p95 độ trễ gần đây của provider đó cho loại gọi đó
+  -> gửi thêm một bản sang provider kế tiếp (chỉ có một provider thì gửi trùng chính nó),
+  lấy bản về trước, hủy bản còn lại. Với stream thì tính tới token đầu tiên.
+- Failover: attempt lỗi -> thử ngay provider kế tiếp, trong hạn chót còn lại.
+- Circuit breaker mỗi provider: LLM_BREAKER_FAILURES lỗi liên tiếp -> mở, bỏ qua provider
+  trong LLM_BREAKER_COOLDOWN_S, hết hạn thì cho đúng một request thử (half-open).
+  Lỗi 4xx do chính request (trừ 408/429) không tính vào breaker.
+
+    client = LLMClient.from_config()          # None nếu không có provider nào
+    res = await client.complete(messages, call="search", timeout=8.0, json_mode=True)
+    async for chunk in client.stream(messages, call="social", timeout=8.0): ...
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+
+from config import (
+    GEMINI_API_KEY,
+    GEMINI_BASE_URL,
+    GEMINI_MODEL_NAME,
+    GEMINI_THINKING_BUDGET,
+    GROQ_API_KEY,
+    GROQ_BASE_URL,
+    GROQ_MODEL_NAME,
+    LLM_BREAKER_COOLDOWN_S,
+    LLM_BREAKER_FAILURES,
+    LLM_CONNECT_TIMEOUT_S,
+    LLM_HEDGE_DEFAULT_MS,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MAX_MS,
+    LLM_HEDGE_MIN_MS,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_WINDOW,
+    LLM_HTTP_KEEPALIVE_S,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_PROVIDERS,
+    LLM_STUB,
+    LLM_STUB_LATENCY_MS,
+    LLM_STUB_TOKENS_PER_S,
+    LLM_TIMEOUT_S,
+    SOCIAL_SKIP_GEMINI,
+)
+from metrics import LLM_ATTEMPTS, LLM_HEDGES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Messages = List[Dict[str, str]]
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class ProviderError(LLMError):
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+    @property
+    def counts_against_provider(self) -> bool:
+        """4xx do request sai thì provider vẫn khỏe; 408 / 429 / 5xx / lỗi mạng thì không."""
+        return self.status is None or self.status >= 500 or self.status in (408, 429)
+
+
+class LLMUnavailable(LLMError):
+    """Mọi provider đều lỗi / đang mở breaker, hoặc hết hạn chót."""
+
+
+@dataclass
+class Completion:
+    content: str
+    provider: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+@dataclass
+class StreamChunk:
+    """Một delta text; chunk cuối (text rỗng) mang usage nếu provider trả về."""
+
+    text: str = ""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+    @property
+    def has_usage(self) -> bool:
+        return self.prompt_tokens is not None or self.completion_tokens is not None
+
+
+# ================= BREAKER / LATENCY =================
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failures: int = LLM_BREAKER_FAILURES,
+        cooldown_s: float = LLM_BREAKER_COOLDOWN_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        # RAGBot có thể chạy trên loop của server và loop nền của wrapper đồng bộ
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.cooldown_s:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and self._clock() - self._opened_at >= self.cooldown_s:
+                self._probing = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.max_failures:
+                self._opened_at = self._clock()
+            self._probing = False
+
+    def release(self) -> None:
+        """Attempt bị hủy / lỗi không tính -> không kết luận được, cho phép thử lại."""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyWindow:
+    def __init__(self, size: int = LLM_HEDGE_WINDOW):
+        self._xs: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._xs.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> Optional[float]:
+        if len(self._xs) < min_samples:
+            return None
+        xs = sorted(self._xs)
+        return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+
+
+# ================= PROVIDERS =================
+
+def _raise_for_status(provider: str, r: httpx.Response) -> None:
+    if r.status_code < 400:
+        return
+    try:
+        detail = r.text[:200]
+    except httpx.ResponseNotRead:
+        detail = ""
+    raise ProviderError(provider, f"HTTP {r.status_code} {detail}".strip(), r.status_code)
+
+
+async def _sse_data(r: httpx.Response) -> AsyncIterator[str]:
+    async for line in r.aiter_lines():
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+
+def _http_timeout(seconds: float) -> httpx.Timeout:
+    seconds = max(seconds, 0.001)
+    return httpx.Timeout(seconds, connect=min(LLM_CONNECT_TIMEOUT_S, seconds))
+
+
+class Provider:
+    name = "provider"
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+
+    async def complete(
+        self, messages: Messages, *, timeout: float, temperature: Optional[float],
+        max_tokens: Optional[int], json_mode: bool,
+    ) -> Completion:
+        raise NotImplementedError
+
+    def stream(
+        self, messages: Messages, *, timeout: float, temperature: Optional[float],
+        max_tokens: Optional[int], json_mode: bool,
+    ) -> AsyncIterator[StreamChunk]:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        return None
+
+
+class OpenAICompatProvider(Provider):
+    """API dạng OpenAI /chat/completions (Groq)."""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, http: httpx.AsyncClient):
+        super().__init__()
+        self.name = name
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.http = http
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+
+    def _payload(self, messages, temperature, max_tokens, json_mode, stream) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": self.model, "messages": messages, "stream": stream}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    async def complete(self, messages, *, timeout, temperature, max_tokens, json_mode) -> Completion:
+        r = await self.http.post(
+            self.url,
+            json=self._payload(messages, temperature, max_tokens, json_mode, False),
+            headers=self._headers,
+            timeout=_http_timeout(timeout),
+        )
+        _raise_for_status(self.name, r)
+        data = r.json()
+        usage = data.get("usage") or {}
+        return Completion(
+            data["choices"][0]["message"].get("content") or "",
+            self.name,
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+        )
+
+    async def stream(self, messages, *, timeout, temperature, max_tokens, json_mode) -> AsyncIterator[StreamChunk]:
+        async with self.http.stream(
+            "POST",
+            self.url,
+            json=self._payload(messages, temperature, max_tokens, json_mode, True),
+            headers=self._headers,
+            timeout=_http_timeout(timeout),
+        ) as r:
+            if r.status_code >= 400:
+                await r.aread()
+                _raise_for_status(self.name, r)
+            usage: Dict[str, Any] = {}
+            async for data in _sse_data(r):
+                if data == "[DONE]":
+                    break
+                obj = json.loads(data)
+                # Groq gửi usage trong chunk cuối (x_groq.usage), API OpenAI gửi ở "usage"
+                usage = (obj.get("x_groq") or {}).get("usage") or obj.get("usage") or usage
+                choices = obj.get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    yield StreamChunk(delta)
+            if usage:
+                yield StreamChunk("", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+
+class GeminiProvider(Provider):
+    """Gemini REST generateContent / streamGenerateContent (không cần SDK)."""
+
+    name = "gemini"
+
+    def __init__(self, base_url: str, api_key: str, model: str, http: httpx.AsyncClient):
+        super().__init__()
+        self.base = f'{base_url.rstrip("/")}/models/{model}'
+        self.http = http
+        self._headers = {"x-goog-api-key": api_key}
+
+    @staticmethod
+    def _body(messages, temperature, max_tokens, json_mode) -> Dict[str, Any]:
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages
+            if m["role"] != "system"
+        ]
+        body: Dict[str, Any] = {"contents": contents}
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        cfg: Dict[str, Any] = {}
+        if temperature is not None:
+            cfg["temperature"] = temperature
+        if max_tokens:
+            cfg["maxOutputTokens"] = max_tokens
+        if json_mode:
+            cfg["responseMimeType"] = "application/json"
+        if GEMINI_THINKING_BUDGET >= 0:
+            cfg["thinkingConfig"] = {"thinkingBudget": GEMINI_THINKING_BUDGET}
+        if cfg:
+            body["generationConfig"] = cfg
+        return body
+
+    @staticmethod
+    def _text(obj: Dict[str, Any]) -> str:
+        candidates = obj.get("candidates") or []
+        parts = ((candidates[0].get("content") or {}).get("parts") or []) if candidates else []
+        return "".join(p.get("text", "") for p in parts if not p.get("thought"))
+
+    async def complete(self, messages, *, timeout, temperature, max_tokens, json_mode) -> Completion:
+        r = await self.http.post(
+            f"{self.base}:generateContent",
+            json=self._body(messages, temperature, max_tokens, json_mode),
+            headers=self._headers,
+            timeout=_http_timeout(timeout),
+        )
+        _raise_for_status(self.name, r)
+        data = r.json()
+        usage = data.get("usageMetadata") or {}
+        return Completion(
+            self._text(data), self.name, usage.get("promptTokenCount"), usage.get("candidatesTokenCount")
+        )
+
+    async def stream(self, messages, *, timeout, temperature, max_tokens, json_mode) -> AsyncIterator[StreamChunk]:
+        async with self.http.stream(
+            "POST",
+            f"{self.base}:streamGenerateContent",
+            params={"alt": "sse"},
+            json=self._body(messages, temperature, max_tokens, json_mode),
+            headers=self._headers,
+            timeout=_http_timeout(timeout),
+        ) as r:
+            if r.status_code >= 400:
+                await r.aread()
+                _raise_for_status(self.name, r)
+            usage: Dict[str, Any] = {}
+            async for data in _sse_data(r):
+                obj = json.loads(data)
+                # usageMetadata có ở mọi chunk, cộng dồn -> giữ bản cuối
+                usage = obj.get("usageMetadata") or usage
+                text = self._text(obj)
+                if text:
+                    yield StreamChunk(text)
+            if usage:
+                yield StreamChunk("", usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+
+class SDKProvider(Provider):
+    """Client kiểu OpenAI SDK (chat.completions.create), vd. llm_stub.StubLLM."""
+
+    def __init__(self, name: str, client: Any, model: str = ""):
+        super().__init__()
+        self.name = name
+        self.client = client
+        self.model = model
+
+    def _kwargs(self, temperature, max_tokens, json_mode) -> Dict[str, Any]:
+        kw: Dict[str, Any] = {}
+        if temperature is not None:
+            kw["temperature"] = temperature
+        if max_tokens:
+            kw["max_tokens"] = max_tokens
+        if json_mode:
+            kw["response_format"] = {"type": "json_object"}
+        return kw
+
+    async def complete(self, messages, *, timeout, temperature, max_tokens, json_mode) -> Completion:
+        res = await self.client.chat.completions.create(
+            model=self.model, messages=messages, **self._kwargs(temperature, max_tokens, json_mode)
+        )
+        usage = getattr(res, "usage", None)
+        return Completion(
+            res.choices[0].message.content or "",
+            self.name,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+        )
+
+    async def stream(self, messages, *, timeout, temperature, max_tokens, json_mode) -> AsyncIterator[StreamChunk]:
+        stream = await self.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True, **self._kwargs(temperature, max_tokens, json_mode)
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield StreamChunk(delta)
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None:
+                    yield StreamChunk("", usage.prompt_tokens, usage.completion_tokens)
+        finally:
+            await stream.close()
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+# ================= ROUTER =================
+
+class LLMClient:
+    def __init__(
+        self,
+        providers: List[Provider],
+        http: Optional[httpx.AsyncClient] = None,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        skip: Optional[Dict[str, Tuple[str, ...]]] = None,
+    ):
+        if not providers:
+            raise ValueError("LLMClient needs at least one provider")
+        self.providers = providers
+        self.http = http
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        # Loại gọi -> provider không dùng cho loại đó (vd. social không tốn quota Gemini)
+        self.skip = skip or {}
+        self._latency: Dict[Tuple[str, str], LatencyWindow] = defaultdict(LatencyWindow)
+
+    @classmethod
+    def from_config(cls) -> Optional["LLMClient"]:
+        if LLM_STUB:
+            from llm_stub import StubLLM
+
+            return cls([SDKProvider("stub", StubLLM(LLM_STUB_LATENCY_MS, LLM_STUB_TOKENS_PER_S), "stub")])
+
+        # Chọn provider trước: không có key nào thì không mở connection pool
+        enabled: List[str] = []
+        for name in LLM_PROVIDERS:
+            if name not in ("groq", "gemini"):
+                logger.warning("Unknown LLM provider %r ignored", name)
+            elif GROQ_API_KEY if name == "groq" else GEMINI_API_KEY:
+                enabled.append(name)
+        if not enabled:
+            return None
+
+        http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_HTTP_KEEPALIVE_S,
+            ),
+            timeout=_http_timeout(LLM_TIMEOUT_S),
+        )
+        providers: List[Provider] = [
+            OpenAICompatProvider("groq", GROQ_BASE_URL, GROQ_API_KEY, GROQ_MODEL_NAME, http)
+            if name == "groq"
+            else GeminiProvider(GEMINI_BASE_URL, GEMINI_API_KEY, GEMINI_MODEL_NAME, http)
+            for name in enabled
+        ]
+        return cls(providers, http=http, skip={"social": ("gemini",)} if SOCIAL_SKIP_GEMINI else None)
+
+    @property
+    def names(self) -> List[str]:
+        return [p.name for p in self.providers]
+
+    async def aclose(self) -> None:
+        for p in self.providers:
+            await p.aclose()
+        if self.http is not None:
+            await self.http.aclose()
+
+    # ---------- Gọi ----------
+    async def complete(
+        self,
+        messages: Messages,
+        *,
+        call: str = "chat",
+        timeout: float = LLM_TIMEOUT_S,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+    ) -> Completion:
+        deadline = time.monotonic() + timeout
+
+        async def attempt(p: Provider) -> Completion:
+            return await p.complete(
+                messages, timeout=deadline - time.monotonic(),
+                temperature=temperature, max_tokens=max_tokens, json_mode=json_mode,
+            )
+
+        res, _ = await self._race(call, call, attempt, deadline)
+        return res
+
+    async def stream(
+        self,
+        messages: Messages,
+        *,
+        call: str = "chat",
+        timeout: float = LLM_TIMEOUT_S,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+    ) -> AsyncIterator[StreamChunk]:
+        """Hedge / failover tới token đầu tiên; sau đó gắn với provider đã thắng tới hết lượt."""
+        deadline = time.monotonic() + timeout
+
+        async def attempt(p: Provider) -> Tuple[AsyncIterator[StreamChunk], List[StreamChunk]]:
+            it = p.stream(
+                messages, timeout=deadline - time.monotonic(),
+                temperature=temperature, max_tokens=max_tokens, json_mode=json_mode,
+            )
+            head: List[StreamChunk] = []
+            try:
+                async for chunk in it:
+                    head.append(chunk)
+                    if chunk.text:
+                        break
+            except BaseException:
+                await it.aclose()
+                raise
+            return it, head
+
+        async def discard(res: Tuple[AsyncIterator[StreamChunk], List[StreamChunk]]) -> None:
+            await res[0].aclose()
+
+        (it, head), provider = await self._race(call, f"{call}:first_token", attempt, deadline, discard)
+        try:
+            for chunk in head:
+                yield chunk
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMUnavailable(f"{call}: deadline exceeded mid-stream ({provider.name})")
+                try:
+                    chunk = await asyncio.wait_for(it.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except (ProviderError, httpx.HTTPError, asyncio.TimeoutError) as e:
+            if not isinstance(e, ProviderError) or e.counts_against_provider:
+                provider.breaker.failure()
+            raise
+        finally:
+            await it.aclose()
+
+    # ---------- Hedge + failover ----------
+    def _hedge_delay(self, provider: Provider, key: str) -> float:
+        q = self._latency[(provider.name, key)].quantile(self.hedge_quantile)
+        ms = q * 1000.0 if q is not None else LLM_HEDGE_DEFAULT_MS
+        return min(max(ms, LLM_HEDGE_MIN_MS), LLM_HEDGE_MAX_MS) / 1000.0
+
+    async def _race(
+        self,
+        call: str,
+        key: str,
+        attempt: Callable[[Provider], Awaitable[T]],
+        deadline: float,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> Tuple[T, Provider]:
+        skipped = self.skip.get(call, ())
+        queue = [p for p in self.providers if p.name not in skipped] or list(self.providers)
+        pending: Dict["asyncio.Task[T]", Tuple[Provider, float]] = {}
+        errors: List[str] = []
+        hedge_task: Optional["asyncio.Task[T]"] = None
+
+        def take() -> Optional[Provider]:
+            while queue:
+                p = queue.pop(0)
+                if p.breaker.allow():
+                    return p
+                LLM_ATTEMPTS.inc(p.name, call, "rejected")
+            return None
+
+        def launch(p: Provider) -> "asyncio.Task[T]":
+            task = asyncio.ensure_future(attempt(p))
+            pending[task] = (p, time.monotonic())
+            return task
+
+        primary = take()
+        if primary is None:
+            raise LLMUnavailable(f"{call}: all providers unavailable (circuit open)")
+        launch(primary)
+        hedge_at = time.monotonic() + self._hedge_delay(primary, key) if self.hedge else float("inf")
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    # Hết hạn chót: provider chậm tính là lỗi cho breaker
+                    await self._cancel(pending, call, timed_out=True)
+                    break
+                wake = deadline if hedge_task is not None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=max(wake - now, 0.0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if hedge_task is None and time.monotonic() >= hedge_at:
+                        # Chưa có provider dự phòng -> gửi trùng provider đang chạy (nếu breaker đóng)
+                        target = take() or (primary if primary.breaker.state == "closed" else None)
+                        hedge_at = float("inf")
+                        if target is not None:
+                            hedge_task = launch(target)
+                    continue
+
+                winner: Optional["asyncio.Task[T]"] = None
+                winner_provider = primary
+                for task in done:
+                    p, started = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        if winner is None:
+                            winner, winner_provider = task, p
+                            p.breaker.success()
+                            self._latency[(p.name, key)].add(time.monotonic() - started)
+                            LLM_ATTEMPTS.inc(p.name, call, "ok")
+                        else:
+                            # Hai bản về cùng lúc: bản thừa vẫn phải đóng (stream)
+                            p.breaker.success()
+                            LLM_ATTEMPTS.inc(p.name, call, "cancelled")
+                            if discard is not None:
+                                await discard(task.result())
+                        continue
+                    LLM_ATTEMPTS.inc(p.name, call, "error")
+                    errors.append(f"{p.name}: {exc}")
+                    logger.warning("LLM %s call via %s failed: %s", call, p.name, exc)
+                    if isinstance(exc, ProviderError) and not exc.counts_against_provider:
+                        p.breaker.release()
+                    else:
+                        p.breaker.failure()
+
+                if winner is not None:
+                    if hedge_task is not None:
+                        LLM_HEDGES.inc(call, "won" if winner is hedge_task else "lost")
+                    return winner.result(), winner_provider
+                if not pending:
+                    nxt = take()
+                    if nxt is not None:
+                        launch(nxt)
+        finally:
+            await self._cancel(pending, call)
+
+        if time.monotonic() >= deadline:
+            raise LLMUnavailable(f"{call}: deadline exceeded" + (f" ({'; '.join(errors)})" if errors else ""))
+        raise LLMUnavailable(f"{call}: all providers failed ({'; '.join(errors)})")
+
+    @staticmethod
+    async def _cancel(
+        pending: Dict["asyncio.Task[Any]", Tuple[Provider, float]], call: str, timed_out: bool = False
+    ) -> None:
+        if not pending:
+            return
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for p, _ in pending.values():
+            LLM_ATTEMPTS.inc(p.name, call, "timeout" if timed_out else "cancelled")
+            if timed_out:
+                p.breaker.failure()
+            else:
+                p.breaker.release()
+        pending.clear()
+
+    # ---------- Số liệu ----------
+    def stats(self) -> Dict[str, Any]:
+        return {
+            p.name: {
+                "breaker": p.breaker.state,
+                "hedge_delay_ms": {
+                    key: round(self._hedge_delay(p, key) * 1000.0, 1)
+                    for (name, key) in list(self._latency)
+                    if name == p.name
+                },
+            }
+            for p in self.providers
+        }
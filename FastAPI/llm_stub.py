@@ -0,0 +1,163 @@
+"""
+LLM giả chạy local, interface kiểu OpenAI SDK (chat.completions.create, stream,
+usage, close), gắn vào llm_client qua SDKProvider -> benchmark / CI chạy offline.
+
+Tất định: nội dung và độ trễ chỉ phụ thuộc prompt. Thời gian trả lời
+= latency_ms (± jitter theo hash prompt) + số token sinh / tokens_per_s;
+bản stream nhả từng token theo đúng nhịp đó. Token ước lượng ~4 ký tự / token.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Dòng ứng viên do prompts.PromptBuilder.search dựng: "#<comicId> <title>"
+_CANDIDATE_RE = re.compile(r"^#(\d+) (.+)$", re.MULTILINE)
+
+_SOCIAL_HINTS = ("chào", "hello", "hi ", "cảm ơn", "buồn", "vui", "bot", "tên gì", "yêu")
+_FAQ_HINTS = ("đăng ký", "đăng nhập", "mật khẩu", "tài khoản", "lỗi", "nạp", "xu", "thanh toán", "làm sao")
+
+_FILLER = (
+    "truyện này khá cuốn, nhịp nhanh và nhân vật có chiều sâu, bạn thử đọc vài chương đầu xem sao nhé "
+    "mình nghĩ bạn sẽ thích phần xây dựng thế giới và những pha hành động được vẽ rất đẹp"
+).split()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(str(m.get("content") or "") for m in messages or [])
+
+
+def _last_user(messages: List[Dict[str, Any]]) -> str:
+    for m in reversed(messages or []):
+        if m.get("role") == "user":
+            return str(m.get("content") or "")
+    return ""
+
+
+class _Stream:
+    def __init__(self, pieces: List[str], delay_per_piece: float, first_delay: float, usage: Any):
+        self._pieces = pieces
+        self._delay = delay_per_piece
+        self._first = first_delay
+        self._usage = usage
+        self._closed = False
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._gen()
+
+    async def _gen(self) -> AsyncIterator[Any]:
+        await asyncio.sleep(self._first)
+        last = len(self._pieces) - 1
+        for i, piece in enumerate(self._pieces):
+            if self._closed:
+                return
+            if i:
+                await asyncio.sleep(self._delay)
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))],
+                x_groq=SimpleNamespace(usage=self._usage) if i == last else None,
+            )
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class _Completions:
+    def __init__(self, stub: "StubLLM"):
+        self._stub = stub
+
+    async def create(
+        self,
+        model: str = "",
+        messages: Optional[List[Dict[str, Any]]] = None,
+        stream: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        **_: Any,
+    ) -> Any:
+        return await self._stub.complete(messages or [], stream, response_format, max_tokens)
+
+
+class StubLLM:
+    def __init__(self, latency_ms: float = 300.0, tokens_per_s: float = 250.0, jitter: float = 0.1):
+        self.latency_s = latency_ms / 1000.0
+        self.tokens_per_s = max(tokens_per_s, 1e-6)
+        self.jitter = jitter
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    async def close(self) -> None:
+        return None
+
+    # ---------- Nội dung ----------
+    @staticmethod
+    def _intent(message: str) -> str:
+        msg = message.lower()
+        if any(h in msg for h in _FAQ_HINTS):
+            return "FAQ"
+        if any(h in msg for h in _SOCIAL_HINTS):
+            return "SOCIAL"
+        return "SEARCH"
+
+    def _text(self, prompt: str, rng: random.Random, max_tokens: Optional[int]) -> str:
+        picks = _CANDIDATE_RE.findall(prompt)[: rng.randint(2, 3)]
+        head = ("Bạn thử " + ", ".join(t for _, t in picks) + " nhé. ") if picks else ""
+        budget = min(max_tokens or 120, 120)
+        words: List[str] = []
+        while estimate_tokens(head + " ".join(words)) < budget * 0.6:
+            words.append(rng.choice(_FILLER))
+        return head + " ".join(words).capitalize() + "."
+
+    def _content(
+        self, prompt: str, message: str, json_mode: bool, rng: random.Random, max_tokens: Optional[int]
+    ) -> str:
+        if json_mode and "reply_text" in prompt:
+            picks = _CANDIDATE_RE.findall(prompt)[: rng.randint(2, 3)]
+            return json.dumps(
+                {
+                    "reply_text": self._text(prompt, rng, max_tokens),
+                    "recommendations": [{"comicId": int(i), "title": t} for i, t in picks],
+                },
+                ensure_ascii=False,
+            )
+        if json_mode:
+            return json.dumps({"intent": self._intent(message)})
+        return self._text(prompt, rng, max_tokens)
+
+    # ---------- Gọi ----------
+    async def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool,
+        response_format: Optional[Dict[str, Any]],
+        max_tokens: Optional[int],
+    ) -> Any:
+        self.calls += 1
+        prompt = _prompt_text(messages)
+        seed = int.from_bytes(hashlib.sha1(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        json_mode = (response_format or {}).get("type") == "json_object"
+        content = self._content(prompt, _last_user(messages), json_mode, rng, max_tokens)
+
+        usage = SimpleNamespace(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(content))
+        first = self.latency_s * (1.0 + self.jitter * (2.0 * rng.random() - 1.0))
+        per_token = 1.0 / self.tokens_per_s
+
+        if stream:
+            # Mỗi từ (kèm khoảng trắng) là một chunk
+            pieces = re.findall(r"\S+\s*", content) or [content]
+            per_piece = per_token * usage.completion_tokens / len(pieces)
+            return _Stream(pieces, per_piece, first, usage)
+
+        await asyncio.sleep(first + per_token * usage.completion_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage,
+        )
@@ -1,13 +1,83 @@
-from typing import Any, Dict, List, Optional, Literal
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Literal
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 
-from rag import RAGBot
+import metrics
+from admission import DEGRADED, FULL, Overloaded
+from config import (
+    ADMIN_TOKEN,
+    SEARCH_BATCH_MAX_QUERIES,
+    SERVER_TIMING_ENABLED,
+    SIMILAR_DEFAULT_LIMIT,
+    SIMILAR_TOP_N,
+    TOP_K_CANDIDATES,
+)
+from prompts import clean_history
+
+if TYPE_CHECKING:
+    from rag import RAGBot
+
+logger = logging.getLogger(__name__)
+
+
+class AppState:
+    """Bot được dựng trong lifespan (nền), /health báo ready sau warm-up encode + search."""
+
+    def __init__(self):
+        self.bot: Optional["RAGBot"] = None
+        self.ready = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, Any] = {}
+
+
+state = AppState()
+
+
+def _build_bot() -> "RAGBot":
+    # Import nặng (torch, sentence-transformers, faiss) nằm ở đây, không nằm trên đường import main.py
+    t0 = time.perf_counter()
+    from rag import RAGBot
+    t1 = time.perf_counter()
+    bot = RAGBot()
+    t2 = time.perf_counter()
+    state.timings.update(import_s=round(t1 - t0, 3), load_s=round(t2 - t1, 3))
+    return bot
+
+
+async def _boot(started_at: float) -> None:
+    try:
+        bot = await asyncio.to_thread(_build_bot)
+        state.bot = bot
+        state.timings["warmup"] = await asyncio.to_thread(bot.store.warmup)
+        bot.store.start_watcher()
+        state.ready = True
+        state.timings["ready_s"] = round(time.perf_counter() - started_at, 3)
+        logger.info("RAG bot ready: %s", state.timings)
+    except Exception as e:
+        state.error = str(e)
+        logger.exception("RAG bot failed to start")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    boot_task = asyncio.create_task(_boot(time.perf_counter()))
+    yield
+    if not boot_task.done():
+        boot_task.cancel()
+    if state.bot is not None:
+        await state.bot.aclose()
 
 
-app = FastAPI(title="Comic RAG Bot", version="1.0.0")
+app = FastAPI(title="Comic RAG Bot", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +86,91 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-bot = RAGBot()
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # 429 = hàng chờ đầy, 503 = chờ quá hạn; trả ngay, không tốn encode / LLM
+    return JSONResponse(
+        status_code=exc.status,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after_s)},
+    )
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    timer, token = metrics.start_request()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.end_request(token)
+    # Nhãn theo route template (/similar/{comicId}), không theo URL thật để không nổ cardinality
+    route = request.scope.get("route")
+    metrics.observe_http(request.method, getattr(route, "path", "unmatched"), response.status_code, timer.elapsed())
+    # Với /chat/stream header gửi trước khi sinh token -> chỉ có các bước trước đó
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timer.server_timing()
+    # Token LLM thật (usage của provider) cộng dồn trong request
+    if timer.tokens:
+        response.headers["X-LLM-Tokens"] = "; ".join(f"{k}={v}" for k, v in sorted(timer.tokens.items()))
+    return response
+
+
+def _bot_metrics():
+    """Số liệu đọc lúc scrape từ các cache / batcher của bot."""
+    if state.bot is None:
+        return []
+    bot = state.bot
+    families = []
+    for cache, stats in (("embedding", bot.store.query_cache.stats()), ("response", bot.response_cache.stats())):
+        families.append((f"rag_{cache}_cache_hits_total", "counter", f"Hit cache {cache}", [({}, stats["hits"])]))
+        families.append((f"rag_{cache}_cache_misses_total", "counter", f"Miss cache {cache}", [({}, stats["misses"])]))
+        families.append((f"rag_{cache}_cache_hit_ratio", "gauge", f"Tỉ lệ hit cache {cache}", [({}, stats["hit_rate"])]))
+        families.append((f"rag_{cache}_cache_entries", "gauge", f"Số entry cache {cache}", [({}, stats["size"])]))
+    batching = bot.store.batch_stats()
+    for name in ("encode", "search"):
+        b = batching.get(name) or {}
+        if b:
+            families.append((f"rag_{name}_batches_total", "counter", f"Số batch {name}", [({}, b["batches"])]))
+            families.append((f"rag_{name}_batch_avg_size", "gauge", f"Kích thước batch {name} trung bình", [({}, b["avg_batch"])]))
+    spec = bot.spec_stats
+    families.append(("rag_speculation_total", "counter", "Retrieval chạy song song với classify_intent", [
+        ({"kind": "search", "result": "used"}, spec.search_used),
+        ({"kind": "search", "result": "wasted"}, spec.search_wasted),
+        ({"kind": "faq", "result": "used"}, spec.faq_used),
+        ({"kind": "faq", "result": "wasted"}, spec.faq_wasted),
+    ]))
+    families.append(("rag_coalesce_inflight", "gauge", "Lượt xử lý /chat đang được các request trùng dùng chung", [
+        ({}, bot.flights.inflight),
+    ]))
+    adm = bot.admission.stats()
+    families.append(("rag_admission_inflight", "gauge", "Request /chat đang chạy", [({}, adm["inflight"])]))
+    families.append(("rag_admission_waiting", "gauge", "Request /chat đang chờ trong hàng", [({}, adm["waiting"])]))
+    families.append(("rag_llm_error_rate", "gauge", "Tỉ lệ lời gọi LLM lỗi trong cửa sổ gần đây", [
+        ({}, adm["llm_error_rate"]),
+    ]))
+    families.append(("rag_degraded_hold_seconds", "gauge", "Thời gian còn lại của chế độ degraded do lỗi LLM", [
+        ({}, adm["degraded_hold_s"]),
+    ]))
+    if bot.llm is not None:
+        llm = bot.llm.stats()
+        states = {"closed": 0, "half_open": 1, "open": 2}
+        families.append(("rag_llm_breaker_state", "gauge", "Circuit breaker provider LLM (0 đóng, 1 half-open, 2 mở)", [
+            ({"provider": name}, states[s["breaker"]]) for name, s in llm.items()
+        ]))
+        families.append(("rag_llm_hedge_delay_seconds", "gauge", "Ngưỡng gửi hedge hiện tại (p95 gần đây)", [
+            ({"provider": name, "call": key}, ms / 1000.0) for name, s in llm.items() for key, ms in s["hedge_delay_ms"].items()
+        ]))
+    return families
+
+
+metrics.add_collector(_bot_metrics)
+
+
+def get_bot() -> "RAGBot":
+    if not state.ready or state.bot is None:
+        raise HTTPException(status_code=503, detail="Bot is starting up")
+    return state.bot
 
 
 class HistoryItem(BaseModel):
@@ -31,29 +185,149 @@ class ChatRequest(BaseModel):
     history: Optional[List[HistoryItem]] = None
 
 
+class SearchBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=SEARCH_BATCH_MAX_QUERIES)
+    topK: int = Field(default=TOP_K_CANDIDATES, ge=1, le=100)
+    # Filter áp cho mọi query trong batch
+    genres: List[str] = Field(default_factory=list)
+    statuses: List[str] = Field(default_factory=list)
+    minChapters: Optional[int] = Field(default=None, ge=0)
+    maxChapters: Optional[int] = Field(default=None, ge=0)
+
+
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": state.error is None, "ready": state.ready, "error": state.error, "startup": state.timings}
 
 
-@app.post("/chat")
-def chat(req: ChatRequest):
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/warmup")
+async def warmup():
+    bot = get_bot()
+    return await asyncio.to_thread(bot.store.warmup)
+
+
+@app.get("/stats/speculation")
+def speculation_stats():
+    return get_bot().spec_stats.as_dict()
+
+
+@app.get("/stats/embed_cache")
+def embed_cache_stats():
+    return get_bot().store.query_cache.stats()
+
+
+@app.get("/stats/response_cache")
+def response_cache_stats():
+    return get_bot().response_cache.stats()
+
+
+@app.get("/stats/batching")
+def batching_stats():
+    return get_bot().store.batch_stats()
+
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False, x_admin_token: Optional[str] = Header(default=None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    bot = get_bot()
+    # Load ở thread pool mặc định, không chiếm executor embedding của bot
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, lambda: bot.store.reload(force=force))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Reload rejected: {e}")
+
+
+@app.post("/search/batch")
+async def search_batch(req: SearchBatchRequest):
+    """Search FAISS cho nhiều query (precompute gợi ý...), không qua intent/LLM."""
+    bot = get_bot()
+    from filters import SearchFilter
+
+    filters = SearchFilter(frozenset(req.genres), frozenset(req.statuses), req.minChapters, req.maxChapters)
+    return {"results": await bot.asearch_batch(req.queries, req.topK, filters)}
+
+
+@app.get("/similar/{comicId}")
+async def similar(
+    comicId: int,
+    limit: int = Query(default=SIMILAR_DEFAULT_LIMIT, ge=1, le=SIMILAR_TOP_N),
+    genres: List[str] = Query(default=[]),
+    statuses: List[str] = Query(default=[]),
+    minChapters: Optional[int] = Query(default=None, ge=0),
+    maxChapters: Optional[int] = Query(default=None, ge=0),
+):
+    """Truyện tương tự (bảng tính sẵn lúc build index), không encode / FAISS / LLM.
+    Filter chỉ lọc trong top-N đã lưu nên có thể trả ít hơn `limit`."""
+    bot = get_bot()
+    from filters import SearchFilter
+
+    filters = SearchFilter(frozenset(genres), frozenset(statuses), minChapters, maxChapters)
+    res = await bot.asimilar(comicId, limit, filters)
+    if res is None:
+        raise HTTPException(status_code=404, detail=f"No similar table entry for comicId {comicId}")
+    return res
+
+
+def _build_context(req: ChatRequest) -> Dict[str, Any]:
     ctx: Dict[str, Any] = dict(req.context or {})
 
-    # Lấy history tối đa 10 tin nhắn gần nhất
-    if req.history:
-        cleaned = []
-        for h in req.history[-10:]:
-            text = (h.content or "").strip()
-            if not text:
-                continue
-            cleaned.append(
-                {
-                    "role": h.role,
-                    "content": text[:800],  # cắt để không phình prompt
-                }
-            )
-        if cleaned:
-            ctx["history"] = cleaned
-
-    return bot.process(req.message, context=ctx, persona_id=req.personaId)
+    # Cắt số lượt / độ dài ở prompts.clean_history; ngân sách token áp ở PromptBuilder
+    history = clean_history([h.model_dump() for h in req.history or []])
+    if history:
+        ctx["history"] = history
+    return ctx
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest, response: Response):
+    bot = get_bot()
+    ctx = _build_context(req)
+    async with bot.admission.slot() as ticket:
+        result = await bot.aprocess(req.message, context=ctx, persona_id=req.personaId, mode=ticket.mode)
+        # Nhận full nhưng LLM lỗi, trả câu dự phòng -> header khớp "mode" trong payload
+        if ticket.mode == FULL and result.get("mode") == DEGRADED:
+            response.headers["X-Serving-Mode"] = f"{DEGRADED}; reason=llm_fallback"
+        else:
+            response.headers["X-Serving-Mode"] = ticket.header()
+        return result
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    SSE: intent -> candidates (chỉ SEARCH) -> token... -> done.
+    Payload của "done" giống hệt response /chat.
+    """
+    bot = get_bot()
+    ctx = _build_context(req)
+    # Slot giữ suốt lượt stream; quá tải thì 429/503 trước khi mở stream
+    ticket = await bot.admission.admit()
+
+    async def events():
+        try:
+            async for ev in bot.astream(req.message, context=ctx, persona_id=req.personaId, mode=ticket.mode):
+                yield _sse(ev["event"], ev["data"])
+        except Exception as e:
+            logger.exception("Stream failed")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Serving-Mode": ticket.header()},
+        # Client ngắt trước khi stream bắt đầu thì events() không chạy tới finally
+        background=BackgroundTask(ticket.release),
+    )
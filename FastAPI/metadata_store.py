@@ -0,0 +1,186 @@
+"""
+Metadata dạng cột, một file nhị phân, đọc qua mmap.
+
+Layout:
+    8 byte magic | uint64 độ dài header | header JSON | pad 8 | các section
+
+Section cố định: comic_id (int32), chapter_count (int32), status (uint8, mã vào
+header["status_labels"]), offsets (int64, n * len(fields) + 1) và strings
+(utf-8 nối liền). Các worker uvicorn mmap cùng một file -> dùng chung page cache,
+mỗi lần search chỉ decode đúng field cần trả về.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"CMETA01\0"
+STRING_FIELDS = ("title", "slug", "genre", "alternateNames", "description")
+# Field cần cho candidates / results của /chat (không có description)
+RESULT_FIELDS = ("comicId", "title", "slug", "genre", "chapterCount", "status")
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def encode_metadata(items: Sequence[Dict[str, Any]], **header_extra: Any) -> bytes:
+    n = len(items)
+    nf = len(STRING_FIELDS)
+
+    status_labels = sorted({it.get("status") or "" for it in items})
+    status_code = {s: i for i, s in enumerate(status_labels)}
+    if len(status_labels) > 255:
+        raise ValueError("Too many distinct status values for uint8 column")
+
+    comic_id = np.array([int(it["comicId"]) for it in items], dtype="int32")
+    chapter_count = np.array([int(it.get("chapterCount") or 0) for it in items], dtype="int32")
+    status = np.array([status_code[it.get("status") or ""] for it in items], dtype="uint8")
+
+    offsets = np.zeros(n * nf + 1, dtype="int64")
+    chunks: List[bytes] = []
+    pos = 0
+    for r, it in enumerate(items):
+        for f, field in enumerate(STRING_FIELDS):
+            b = (it.get(field) or "").encode("utf-8")
+            offsets[r * nf + f] = pos
+            chunks.append(b)
+            pos += len(b)
+    offsets[-1] = pos
+    strings = np.frombuffer(b"".join(chunks), dtype="uint8")
+
+    sections: Dict[str, Tuple[int, str, int]] = {}
+    payload: List[bytes] = []
+    off = 0
+    for name, arr in (
+        ("comic_id", comic_id),
+        ("chapter_count", chapter_count),
+        ("status", status),
+        ("offsets", offsets),
+        ("strings", strings),
+    ):
+        raw = arr.tobytes()
+        sections[name] = (off, arr.dtype.str, int(arr.size))
+        padded = _align8(len(raw))
+        payload.append(raw + b"\0" * (padded - len(raw)))
+        off += padded
+
+    header = json.dumps(
+        {
+            **header_extra,
+            "count": n,
+            "string_fields": list(STRING_FIELDS),
+            "status_labels": status_labels,
+            "ids_sorted": bool(n < 2 or np.all(comic_id[1:] > comic_id[:-1])),
+            "sections": sections,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+    head = MAGIC + len(header).to_bytes(8, "little") + header
+    head += b"\0" * (_align8(len(head)) - len(head))
+    return head + b"".join(payload)
+
+
+def write_metadata_store(path: Any, items: Sequence[Dict[str, Any]], **header_extra: Any) -> None:
+    """Ghi file tạm rồi os.replace -> worker đang mmap file cũ không bị ảnh hưởng."""
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(encode_metadata(items, **header_extra))
+    os.replace(tmp, path)
+
+
+class MetadataStore:
+    """View chỉ-đọc trên buffer do encode_metadata tạo ra (mmap hoặc bytes trong RAM)."""
+
+    def __init__(self, buf: np.ndarray, source: str = "memory"):
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError(f"{source}: not a comic metadata file")
+        header_len = int.from_bytes(bytes(buf[8:16]), "little")
+        self.header: Dict[str, Any] = json.loads(bytes(buf[16:16 + header_len]).decode("utf-8"))
+        self.source = source
+        self._buf = buf
+
+        base = _align8(16 + header_len)
+        cols: Dict[str, np.ndarray] = {}
+        for name, (off, dtype, length) in self.header["sections"].items():
+            if length == 0:
+                cols[name] = np.zeros(0, dtype=dtype)
+            else:
+                cols[name] = np.frombuffer(buf, dtype=dtype, count=length, offset=base + off)
+
+        self.comic_ids: np.ndarray = cols["comic_id"]
+        self.chapter_counts: np.ndarray = cols["chapter_count"]
+        self.status_codes: np.ndarray = cols["status"]
+        self._offsets: np.ndarray = cols["offsets"]
+        self._strings: np.ndarray = cols["strings"]
+
+        self.status_labels: List[str] = self.header["status_labels"]
+        self._field_pos = {f: i for i, f in enumerate(self.header["string_fields"])}
+        self._nf = len(self._field_pos)
+        self._id_to_row: Optional[Dict[int, int]] = None
+        if not self.header.get("ids_sorted"):
+            self._id_to_row = {int(cid): i for i, cid in enumerate(self.comic_ids.tolist())}
+
+    @classmethod
+    def open(cls, path: Any) -> "MetadataStore":
+        return cls(np.memmap(path, dtype="uint8", mode="r"), str(path))
+
+    @classmethod
+    def from_items(cls, items: Sequence[Dict[str, Any]], **header_extra: Any) -> "MetadataStore":
+        return cls(np.frombuffer(encode_metadata(items, **header_extra), dtype="uint8"))
+
+    @classmethod
+    def from_json(cls, path: Any) -> "MetadataStore":
+        """Đọc comic_faiss_metadata.json kiểu cũ (tương thích ngược)."""
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        items = meta.pop("items", [])
+        meta.pop("count", None)
+        return cls.from_items(items, **meta)
+
+    # ---------- lookup ----------
+    def __len__(self) -> int:
+        return int(self.header["count"])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._buf.nbytes)
+
+    def row_of_id(self, comic_id: int) -> Optional[int]:
+        if self._id_to_row is not None:
+            return self._id_to_row.get(int(comic_id))
+        i = int(np.searchsorted(self.comic_ids, comic_id))
+        if i < len(self.comic_ids) and int(self.comic_ids[i]) == int(comic_id):
+            return i
+        return None
+
+    def get_str(self, row: int, field: str) -> str:
+        k = row * self._nf + self._field_pos[field]
+        start, end = int(self._offsets[k]), int(self._offsets[k + 1])
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def status(self, row: int) -> Optional[str]:
+        return self.status_labels[int(self.status_codes[row])] or None
+
+    def get(self, row: int, field: str) -> Any:
+        if field == "comicId":
+            return int(self.comic_ids[row])
+        if field == "chapterCount":
+            return int(self.chapter_counts[row])
+        if field == "status":
+            return self.status(row)
+        return self.get_str(row, field)
+
+    def record(self, row: int, fields: Iterable[str] = RESULT_FIELDS) -> Dict[str, Any]:
+        return {f: self.get(row, f) for f in fields}
+
+    def column(self, field: str) -> List[Any]:
+        return [self.get(r, field) for r in range(len(self))]
+
+    def to_items(self) -> List[Dict[str, Any]]:
+        fields = ("comicId",) + STRING_FIELDS + ("status", "chapterCount")
+        return [self.record(r, fields) for r in range(len(self))]
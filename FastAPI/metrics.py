@@ -0,0 +1,233 @@
+"""
+Đo thời gian từng bước của request + xuất Prometheus text format ở /metrics
+(không phụ thuộc prometheus_client).
+
+- span("classify_intent") / observe_stage(...): ghi vào histogram rag_stage_seconds
+  và vào RequestTimer của request hiện tại (contextvar) -> header Server-Timing.
+- Bước chạy trong executor vẫn gắn đúng request nếu được gọi qua contextvars.copy_context();
+  bước chạy trong thread micro-batcher (phục vụ nhiều request một lúc) chỉ vào histogram.
+- add_collector: số liệu đọc lúc scrape (hit rate cache, batching...).
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# (tên, kiểu, help, [(labels, value)])
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_fmt_labels(dict(zip(self.labelnames, labels)))} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (đếm theo bucket (không cộng dồn), sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for labels, (counts, total, n) in items:
+            base = dict(zip(self.labelnames, labels))
+            acc = 0
+            for le, c in zip((*self.buckets, math.inf), counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_fmt_labels({**base, 'le': _fmt_value(le)})} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(base)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(base)} {n}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Thời gian từng bước xử lý", ["stage"])
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Thời gian request HTTP", ["method", "path", "status"])
+LLM_TOKENS = Histogram("rag_llm_tokens_per_call", "Số token mỗi lần gọi LLM", ["call", "kind"], TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = Counter("rag_llm_tokens_total", "Tổng token LLM", ["call", "kind"])
+INTENTS = Counter("rag_intent_total", "Số request theo intent và nguồn phân loại", ["intent", "source"])
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Lượt tra cache theo request", ["cache", "result"])
+PROMPT_TRIMMED = Counter("rag_prompt_trimmed_total", "Phần bị cắt khỏi prompt do vượt ngân sách", ["call", "what"])
+LLM_ATTEMPTS = Counter(
+    "rag_llm_attempts_total", "Lượt gửi tới provider LLM theo kết quả", ["provider", "call", "outcome"]
+)
+LLM_HEDGES = Counter("rag_llm_hedges_total", "Request hedge (gửi thêm bản thứ hai) theo kết quả", ["call", "result"])
+COALESCED = Counter("rag_coalesced_requests_total", "Request /chat theo vai trò khi gộp request trùng", ["role"])
+COALESCE_SAVED = Counter(
+    "rag_coalesce_saved_calls_total", "Lời gọi upstream không phải chạy lại nhờ gộp request trùng", ["call"]
+)
+ADMISSION_SHED = Counter("rag_admission_shed_total", "Request bị từ chối khi quá tải (429/503)", ["reason"])
+SERVING_MODE = Counter("rag_serving_mode_total", "Request theo chế độ phục vụ và lý do", ["mode", "reason"])
+
+_METRICS: List = [
+    STAGE_SECONDS,
+    HTTP_SECONDS,
+    LLM_TOKENS,
+    LLM_TOKENS_TOTAL,
+    INTENTS,
+    CACHE_LOOKUPS,
+    PROMPT_TRIMMED,
+    LLM_ATTEMPTS,
+    LLM_HEDGES,
+    COALESCED,
+    COALESCE_SAVED,
+    ADMISSION_SHED,
+    SERVING_MODE,
+]
+_COLLECTORS: List[Callable[[], Iterable[Family]]] = []
+
+
+def add_collector(fn: Callable[[], Iterable[Family]]) -> None:
+    _COLLECTORS.append(fn)
+
+
+# ---------- Timer theo request ----------
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Bước lặp lại trong cùng request (vd. 2 lần gọi LLM) được cộng dồn
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={sec * 1000.0:.1f}" for name, sec in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000.0:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def start_request() -> Tuple[RequestTimer, Token]:
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def end_request(token: Token) -> None:
+    _current.reset(token)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage)
+    timer = _current.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def record_tokens(call: str, prompt: Optional[int], completion: Optional[int]) -> None:
+    timer = _current.get()
+    for kind, n in (("prompt", prompt), ("completion", completion)):
+        if n is None:
+            continue
+        LLM_TOKENS.observe(n, call, kind)
+        LLM_TOKENS_TOTAL.inc(call, kind, amount=n)
+        if timer is not None:
+            timer.tokens[kind] = timer.tokens.get(kind, 0) + int(n)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache, "hit" if hit else "miss")
+
+
+def observe_http(method: str, path: str, status: int, seconds: float) -> None:
+    HTTP_SECONDS.observe(seconds, method, path, str(status))
+
+
+# ---------- Export ----------
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.extend(m.render())
+    for fn in _COLLECTORS:
+        try:
+            families = list(fn())
+        except Exception:
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
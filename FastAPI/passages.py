@@ -0,0 +1,121 @@
+"""
+Index passage: mỗi comic thành nhiều đoạn ngắn (cửa sổ chồng lấn của description,
+nhóm tên chương) để câu hỏi về nội dung không bị mất khi description dài hơn
+max_seq_length của model.
+
+File: storage/comic_passages.index (label = số thứ tự passage) +
+storage/comic_passages.npz (comicId của từng passage + header). ComicStore gộp
+điểm passage về comic bằng max hoặc sum pooling.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import read_index, search_params
+
+# ~60 âm tiết tiếng Việt vẫn nằm gọn trong 128 token của mpnet
+WINDOW_WORDS = 60
+STRIDE_WORDS = 45
+CHAPTER_TITLES_PER_PASSAGE = 20
+
+_WS_RE = re.compile(r"\s+")
+
+
+def chunk_words(text: str, window: int = WINDOW_WORDS, stride: int = STRIDE_WORDS) -> List[str]:
+    """Cửa sổ `window` từ, bước `stride` (chồng lấn window - stride từ); đoạn cuối luôn phủ hết text."""
+    words = _WS_RE.split((text or "").strip())
+    words = [w for w in words if w]
+    if not words:
+        return []
+    if len(words) <= window:
+        return [" ".join(words)]
+    chunks = []
+    for start in range(0, len(words), stride):
+        chunks.append(" ".join(words[start:start + window]))
+        if start + window >= len(words):
+            break
+    return chunks
+
+
+def build_passages(item: Dict[str, Any], chapter_titles: Sequence[str] = ()) -> List[str]:
+    """Passage có tiền tố tên truyện để đoạn giữa description vẫn gắn được với comic."""
+    title = item.get("title") or ""
+    out = [f"{title}: {chunk}" for chunk in chunk_words(item.get("description") or "")]
+    titles = [t.strip() for t in chapter_titles if t and t.strip()]
+    for i in range(0, len(titles), CHAPTER_TITLES_PER_PASSAGE):
+        out.append(f"{title} - Chương: " + "; ".join(titles[i:i + CHAPTER_TITLES_PER_PASSAGE]))
+    return out
+
+
+def write_passage_meta(path: Any, comic_ids: np.ndarray, **header: Any) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(
+        tmp,
+        comic_ids=np.asarray(comic_ids, dtype="int32"),
+        header=np.array(json.dumps({**header, "count": int(len(comic_ids))}, ensure_ascii=False)),
+    )
+    os.replace(tmp, path)
+
+
+class PassageIndex:
+    def __init__(self, index: faiss.Index, comic_ids: np.ndarray, header: Dict[str, Any]):
+        self.index = index
+        self.comic_ids = comic_ids
+        self.header = header
+        # Dòng metadata của từng passage, gán khi bind vào snapshot
+        self.rows: Optional[np.ndarray] = None
+
+    @classmethod
+    def load(cls, index_path: Any, meta_path: Any) -> "PassageIndex":
+        index = read_index(index_path)
+        with np.load(meta_path, allow_pickle=False) as z:
+            comic_ids = z["comic_ids"]
+            header = json.loads(str(z["header"]))
+        if index.ntotal != len(comic_ids):
+            raise ValueError(f"Passage index has {index.ntotal} vectors but {len(comic_ids)} passage ids")
+        return cls(index, comic_ids, header)
+
+    def __len__(self) -> int:
+        return len(self.comic_ids)
+
+    def bind(self, row_of_id) -> "PassageIndex":
+        """Map passage -> dòng metadata; passage của comic không còn trong metadata có row -1."""
+        rows = (row_of_id(int(cid)) for cid in self.comic_ids.tolist())
+        self.rows = np.array([-1 if r is None else r for r in rows], dtype="int64")
+        return self
+
+    def search(
+        self, q_mat: np.ndarray, k: int, row_mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(điểm, số thứ tự passage) như faiss; row_mask (bool theo dòng metadata) lọc ngay trong FAISS."""
+        if row_mask is None:
+            return self.index.search(q_mat, k)
+        allowed = (self.rows >= 0) & row_mask[np.clip(self.rows, 0, None)]
+        bitmap = np.packbits(allowed, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        sel.referenced_objects = [bitmap]
+        params = search_params(self.index, sel)
+        params.referenced_objects = [sel]
+        return self.index.search(q_mat, k, params=params)
+
+    def pool(self, scores: Sequence[float], labels: Sequence[int], how: str = "max") -> List[Tuple[int, float]]:
+        """Gộp hit passage thành (dòng metadata, điểm comic) giảm dần."""
+        agg: Dict[int, float] = {}
+        for score, label in zip(scores, labels):
+            if label < 0:
+                continue
+            row = int(self.rows[label])
+            if row < 0:
+                continue
+            if how == "sum":
+                # Chỉ cộng phần tương đồng dương, tránh passage lạc đề kéo điểm xuống
+                agg[row] = agg.get(row, 0.0) + max(float(score), 0.0)
+            else:
+                agg[row] = max(agg.get(row, float("-inf")), float(score))
+        return sorted(agg.items(), key=lambda x: -x[1])
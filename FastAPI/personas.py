@@ -1,5 +1,7 @@
 import re
 
+from text_utils import normalize_text, strip_accents
+
 BASIC_GREETINGS = [
     r"^(xin )?chào",
     r"^hi(\s.*|$)", 
@@ -8,6 +10,18 @@ BASIC_GREETINGS = [
     r"^hey",
 ]
 
+# Tán gẫu ngoài câu chào (viết không dấu, so khớp trên text đã bỏ dấu)
+SOCIAL_PATTERNS = [
+    r"\b(cam on|thank(s| you)?|tks|thx)\b",
+    r"\b(tam biet|bye|bai bai|good ?night|ngu ngon|hen gap lai)\b",
+    r"\b(ban|may|bot|em|cau|ong) (la ai|ten (la )?gi|bao nhieu tuoi|o dau|co nguoi yeu)",
+    r"\b(buon|chan|met|co don|stress|vui) (qua|that|ghe|vl|vai)\b",
+    r"\b(ke chuyen|noi chuyen|tam chuyen|choi voi|tro chuyen)\b",
+    r"\b(ngu the|ngu qua|ngu vay|do ngoc|gioi qua|hay qua|yeu (bot|ban|em|cau))\b",
+    r"\b(khoe khong|an com chua|dang lam gi|lam gi do)\b",
+    r"^(ok|oke|okay|uh|um|hihi|haha|hehe|lol|=\)\)|:\))\W*$",
+]
+
 def is_greeting(msg: str) -> bool:
     """Kiểm tra xem có phải câu chào hỏi cơ bản không"""
     msg_lower = msg.lower().strip()
@@ -96,7 +110,7 @@ Bạn là một cô gái TSUNDERE (Ngoài lạnh trong nóng).
 }
 
 def is_social_chat(text: str) -> bool:
-    t = (text or "").lower().strip()
+    t = strip_accents(normalize_text(text))
     for p in SOCIAL_PATTERNS:
         if re.search(p, t):
             return True
@@ -0,0 +1,218 @@
+"""
+Dựng message cho từng lần gọi LLM, giữ trong ngân sách token của lượt gọi đó.
+
+- Thứ tự message: system (persona + luật của loại gọi, cố định theo persona) ->
+  tóm tắt lượt cũ (nếu có) -> history -> user (phần thay đổi theo request).
+  Prefix không đổi giữa các request nên provider cache được prompt; history chỉ
+  nối thêm ở cuối nên prefix của cùng một hội thoại cũng giữ nguyên giữa các lượt.
+- Vượt ngân sách: bớt ứng viên xếp hạng thấp (giữ tối thiểu PROMPT_MIN_CANDIDATES),
+  rồi bỏ lượt history cũ nhất; lượt bị bỏ được tóm thành một dòng ngắn.
+- count_tokens là ước lượng (không cần tokenizer của provider), hơi dư cho tiếng Việt
+  có dấu; số token thật lấy từ usage của response (metrics.record_tokens).
+"""
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import (
+    HISTORY_MAX_TURNS,
+    HISTORY_SUMMARY_TOKENS,
+    HISTORY_TURN_MAX_CHARS,
+    PROMPT_BUDGET_FAQ,
+    PROMPT_BUDGET_INTENT,
+    PROMPT_BUDGET_SEARCH,
+    PROMPT_BUDGET_SOCIAL,
+    PROMPT_MIN_CANDIDATES,
+)
+from metrics import PROMPT_TRIMMED
+
+# Mỗi message tốn thêm vài token cho role / phân cách trong chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+MAX_CANDIDATES = 8
+
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+INTENT_SYSTEM = """Bạn là bộ phân loại ý định (Intent Classifier) cho chatbot website truyện tranh.
+Phân loại câu chat của user vào 1 trong 3 nhóm:
+1. SOCIAL: Chào hỏi, khen chê bot, tán gẫu vu vơ, cảm xúc (VD: "buồn quá", "kể chuyện đi", "mày tên gì", "ngu thế", "yêu bot").
+2. FAQ: Hỏi về cách dùng web, lỗi, tài khoản, nạp xu, tính năng web (VD: "làm sao để đăng ký", "web bị lỗi ảnh", "nạp tiền ở đâu").
+3. SEARCH: Muốn tìm truyện, hỏi về nội dung truyện, tìm theo thể loại (VD: "tìm truyện kinh dị", "truyện nào main bá", "naruto", "có truyện gì hay không").
+Ưu tiên trò chuyện xã giao (SOCIAL) nếu không chắc chắn lắm.
+Trả về JSON duy nhất: { "intent": "SOCIAL" | "FAQ" | "SEARCH" }"""
+
+SOCIAL_RULES = """NGỮ CẢNH: User đang trò chuyện xã giao (không tìm truyện).
+NHIỆM VỤ:
+- Trả lời user theo đúng tính cách trên.
+- Nếu user than buồn/vui, hãy chia sẻ cảm xúc.
+- Nếu user trêu chọc, hãy đáp trả thông minh.
+- Ngắn gọn (dưới 3 câu)."""
+
+SEARCH_RULES = """NHIỆM VỤ: User đang tìm truyện. Chọn 2-3 truyện phù hợp nhất trong danh sách ứng viên (dạng "#id Tên truyện").
+Giải thích ngắn gọn đúng tính cách.
+Format JSON: { "reply_text": "...", "recommendations": [{"comicId": 1, "title": "..."}] }"""
+
+SEARCH_STREAM_RULES = """NHIỆM VỤ: User đang tìm truyện. Chọn 2-3 truyện phù hợp nhất trong danh sách ứng viên (dạng "#id Tên truyện").
+Giải thích ngắn gọn đúng tính cách.
+Nhắc tên truyện được chọn CHÍNH XÁC như trong danh sách. Chỉ trả lời bằng văn bản, không dùng JSON."""
+
+FAQ_RULES = """NHIỆM VỤ: Trả lời câu hỏi của user dựa trên thông tin FAQ được cung cấp, theo giọng điệu persona. Ngắn gọn."""
+
+
+def count_tokens(text: str) -> int:
+    """Ước lượng: từ ASCII ~4 ký tự / token, âm tiết có dấu 1-2 token, mỗi dấu câu 1 token."""
+    n = 0
+    for m in _PIECE_RE.finditer(text or ""):
+        piece = m.group(0)
+        if piece.isascii():
+            n += (len(piece) + 3) // 4
+        else:
+            n += 2 if len(piece) > 2 else 1
+    return n
+
+
+def messages_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def clean_history(raw: Any, max_turns: int = HISTORY_MAX_TURNS, max_chars: int = HISTORY_TURN_MAX_CHARS) -> List[Dict[str, str]]:
+    """History từ client -> tối đa max_turns lượt gần nhất, mỗi lượt cắt max_chars ký tự."""
+    if not isinstance(raw, list):
+        return []
+    cleaned = []
+    for item in raw[-max_turns:]:
+        if not isinstance(item, dict):
+            continue
+        text = str(item.get("content") or "").strip()
+        if not text:
+            continue
+        role = "assistant" if item.get("role") == "assistant" else "user"
+        cleaned.append({"role": role, "content": text[:max_chars]})
+    return cleaned
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    """Cắt theo từ cho vừa max_tokens (ước lượng)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) + 1 <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + "…"
+
+
+@dataclass
+class Prompt:
+    messages: List[Dict[str, str]]
+    tokens: int
+    budget: int
+    dropped_turns: int = 0
+    dropped_candidates: int = 0
+
+
+class PromptBuilder:
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, min_candidates: int = PROMPT_MIN_CANDIDATES):
+        self.budgets = {
+            "intent": PROMPT_BUDGET_INTENT,
+            "social": PROMPT_BUDGET_SOCIAL,
+            "search": PROMPT_BUDGET_SEARCH,
+            "faq": PROMPT_BUDGET_FAQ,
+            **(budgets or {}),
+        }
+        self.min_candidates = min_candidates
+
+    # ---------- Khối cố định ----------
+    @staticmethod
+    def _system(persona: Dict[str, Any], rules: str) -> Dict[str, str]:
+        return {"role": "system", "content": f'{persona["instruction"].strip()}\n\n{rules}'}
+
+    @staticmethod
+    def _summary(dropped: List[Dict[str, str]], max_tokens: int) -> Optional[Dict[str, str]]:
+        """Các câu user đã hỏi trong phần history bị bỏ, mỗi câu vài chữ đầu."""
+        asks = [" ".join(h["content"].split()[:8]) for h in dropped if h["role"] == "user"]
+        if not asks or max_tokens <= MESSAGE_OVERHEAD_TOKENS + 8:
+            return None
+        text = "Tóm tắt các lượt trước: user đã hỏi " + "; ".join(f'"{a}"' for a in asks)
+        text = _clip(text, max_tokens - MESSAGE_OVERHEAD_TOKENS)
+        return {"role": "system", "content": text}
+
+    def _fit(
+        self,
+        call: str,
+        system: Dict[str, str],
+        history: List[Dict[str, str]],
+        user_head: str,
+        lines: Sequence[str] = (),
+    ) -> Prompt:
+        budget = self.budgets[call]
+        used = messages_tokens([system, {"role": "user", "content": user_head}])
+
+        # Ứng viên theo thứ tự xếp hạng, luôn giữ tối thiểu min_candidates
+        kept_lines: List[str] = []
+        for i, line in enumerate(lines):
+            cost = count_tokens(line) + 1
+            if i >= self.min_candidates and used + cost > budget:
+                break
+            kept_lines.append(line)
+            used += cost
+        dropped_candidates = len(lines) - len(kept_lines)
+
+        # History mới nhất trước, dừng ở lượt đầu tiên không vừa; sẽ phải bỏ lượt thì chừa chỗ cho tóm tắt
+        costs = [count_tokens(turn["content"]) + MESSAGE_OVERHEAD_TOKENS for turn in history]
+        limit = budget - (HISTORY_SUMMARY_TOKENS if used + sum(costs) > budget else 0)
+        kept: List[Dict[str, str]] = []
+        for turn, cost in zip(reversed(history), reversed(costs)):
+            if used + cost > limit:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+        dropped = history[: len(history) - len(kept)]
+
+        messages = [system]
+        if dropped:
+            summary = self._summary(dropped, min(HISTORY_SUMMARY_TOKENS, max(budget - used, 0)))
+            if summary is not None:
+                messages.append(summary)
+                used += count_tokens(summary["content"]) + MESSAGE_OVERHEAD_TOKENS
+        messages.extend(kept)
+        user = user_head if not kept_lines else user_head + "\n" + "\n".join(kept_lines)
+        messages.append({"role": "user", "content": user})
+
+        if dropped:
+            PROMPT_TRIMMED.inc(call, "history_turns", amount=len(dropped))
+        if dropped_candidates:
+            PROMPT_TRIMMED.inc(call, "candidates", amount=dropped_candidates)
+        return Prompt(messages, used, budget, len(dropped), dropped_candidates)
+
+    # ---------- Từng loại gọi ----------
+    def intent(self, message: str) -> Prompt:
+        budget = self.budgets["intent"]
+        system = {"role": "system", "content": INTENT_SYSTEM}
+        room = budget - messages_tokens([system]) - MESSAGE_OVERHEAD_TOKENS
+        return self._fit("intent", system, [], _clip(message, max(room, 16)))
+
+    def social(self, message: str, persona: Dict[str, Any], history: List[Dict[str, str]]) -> Prompt:
+        return self._fit("social", self._system(persona, SOCIAL_RULES), history, message)
+
+    def search(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        persona: Dict[str, Any],
+        history: List[Dict[str, str]],
+        stream: bool = False,
+    ) -> Prompt:
+        lines = [f'#{c.get("comicId")} {c.get("title")}' for c in candidates[:MAX_CANDIDATES]]
+        rules = SEARCH_STREAM_RULES if stream else SEARCH_RULES
+        return self._fit("search", self._system(persona, rules), history, f'User tìm truyện: "{query}"\nỨng viên:', lines)
+
+    def faq(self, query: str, faq_title: str, faq_content: str, persona: Dict[str, Any]) -> Prompt:
+        system = self._system(persona, FAQ_RULES)
+        head = f'User hỏi: "{query}"\nThông tin FAQ: "{faq_title}" - '
+        room = self.budgets["faq"] - messages_tokens([system, {"role": "user", "content": head}]) - 2
+        return self._fit("faq", system, [], head + f'"{_clip(faq_content, max(room, 32))}"')
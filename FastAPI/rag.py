@@ -1,25 +1,63 @@
+import asyncio
+import contextvars
+import copy
 import json
 import logging
-from typing import Any, Dict, List, Optional
-
-from groq import Groq
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from config import (
-    GROQ_API_KEY,
-    GROQ_MODEL_NAME,
     TOP_N_FINAL,
     FAQ_JSON_PATH,
     FAQ_MIN_SCORE,
     FAQ_TOP_K,
+    FAQ_BM25_WEIGHT,
+    FAQ_REPLY_CACHE_SIZE,
+    FAQ_REPLY_CACHE_TTL_S,
+    EMBED_MAX_WORKERS,
+    INTENT_TIMEOUT_S,
+    SEARCH_TIMEOUT_S,
+    LLM_TIMEOUT_S,
+    TOP_K_CANDIDATES,
+    EXACT_MATCH_SKIP_LLM,
+    SEARCH_BATCH_TIMEOUT_S,
+    SPECULATIVE_RETRIEVAL,
+    LOCAL_INTENT_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL_S,
+    RESPONSE_CACHE_MIN_SIM,
+    RESPONSE_CACHE_HISTORY_TURNS,
+    COALESCE_ENABLED,
+    STORE_MODE,
 )
+from admission import DEGRADED, FULL, AdmissionController, llm_fell_back, note_llm_fallback, serving, serving_mode
 from comic_store import ComicStore
+from embed_cache import TTLCache
+from faq_index import FaqIndex
+from filters import NO_FILTER, SearchFilter
+from intent import IntentClassifier
+from llm_client import LLMClient
+from metrics import INTENTS, observe_stage, record_cache, record_tokens, span
+from response_cache import SemanticResponseCache, history_key
 # Import hàm check greeting mới
 from personas import PERSONAS, is_greeting 
+from prompts import PromptBuilder, clean_history
+from singleflight import SingleFlight, note_upstream
+from text_utils import normalize_text
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Chỉ cache câu trả lời có nội dung; "no" (không tìm thấy) để lần sau thử lại
+CACHEABLE_INTENTS = {"SOCIAL", "FAQ", "SEARCH_COMIC"}
+
 
-# ================= FAQ HELPER (Giữ nguyên) =================
+# ================= FAQ HELPER =================
 
 def load_faq_items() -> List[Dict[str, Any]]:
     try:
@@ -29,192 +67,501 @@ def load_faq_items() -> List[Dict[str, Any]]:
     except Exception:
         return []
 
-def score_faq_match(query: str, faq: Dict[str, Any]) -> float:
-    q = (query or "").lower()
-    title = (faq.get("title") or "").lower()
-    content = (faq.get("content") or "").lower()
-    keywords = faq.get("keywords") or []
-
-    score = 0.0
-    for kw in keywords:
-        if kw and str(kw).lower().strip() in q:
-            score += 3.0
-    if q and (q in title or q in content):
-        score += 1.5
-    return score
-
-def find_best_faq(query: str, faqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    scored = []
-    for f in faqs:
-        s = score_faq_match(query, f)
-        if s > 0:
-            scored.append((s, f))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    
-    best = []
-    for s, f in scored[:FAQ_TOP_K]:
-        if s >= FAQ_MIN_SCORE:
-            best.append({**f, "score": s})
-    return best
+def find_best_faq(query: str, index: FaqIndex) -> List[Dict[str, Any]]:
+    with span("faq_match"):
+        return index.search(query, FAQ_TOP_K, FAQ_MIN_SCORE)
+
+
+# ================= SPECULATION STATS =================
+
+@dataclass
+class SpeculationStats:
+    """Đếm số lần retrieval chạy song song với classify_intent bị dùng / bỏ phí."""
+    started: int = 0
+    search_used: int = 0
+    search_wasted: int = 0
+    faq_used: int = 0
+    faq_wasted: int = 0
+    wasted_search_ms: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class _Speculation:
+    search: Optional["asyncio.Task"] = None
+    faq_hits: Optional[List[Dict[str, Any]]] = None
+    started_at: float = 0.0
 
 
 # ================= RAG BOT CLASS (LOGIC MỚI) =================
 
 class RAGBot:
     def __init__(self):
-        self.store = ComicStore()
-        self.faqs = load_faq_items()
-
-        self.llm = None
-        if GROQ_API_KEY:
-            self.llm = Groq(api_key=GROQ_API_KEY)
+        if STORE_MODE == "remote":
+            # Model + index nằm ở store_service.py, worker chỉ giữ kết nối
+            from store_service import RemoteComicStore
 
-        logger.info("Groq enabled: %s", bool(self.llm))
+            self.store = RemoteComicStore()
+        else:
+            self.store = ComicStore()
+        self.faqs = load_faq_items()
+        self.faq_index = FaqIndex(self.faqs, bm25_weight=FAQ_BM25_WEIGHT)
+        self.intent_clf = IntentClassifier(
+            encode_fn=self.store.encode_texts if LOCAL_INTENT_ENABLED else None,
+            faqs=self.faqs,
+        )
+
+        # Groq / Gemini (hoặc stub) sau một client: hạn chót, hedge, failover, breaker
+        self.llm = LLMClient.from_config()
+        logger.info("LLM providers: %s", ", ".join(self.llm.names) if self.llm else "disabled")
+        self.prompts = PromptBuilder()
+        # Quá tải / LLM lỗi nhiều -> request chạy degraded (không gọi LLM), quá sức chứa -> 429/503
+        self.admission = AdmissionController(llm_available=self.llm is not None)
         self.default_persona_id = "1"
-        self._faq_cache: Dict[str, str] = {}
+        self._faq_cache = TTLCache(FAQ_REPLY_CACHE_SIZE, FAQ_REPLY_CACHE_TTL_S)
+        self.spec_stats = SpeculationStats()
+        # (loop, message chuẩn hóa) -> encode đang chạy, xem _encode
+        self._encoding: Dict[Tuple[Any, str], "asyncio.Future[Any]"] = {}
+        self.flights = SingleFlight()
+        self.response_cache = SemanticResponseCache(
+            RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_S, RESPONSE_CACHE_MIN_SIM
+        )
+        self.response_cache.set_index_version(self.store.version)
+
+        # encode + FAISS là CPU-bound -> chạy trong executor giới hạn, không chiếm event loop
+        self._executor = ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS, thread_name_prefix="rag-embed")
+        # Event loop riêng cho wrapper đồng bộ (script/CLI)
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_lock = threading.Lock()
+
+    # ---------- Async plumbing ----------
+    async def _run_blocking(self, timeout: float, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        # Mang contextvars sang thread để span trong store vẫn gắn vào timer của request
+        ctx = contextvars.copy_context()
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, ctx.run, fn, *args), timeout)
+
+    async def _await_future(self, timeout: float, fut: "Future[T]") -> T:
+        """Chờ Future của micro-batcher mà không giữ thread executor trong lúc đợi gom batch."""
+        return await asyncio.wait_for(asyncio.wrap_future(fut), timeout)
+
+    async def _encode(self, msg: str) -> Any:
+        """Vector của msg; intent centroid và search đoán trước cùng lúc thì chỉ encode một lần."""
+        k = (asyncio.get_running_loop(), normalize_text(msg))
+        fut = self._encoding.get(k)
+        if fut is None:
+            fut = asyncio.ensure_future(self._encode_now(msg))
+            self._encoding[k] = fut
+            fut.add_done_callback(lambda f: self._forget_encode(k, f))
+        return await asyncio.shield(fut)
+
+    async def _encode_now(self, msg: str) -> Any:
+        note_upstream("encode")
+        if self.store.batching:
+            return await self._await_future(SEARCH_TIMEOUT_S, self.store.submit_encode(msg))
+        return await self._run_blocking(SEARCH_TIMEOUT_S, self.store.encode_query, msg)
+
+    def _forget_encode(self, k: Tuple[Any, str], fut: "asyncio.Future[Any]") -> None:
+        if self._encoding.get(k) is fut:
+            del self._encoding[k]
+        # Người chờ bị hủy hết -> không ai đọc exception
+        if not fut.cancelled():
+            fut.exception()
+
+    async def _complete(self, timeout: float = LLM_TIMEOUT_S, call: str = "chat", **kwargs: Any) -> str:
+        """`call` (intent/social/search/faq) là nhãn của span "llm_<call>" và metric token."""
+        note_upstream(f"llm_{call}")
+        try:
+            with span(f"llm_{call}"):
+                res = await self.llm.complete(call=call, timeout=timeout, **kwargs)
+        except Exception:
+            self.admission.record_llm(False)
+            raise
+        self.admission.record_llm(True)
+        record_tokens(call, res.prompt_tokens, res.completion_tokens)
+        return res.content
+
+    async def _stream_complete(
+        self, timeout: float = LLM_TIMEOUT_S, call: str = "chat", **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """Stream delta text; `timeout` là hạn chót cho cả lượt sinh."""
+        t0 = time.perf_counter()
+        first_token = True
+        try:
+            async for chunk in self.llm.stream(call=call, timeout=timeout, **kwargs):
+                if chunk.has_usage:
+                    record_tokens(call, chunk.prompt_tokens, chunk.completion_tokens)
+                if chunk.text:
+                    if first_token:
+                        first_token = False
+                        observe_stage(f"llm_{call}_first_token", time.perf_counter() - t0)
+                    yield chunk.text
+        except Exception:
+            self.admission.record_llm(False)
+            raise
+        else:
+            self.admission.record_llm(True)
+        finally:
+            observe_stage(f"llm_{call}", time.perf_counter() - t0)
+
+    async def _search_candidates(self, msg: str) -> Tuple[List[Dict[str, Any]], float]:
+        """Embedding + FAISS trong executor; trả về (candidates, thời gian ms)."""
+        note_upstream("search")
+        t0 = time.perf_counter()
+        try:
+            # Intent centroid đang encode đúng câu này (speculative) -> chờ xong, search bên dưới hit cache
+            pending = self._encoding.get((asyncio.get_running_loop(), normalize_text(msg)))
+            if pending is not None:
+                # wait: encode lỗi thì search tự encode lại, không hỏng theo
+                await asyncio.wait((pending,))
+            filters = self.store.parse_filters(msg)
+            candidates: List[Dict[str, Any]] = []
+            if not filters.is_empty:
+                logger.info(f"Search filters: {filters.as_dict()}")
+                candidates, _ = await self._run_blocking(
+                    SEARCH_TIMEOUT_S, self.store.search, msg, TOP_K_CANDIDATES, filters
+                )
+            # Không có filter, hoặc filter quá chặt không còn truyện nào -> search thường
+            if not candidates:
+                if self.store.batching:
+                    candidates, _ = await self._await_future(SEARCH_TIMEOUT_S, self.store.submit_search(msg))
+                else:
+                    candidates, _ = await self._run_blocking(SEARCH_TIMEOUT_S, self.store.search, msg)
+        except Exception as e:
+            logger.error(f"Search Error: {e}")
+            candidates = []
+        elapsed = time.perf_counter() - t0
+        observe_stage("retrieval", elapsed)
+        return candidates, elapsed * 1000.0
+
+    def _discard_search(self, task: "asyncio.Task", started_at: float) -> None:
+        """Bỏ nhánh search đoán trước, cộng phần việc đã tốn vào wasted."""
+        self.spec_stats.search_wasted += 1
+        if task.done() and not task.cancelled():
+            self.spec_stats.wasted_search_ms += task.result()[1]
+        else:
+            # Thread trong executor vẫn chạy nốt, chỉ tính phần đã trôi qua
+            task.cancel()
+            self.spec_stats.wasted_search_ms += (time.perf_counter() - started_at) * 1000.0
+
+    def _run_sync(self, coro: Awaitable[T]) -> T:
+        """Chạy coroutine trên loop nền dùng chung, để client async luôn gắn với một loop."""
+        with self._sync_lock:
+            if self._sync_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="rag-sync-loop", daemon=True).start()
+                self._sync_loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._sync_loop).result()
+
+    async def aclose(self) -> None:
+        if self.llm is not None:
+            await self.llm.aclose()
+        self._executor.shutdown(wait=False)
+        self.store.close()
 
     # ---------- Helpers ----------
+    def _llm_enabled(self) -> bool:
+        """False khi không có provider hoặc request hiện tại chạy degraded."""
+        return self.llm is not None and serving_mode() == FULL
+
+    def _with_mode(self, result: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+        """Bản sao payload kèm chế độ đã phục vụ: full | degraded | cache.
+        Câu dự phòng sau lỗi LLM tính là degraded dù request được nhận ở chế độ full."""
+        if mode is None:
+            mode = FULL if self._llm_enabled() and not llm_fell_back() else DEGRADED
+        return {**result, "mode": mode}
+
+    @staticmethod
+    def _is_greeting(msg: str) -> bool:
+        with span("is_greeting"):
+            return is_greeting(msg)
+
     def _persona(self, persona_id: Optional[str]) -> Dict[str, Any]:
         pid = str(persona_id or self.default_persona_id)
         # Fallback về 1 nếu pid không tồn tại
         return PERSONAS.get(pid, PERSONAS.get("1"))
 
     def _extract_history(self, ctx: Dict[str, Any]) -> List[Dict[str, str]]:
-        raw = ctx.get("history") or []
-        if not isinstance(raw, list):
-            return []
-        cleaned = []
-        for item in raw[-10:]:
-            if isinstance(item, dict) and item.get("content"):
-                cleaned.append({"role": item.get("role"), "content": item.get("content")[:800]})
-        return cleaned
-
-    def _history_text(self, history: List[Dict[str, str]]) -> str:
-        if not history: return ""
-        return "\n".join([f"{'User' if h['role']=='user' else 'Bot'}: {h['content']}" for h in history])
-
-    def _build_candidates_text(self, candidates: List[Dict[str, Any]]) -> str:
-        lines = []
-        for i, c in enumerate(candidates[:8], start=1):
-            lines.append(f'[{i}] id={c.get("comicId")}, title="{c.get("title")}"')
-        return "\n".join(lines)
+        return clean_history(ctx.get("history"))
 
     # ================= 1. INTENT CLASSIFIER (PHÂN LOẠI Ý ĐỊNH) =================
     
     def classify_intent(self, message: str) -> Dict[str, Any]:
+        return self._run_sync(self.aclassify_intent(message))
+
+    async def aclassify_intent(self, message: str) -> Dict[str, Any]:
+        """
+        Pattern -> centroid embedding -> LLM. Chỉ câu không đủ tự tin mới tốn round-trip Groq.
+        """
+        if LOCAL_INTENT_ENABLED:
+            local = self.intent_clf.classify_rules(message)
+            if local is None:
+                try:
+                    local = await self._centroid_intent(message)
+                except Exception as e:
+                    logger.error(f"Local Intent Error: {e}")
+            if local is not None:
+                return local
+
+        if not self._llm_enabled():
+            # Không gọi LLM: khớp FAQ đủ điểm thì trả FAQ, còn lại tìm truyện (fallback an toàn)
+            if find_best_faq(message, self.faq_index):
+                return {"intent": "FAQ", "source": "fallback"}
+            return {"intent": "SEARCH", "source": "fallback"}
+        return await self._aclassify_with_llm(message)
+
+    async def _centroid_intent(self, message: str) -> Optional[Dict[str, Any]]:
+        if self.intent_clf.centroids is None:
+            return None
+        # Dùng chung lần encode với search đoán trước; vector vào cache embedding cho search phía sau
+        q_vec = await self._encode(message)
+        return await self._run_blocking(SEARCH_TIMEOUT_S, self.intent_clf.classify_centroid, message, q_vec)
+
+    async def _aclassify_with_llm(self, message: str) -> Dict[str, Any]:
         """
         Dùng LLM xác định user muốn: SOCIAL (Tám chuyện), FAQ (Hỏi lỗi/HDSD) hay SEARCH (Tìm truyện)
         """
-        if not self.llm:
-            return {"intent": "SEARCH"} # Fallback an toàn
-
-        prompt = f"""
-Bạn là bộ phân loại ý định (Intent Classifier).
-Câu chat của User: "{message}"
-
-Hãy phân loại câu trên vào 1 trong 3 nhóm sau:
-1. SOCIAL: Chào hỏi, khen chê bot, tán gẫu vu vơ, cảm xúc (VD: "buồn quá", "kể chuyện đi", "mày tên gì", "ngu thế", "yêu bot").
-2. FAQ: Hỏi về cách dùng web, lỗi, tài khoản, nạp xu, tính năng web (VD: "làm sao để đăng ký", "web bị lỗi ảnh", "nạp tiền ở đâu").
-3. SEARCH: Muốn tìm truyện, hỏi về nội dung truyện, tìm theo thể loại (VD: "tìm truyện kinh dị", "truyện nào main bá", "naruto", "có truyện gì hay không").
-ưu tiên trò chuyện xã giao (SOCIAL) nếu không chắc chắn lắm.
-Trả về JSON duy nhất: {{ "intent": "SOCIAL" | "FAQ" | "SEARCH" }}
-"""
         try:
-            res = self.llm.chat.completions.create(
-                model=GROQ_MODEL_NAME, 
-                messages=[{"role": "user", "content": prompt}],
+            content = await self._complete(
+                timeout=INTENT_TIMEOUT_S,
+                call="intent",
+                messages=self.prompts.intent(message).messages,
                 temperature=0.0,
-                response_format={"type": "json_object"},
+                json_mode=True,
                 max_tokens=50
             )
-            return json.loads(res.choices[0].message.content)
+            return {**json.loads(content), "source": "llm"}
         except Exception as e:
             logger.error(f"Intent Error: {e}")
-            return {"intent": "SEARCH"}
+            note_llm_fallback("intent")
+            return {"intent": "SEARCH", "source": "fallback"}
 
     # ================= 2. SOCIAL CHAT GENERATOR =================
 
-    def _chat_social_with_llm(self, message: str, persona: Dict[str, Any], history: List[Dict[str, str]]) -> str:
+    async def _chat_social_with_llm(self, message: str, persona: Dict[str, Any], history: List[Dict[str, str]]) -> str:
         """Sinh câu trả lời xã giao dựa trên tính cách"""
-        if not self.llm:
+        if not self._llm_enabled():
             return persona["social_response"]
 
-        hist_txt = self._history_text(history)
-        prompt = f"""
-{persona["instruction"]}
-
-NGỮ CẢNH: User đang trò chuyện xã giao (không tìm truyện).
-Lịch sử chat:
-{hist_txt}
-
-User: "{message}"
-
-NHIỆM VỤ:
-- Trả lời user theo đúng tính cách trên.
-- Nếu user than buồn/vui, hãy chia sẻ cảm xúc.
-- Nếu user trêu chọc, hãy đáp trả thông minh.
-- Ngắn gọn (dưới 3 câu).
-"""
+        prompt = self.prompts.social(message, persona, history)
         try:
-            res = self.llm.chat.completions.create(
-                model=GROQ_MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
+            content = await self._complete(
+                call="social",
+                messages=prompt.messages,
                 temperature=0.8, # Tăng nhiệt độ để sáng tạo hơn
                 max_tokens=150
             )
-            return res.choices[0].message.content.strip()
-        except Exception:
+            return content.strip()
+        except Exception as e:
+            logger.error(f"Social LLM Error: {e}")
+            note_llm_fallback("social")
             return persona["social_response"]
 
     # ================= 3. LOGIC SEARCH & FAQ (Như cũ) =================
-    
-    def _call_llm_search(self, user_query, candidates, persona, history):
-        # ... (Copy lại hàm _call_llm_search từ code cũ của bạn) ...
-        # Để tiết kiệm không gian tôi viết tắt, bạn paste lại đoạn code cũ vào đây nhé
-        if not self.llm: return {"reply_text": "", "recommendations": []}
-        
-        hist_txt = self._history_text(history)
-        prompt = f"""
-{persona["instruction"]}
-User tìm truyện: "{user_query}"
-Danh sách ứng viên:
-{self._build_candidates_text(candidates)}
-
-Lịch sử: {hist_txt}
-
-Yêu cầu: Chọn 2-3 truyện phù hợp nhất. Giải thích ngắn gọn đúng tính cách.
-Format JSON: {{ "reply_text": "...", "recommendations": [{{"comicId": 1, "title": "..."}}] }}
-"""
+
+    async def _call_llm_search(self, user_query, candidates, persona, history):
+        if not self._llm_enabled(): return {"reply_text": "", "recommendations": []}
+
+        prompt = self.prompts.search(user_query, candidates, persona, history)
         try:
-            res = self.llm.chat.completions.create(
-                model=GROQ_MODEL_NAME, messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"}, temperature=0.5
+            content = await self._complete(
+                call="search",
+                messages=prompt.messages,
+                json_mode=True, temperature=0.5
             )
-            return json.loads(res.choices[0].message.content)
-        except: return {"reply_text": "", "recommendations": []}
+            return json.loads(content)
+        except Exception as e:
+            logger.error(f"Search LLM Error: {e}")
+            note_llm_fallback("search")
+            return {"reply_text": "", "recommendations": []}
 
-    def _call_llm_faq(self, user_query, faq_title, faq_content, persona, history, cache_key):
-        if cache_key in self._faq_cache: return self._faq_cache[cache_key]
-        if not self.llm: return faq_content
-        
-        prompt = f"""
-{persona["instruction"]}
-User hỏi: "{user_query}"
-Thông tin: "{faq_title}" - "{faq_content}"
-Hãy trả lời lại theo giọng điệu persona. Ngắn gọn.
-"""
+    async def _call_llm_faq(self, user_query, faq_title, faq_content, persona, history, cache_key):
+        cached = self._faq_cache.get(cache_key)
+        record_cache("faq_reply", cached is not None)
+        if cached is not None: return cached
+        if not self._llm_enabled(): return faq_content
+
+        prompt = self.prompts.faq(user_query, faq_title, faq_content, persona)
         try:
-            res = self.llm.chat.completions.create(
-                model=GROQ_MODEL_NAME, messages=[{"role": "user", "content": prompt}]
-            )
-            text = res.choices[0].message.content.strip()
-            self._faq_cache[cache_key] = text
+            text = (await self._complete(call="faq", messages=prompt.messages)).strip()
+            self._faq_cache.put(cache_key, text)
             return text
-        except: return faq_content
+        except Exception as e:
+            logger.error(f"FAQ LLM Error: {e}")
+            note_llm_fallback("faq")
+            return faq_content
+
+    def _format_results(self, comics: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with span("format"):
+            return self._format_rows(comics)
+
+    @staticmethod
+    def _format_rows(comics: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "comicId": c.get("comicId"),
+                "title": c.get("title"),
+                "slug": c.get("slug"),
+                "genre": c.get("genre"),
+                "chapterCount": c.get("chapterCount"),
+                "status": c.get("status")
+            } for c in comics
+        ]
+
+    def _exact_hits(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Truyện trùng đúng tên với query; chỉ coi là chắc chắn khi không quá TOP_N_FINAL bộ."""
+        if not EXACT_MATCH_SKIP_LLM:
+            return []
+        hits = [c for c in candidates if c.get("match") == "exact"]
+        return hits if len(hits) <= TOP_N_FINAL else []
+
+    def _exact_result(self, exact: List[Dict[str, Any]]) -> Dict[str, Any]:
+        reply = "Mình tìm thấy đúng bộ này:" if len(exact) == 1 else "Mình tìm thấy vài bộ này:"
+        return {"intent": "SEARCH_COMIC", "reply": reply, "results": self._format_results(exact)}
+
+    # ================= SPECULATION =================
+
+    async def _classify_and_speculate(self, msg: str) -> Tuple[Dict[str, Any], _Speculation]:
+        """Speculative: chạy embedding/FAISS + chấm FAQ cùng lúc với classify_intent"""
+        spec = _Speculation(started_at=time.perf_counter())
+        if SPECULATIVE_RETRIEVAL:
+            intent_task = asyncio.create_task(self.aclassify_intent(msg))
+            spec.search = asyncio.create_task(self._search_candidates(msg))
+            spec.faq_hits = find_best_faq(msg, self.faq_index)
+            self.spec_stats.started += 1
+            with span("classify_intent"):
+                intent_data = await intent_task
+        else:
+            with span("classify_intent"):
+                intent_data = await self.aclassify_intent(msg)
+        INTENTS.inc(str(intent_data.get("intent")), str(intent_data.get("source")))
+
+        logger.info(f"User query: '{msg}' -> Detected Intent: {intent_data.get('intent')} ({intent_data.get('source')})")
+
+        if spec.faq_hits is not None and intent_data.get("intent") != "FAQ":
+            self.spec_stats.faq_wasted += 1
+        return intent_data, spec
+
+    def _drop_search(self, spec: _Speculation) -> None:
+        if spec.search is not None:
+            self._discard_search(spec.search, spec.started_at)
+
+    def _take_faq(self, msg: str, spec: _Speculation) -> List[Dict[str, Any]]:
+        if spec.faq_hits is not None:
+            self.spec_stats.faq_used += 1
+            return spec.faq_hits
+        return find_best_faq(msg, self.faq_index)
+
+    async def _take_search(self, msg: str, spec: _Speculation) -> List[Dict[str, Any]]:
+        if spec.search is not None:
+            candidates, _ = await spec.search
+            self.spec_stats.search_used += 1
+            return candidates
+        candidates, _ = await self._search_candidates(msg)
+        return candidates
+
+    async def asearch_batch(
+        self, queries: List[str], top_k: int, filters: SearchFilter = NO_FILTER
+    ) -> List[Dict[str, Any]]:
+        """Search nhiều query một lượt (job offline), không qua intent/LLM."""
+        res = await self._run_blocking(SEARCH_BATCH_TIMEOUT_S, self.store.search_many, queries, top_k, filters)
+        return [
+            {"query": q, "results": self._format_results(cands), "scores": [round(x, 4) for x in scores]}
+            for q, (cands, scores) in zip(queries, res)
+        ]
+
+    async def asimilar(
+        self, comic_id: int, limit: int, filters: SearchFilter = NO_FILTER
+    ) -> Optional[Dict[str, Any]]:
+        """Truyện tương tự từ bảng tính sẵn; None nếu comic chưa có trong bảng (hoặc chưa build bảng)."""
+        res = await self._run_blocking(SEARCH_TIMEOUT_S, self.store.similar, comic_id, limit, filters)
+        if res is None:
+            return None
+        cands, scores = res
+        return {"comicId": comic_id, "results": self._format_results(cands), "scores": [round(x, 4) for x in scores]}
 
     # ================= MAIN PROCESS =================
 
     def process(self, message: str, context: Optional[Dict[str, Any]] = None, persona_id: Optional[str] = None) -> Dict[str, Any]:
+        """Wrapper đồng bộ cho script/CLI; API dùng aprocess."""
+        return self._run_sync(self.aprocess(message, context=context, persona_id=persona_id))
+
+    async def _cache_probe(
+        self, msg: str, context: Optional[Dict[str, Any]], persona_id: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, str, Any, SearchFilter]]]:
+        """(payload cache hit, key để lưu sau); key None = không dùng cache cho request này.
+        Filter parse từ câu nằm trong key: câu gần giống nhưng khác điều kiện không dùng chung câu trả lời."""
+        if not RESPONSE_CACHE_ENABLED or not msg or self._is_greeting(msg):
+            return None, None
+
+        pid = str(persona_id or self.default_persona_id)
+        hkey = history_key(self._extract_history(context or {}), RESPONSE_CACHE_HISTORY_TURNS)
+        self.response_cache.set_index_version(self.store.version)
+        try:
+            flt = self.store.parse_filters(msg)
+            q_vec = await self._encode(msg)
+        except Exception as e:
+            logger.error(f"Encode Error: {e}")
+            return None, None
+        with span("cache_lookup"):
+            cached = self.response_cache.lookup(pid, hkey, q_vec, flt)
+        record_cache("response", cached is not None)
+        return cached, (pid, hkey, q_vec, flt)
+
+    def _cache_store(self, key: Optional[Tuple[str, str, Any, SearchFilter]], result: Dict[str, Any]) -> None:
+        # Câu trả lời degraded (không qua LLM) hay dự phòng sau lỗi LLM không cache,
+        # hết quá tải / provider hồi lại là có câu trả lời đầy đủ
+        if (
+            key is not None
+            and result.get("intent") in CACHEABLE_INTENTS
+            and self._llm_enabled()
+            and not llm_fell_back()
+        ):
+            pid, hkey, q_vec, flt = key
+            self.response_cache.store(pid, hkey, q_vec, result, flt)
+
+    def _flight_key(self, message: str, context: Optional[Dict[str, Any]], persona_id: Optional[str]) -> Tuple[str, ...]:
+        """Hai request chỉ gộp khi cùng message (chuẩn hóa), cùng persona, history giống hệt (hoặc cùng rỗng)
+        và cùng chế độ (request degraded không chờ lượt LLM của request full)."""
+        history = self._extract_history(context or {})
+        return (
+            normalize_text(message),
+            str(persona_id or self.default_persona_id),
+            history_key(history, len(history)),
+            serving_mode(),
+        )
+
+    async def aprocess(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        persona_id: Optional[str] = None,
+        mode: str = FULL,
+    ) -> Dict[str, Any]:
+        """`mode` do admission control chọn; "degraded" = trả lời không qua LLM."""
+        with serving(mode):
+            if not COALESCE_ENABLED:
+                return await self._aprocess_cached(message, context, persona_id)
+            # Request giống hệt đang chạy -> chờ chung kết quả thay vì classify / search / LLM lại
+            result, shared = await self.flights.do(
+                self._flight_key(message, context, persona_id),
+                lambda: self._aprocess_cached(message, context, persona_id),
+            )
+        return copy.deepcopy(result) if shared else result
+
+    async def _aprocess_cached(self, message: str, context: Optional[Dict[str, Any]], persona_id: Optional[str]) -> Dict[str, Any]:
+        msg = (message or "").strip()
+        cached, key = await self._cache_probe(msg, context, persona_id)
+        if cached is not None:
+            return self._with_mode(cached, "cache")
+
+        result = await self._aprocess_uncached(message, context, persona_id)
+        self._cache_store(key, result)
+        return self._with_mode(result)
+
+    async def _aprocess_uncached(self, message: str, context: Optional[Dict[str, Any]] = None, persona_id: Optional[str] = None) -> Dict[str, Any]:
         msg = (message or "").strip()
         persona = self._persona(persona_id)
         history = self._extract_history(context or {})
@@ -222,37 +569,41 @@ Hãy trả lời lại theo giọng điệu persona. Ngắn gọn.
         if not msg:
             return {"intent": "no", "reply": "Bạn nhập nội dung giúp mình nhé.", "results": []}
 
-        if is_greeting(msg):
+        if self._is_greeting(msg):
              return {"intent": "SOCIAL", "reply": persona["social_response"], "results": []}
 
-        intent_data = self.classify_intent(msg)
+        intent_data, spec = await self._classify_and_speculate(msg)
         intent = intent_data.get("intent", "SEARCH")
-        
-        logger.info(f"User query: '{msg}' -> Detected Intent: {intent}")
 
         # ---------------- STEP 3: BRANCHING ----------------
         
         # === A. XỬ LÝ SOCIAL ===
         if intent == "SOCIAL":
-            reply = self._chat_social_with_llm(msg, persona, history)
+            self._drop_search(spec)
+            reply = await self._chat_social_with_llm(msg, persona, history)
             return {"intent": "SOCIAL", "reply": reply, "results": []}
 
         # === B. XỬ LÝ FAQ ===
         if intent == "FAQ":
-            faq_hits = find_best_faq(msg, self.faqs)
+            faq_hits = self._take_faq(msg, spec)
             if faq_hits:
+                self._drop_search(spec)
                 best = faq_hits[0]
                 cache_key = f'{persona_id}:{best["id"]}'
-                reply = self._call_llm_faq(msg, best["title"], best["content"], persona, history, cache_key)
+                reply = await self._call_llm_faq(msg, best["title"], best["content"], persona, history, cache_key)
                 return {"intent": "FAQ", "reply": reply, "results": []}
             # Nếu AI bảo là FAQ mà không tìm thấy FAQ nào trong DB -> Chuyển sang tìm truyện hoặc Social fallback
             # (Ở đây ta cho nó chạy xuống Search cho chắc ăn)
         
         # === C. XỬ LÝ SEARCH (Mặc định) ===
-        candidates, _ = self.store.search(msg)
-        
+        candidates = await self._take_search(msg, spec)
+
+        exact = self._exact_hits(candidates)
+        if exact:
+            return self._exact_result(exact)
+
         if candidates:
-            brain = self._call_llm_search(msg, candidates, persona, history)
+            brain = await self._call_llm_search(msg, candidates, persona, history)
             
             # Xử lý kết quả trả về từ LLM (như code cũ)
             recs = brain.get("recommendations") or []
@@ -269,19 +620,7 @@ Hãy trả lời lại theo giọng điệu persona. Ngắn gọn.
 
             reply_text = brain.get("reply_text") or "Mình tìm thấy vài bộ này:"
             
-            # Format output
-            results = [
-                {
-                    "comicId": c.get("comicId"),
-                    "title": c.get("title"),
-                    "slug": c.get("slug"),
-                    "genre": c.get("genre"),
-                    "chapterCount": c.get("chapterCount"),
-                    "status": c.get("status")
-                } for c in final_comics
-            ]
-            
-            return {"intent": "SEARCH_COMIC", "reply": reply_text, "results": results}
+            return {"intent": "SEARCH_COMIC", "reply": reply_text, "results": self._format_results(final_comics)}
 
         # ---------------- STEP 4: FALLBACK ----------------
         # Không phải Social, không có FAQ, Search không ra truyện
@@ -289,4 +628,139 @@ Hãy trả lời lại theo giọng điệu persona. Ngắn gọn.
             "intent": "no",
             "reply": persona["not_found_response"],
             "results": []
-        }
\ No newline at end of file
+        }
+
+    # ================= STREAMING =================
+
+    async def _stream_text(self, fallback: str, call: str = "chat", **kwargs: Any) -> AsyncIterator[str]:
+        """Token LLM; lỗi trước token đầu tiên thì trả fallback, lỗi giữa chừng thì dừng ở phần đã có.
+        Lỗi nào cũng ghi note_llm_fallback -> câu trả lời không cache."""
+        if not self._llm_enabled():
+            yield fallback
+            return
+        produced = False
+        try:
+            async for delta in self._stream_complete(call=call, **kwargs):
+                produced = True
+                yield delta
+        except Exception as e:
+            logger.error(f"Stream Error: {e}")
+            note_llm_fallback(call)
+        if not produced:
+            yield fallback
+
+    @staticmethod
+    def _pick_mentioned(reply: str, candidates: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """Đối chiếu reply với tên ứng viên (theo thứ tự xuất hiện trong reply)."""
+        text = reply.lower()
+        hits = []
+        for c in candidates[:8]:
+            title = (c.get("title") or "").lower()
+            pos = text.find(title) if title else -1
+            if pos >= 0:
+                hits.append((pos, c))
+        hits.sort(key=lambda x: x[0])
+        return [c for _, c in hits[:limit]]
+
+    async def astream(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        persona_id: Optional[str] = None,
+        mode: str = FULL,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Sự kiện cho /chat/stream: intent -> candidates (SEARCH) -> token... -> done.
+        "done" mang payload cuối giống aprocess.
+        """
+        with serving(mode):
+            async for ev in self._astream(message, context, persona_id):
+                yield ev
+
+    async def _astream(
+        self, message: str, context: Optional[Dict[str, Any]], persona_id: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        msg = (message or "").strip()
+        persona = self._persona(persona_id)
+        history = self._extract_history(context or {})
+
+        cached, key = await self._cache_probe(msg, context, persona_id)
+        if cached is not None:
+            yield {"event": "intent", "data": {"intent": cached.get("intent"), "source": "cache"}}
+            yield {"event": "done", "data": self._with_mode(cached, "cache")}
+            return
+
+        if not msg or self._is_greeting(msg):
+            result = await self._aprocess_uncached(message, context, persona_id)
+            yield {"event": "intent", "data": {"intent": result["intent"], "source": "rule"}}
+            yield {"event": "done", "data": self._with_mode(result)}
+            return
+
+        intent_data, spec = await self._classify_and_speculate(msg)
+        intent = intent_data.get("intent", "SEARCH")
+        yield {"event": "intent", "data": {"intent": intent, "source": intent_data.get("source")}}
+
+        result: Optional[Dict[str, Any]] = None
+        parts: List[str] = []
+
+        if intent == "SOCIAL":
+            self._drop_search(spec)
+            async for delta in self._stream_text(
+                persona["social_response"],
+                call="social",
+                messages=self.prompts.social(msg, persona, history).messages,
+                temperature=0.8,
+                max_tokens=150,
+            ):
+                parts.append(delta)
+                yield {"event": "token", "data": {"text": delta}}
+            result = {"intent": "SOCIAL", "reply": "".join(parts).strip(), "results": []}
+
+        elif intent == "FAQ" and (faq_hits := self._take_faq(msg, spec)):
+            self._drop_search(spec)
+            best = faq_hits[0]
+            cache_key = f'{persona_id}:{best["id"]}'
+            cached_reply = self._faq_cache.get(cache_key)
+            record_cache("faq_reply", cached_reply is not None)
+            if cached_reply is not None:
+                parts.append(cached_reply)
+                yield {"event": "token", "data": {"text": cached_reply}}
+            else:
+                async for delta in self._stream_text(
+                    best["content"],
+                    call="faq",
+                    messages=self.prompts.faq(msg, best["title"], best["content"], persona).messages,
+                ):
+                    parts.append(delta)
+                    yield {"event": "token", "data": {"text": delta}}
+                # Chỉ cache khi stream chạy hết không lỗi (lỗi giữa chừng = câu bị cắt)
+                if self._llm_enabled() and not llm_fell_back("faq"):
+                    self._faq_cache.put(cache_key, "".join(parts).strip())
+            result = {"intent": "FAQ", "reply": "".join(parts).strip(), "results": []}
+
+        if result is None:
+            candidates = await self._take_search(msg, spec)
+            exact = self._exact_hits(candidates)
+            if not candidates:
+                result = {"intent": "no", "reply": persona["not_found_response"], "results": []}
+            elif exact:
+                result = self._exact_result(exact)
+                yield {"event": "candidates", "data": {"results": result["results"]}}
+                yield {"event": "token", "data": {"text": result["reply"]}}
+            else:
+                # Candidates có ngay sau FAISS -> client hiển thị trước khi LLM viết xong
+                yield {"event": "candidates", "data": {"results": self._format_results(candidates[:TOP_N_FINAL])}}
+                async for delta in self._stream_text(
+                    "Mình tìm thấy vài bộ này:",
+                    call="search",
+                    messages=self.prompts.search(msg, candidates, persona, history, stream=True).messages,
+                    temperature=0.5,
+                ):
+                    parts.append(delta)
+                    yield {"event": "token", "data": {"text": delta}}
+                reply_text = "".join(parts).strip()
+                final_comics = self._pick_mentioned(reply_text, candidates, TOP_N_FINAL) or candidates[:3]
+                result = {"intent": "SEARCH_COMIC", "reply": reply_text, "results": self._format_results(final_comics)}
+
+        self._cache_store(key, result)
+        yield {"event": "done", "data": self._with_mode(result)}
@@ -0,0 +1,149 @@
+import copy
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from text_utils import normalize_text
+
+
+def history_key(history: List[Dict[str, str]], turns: int) -> str:
+    """Hash của `turns` lượt gần nhất; hai request chỉ dùng chung câu trả lời khi key trùng."""
+    if turns <= 0 or not history:
+        return ""
+    tail = history[-turns:]
+    raw = "\n".join(f'{h.get("role")}:{normalize_text(h.get("content", ""))}' for h in tail)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# (persona, history_key, filter đã parse)
+Bucket = Tuple[str, str, Hashable]
+
+
+class SemanticResponseCache:
+    """
+    Cache payload /chat theo (persona, embedding query, history, filter).
+    Hit khi cosine >= min_sim với một query cũ cùng persona + cùng history_key + cùng filter
+    (SearchFilter đã parse: "đã hoàn thành" / "chưa hoàn thành" gần nhau về embedding
+    nhưng ra kết quả khác) và cùng phiên bản index. Giới hạn số entry (LRU) + TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, min_sim: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.min_sim = float(min_sim)
+
+        self._ids = itertools.count()
+        # entry_id -> (bucket, vec, payload, expires_at)
+        self._entries: "OrderedDict[int, Tuple[Bucket, np.ndarray, Dict[str, Any], float]]" = OrderedDict()
+        # (persona, hist_key, filters) -> (entry_ids, ma trận vector) dựng lại khi bucket đổi
+        self._buckets: Dict[Bucket, Tuple[List[int], Optional[np.ndarray]]] = {}
+        self._lock = threading.Lock()
+        self.index_version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ---------- internal ----------
+    def _bucket_ids(self, bucket: Bucket) -> List[int]:
+        return self._buckets.setdefault(bucket, ([], None))[0]
+
+    def _drop(self, entry_id: int) -> None:
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._bucket_ids(bucket)
+        ids.remove(entry_id)
+        if ids:
+            self._buckets[bucket] = (ids, None)
+        else:
+            del self._buckets[bucket]
+
+    def _matrix(self, bucket: Bucket) -> Tuple[List[int], Optional[np.ndarray]]:
+        ids, mat = self._buckets.get(bucket, ([], None))
+        if ids and mat is None:
+            mat = np.vstack([self._entries[i][1] for i in ids])
+            self._buckets[bucket] = (ids, mat)
+        return ids, mat
+
+    # ---------- public ----------
+    def set_index_version(self, version: str) -> None:
+        """Index FAISS đổi -> kết quả SEARCH cũ không còn đúng, xóa sạch."""
+        with self._lock:
+            if self.index_version is not None and version != self.index_version:
+                self._entries.clear()
+                self._buckets.clear()
+                self.invalidations += 1
+            self.index_version = version
+
+    def lookup(
+        self, persona_id: str, hist_key: str, q_vec: np.ndarray, filters: Hashable = None
+    ) -> Optional[Dict[str, Any]]:
+        if self.max_entries == 0:
+            return None
+        q = np.asarray(q_vec, dtype="float32").reshape(-1)
+        now = time.monotonic()
+        with self._lock:
+            ids, mat = self._matrix((persona_id, hist_key, filters))
+            if mat is None:
+                self.misses += 1
+                return None
+            sims = mat @ q
+            best = int(np.argmax(sims))
+            entry_id = ids[best]
+            if float(sims[best]) < self.min_sim:
+                self.misses += 1
+                return None
+            if self._entries[entry_id][3] <= now:
+                self._drop(entry_id)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return copy.deepcopy(self._entries[entry_id][2])
+
+    def store(
+        self,
+        persona_id: str,
+        hist_key: str,
+        q_vec: np.ndarray,
+        payload: Dict[str, Any],
+        filters: Hashable = None,
+    ) -> None:
+        if self.max_entries == 0:
+            return
+        vec = np.asarray(q_vec, dtype="float32").reshape(-1)
+        expires_at = time.monotonic() + self.ttl_s if self.ttl_s > 0 else float("inf")
+        with self._lock:
+            entry_id = next(self._ids)
+            bucket = (persona_id, hist_key, filters)
+            self._entries[entry_id] = (bucket, vec, copy.deepcopy(payload), expires_at)
+            ids = self._bucket_ids(bucket)
+            ids.append(entry_id)
+            self._buckets[bucket] = (ids, None)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "index_version": self.index_version,
+        }
@@ -0,0 +1,124 @@
+"""
+Benchmark các loại ANN index so với IndexFlatIP (ground truth).
+
+Lấy vector từ index flat hiện có (storage/comic_faiss.index), tùy chọn nhân bản
+có nhiễu để mô phỏng catalogue lớn hơn, rồi báo cáo recall@k, QPS, kích thước
+index và thời gian build cho từng cấu hình.
+
+    python scripts/bench_ann.py [--scale 100000] [--k 10] [--queries 500] [--out ann.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from ann_index import build_index, configure_index, index_nbytes, reconstruct_all  # noqa: E402
+from config import FAISS_INDEX_PATH  # noqa: E402
+
+SWEEPS = {
+    "flat": [{}],
+    "ivf_flat": [{"nprobe": p} for p in (1, 4, 16, 64)],
+    "hnsw": [{"ef_search": ef} for ef in (16, 32, 64, 128)],
+    "ivf_pq": [{"nprobe": p} for p in (4, 16, 64)],
+}
+
+
+def load_base_vectors(scale: int, seed: int) -> np.ndarray:
+    base, _ = reconstruct_all(faiss.read_index(str(FAISS_INDEX_PATH)))
+    if scale <= len(base):
+        return base
+
+    # Nhân bản có nhiễu để giữ phân bố cụm giống dữ liệu thật
+    rng = np.random.default_rng(seed)
+    reps = [base]
+    while sum(len(r) for r in reps) < scale:
+        noisy = base + rng.normal(0, 0.05, size=base.shape).astype("float32")
+        faiss.normalize_L2(noisy)
+        reps.append(noisy)
+    return np.vstack(reps)[:scale]
+
+
+def make_queries(base: np.ndarray, n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picks = base[rng.choice(len(base), size=min(n, len(base)), replace=False)]
+    queries = picks + rng.normal(0, 0.08, size=picks.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[:k].tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits / float(truth.size)
+
+
+def run(args) -> List[Dict[str, Any]]:
+    base = load_base_vectors(args.scale, args.seed)
+    queries = make_queries(base, args.queries, args.seed)
+    print(f"[INFO] Base vectors: {base.shape}, queries: {queries.shape}, k={args.k}")
+
+    exact = faiss.IndexFlatIP(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, args.k)
+
+    kinds = args.types.split(",") if args.types else list(SWEEPS)
+    reports: List[Dict[str, Any]] = []
+    for kind in kinds:
+        t0 = time.perf_counter()
+        index = build_index(base, kind=kind)
+        build_s = time.perf_counter() - t0
+        nbytes = index_nbytes(index)
+
+        for params in SWEEPS[kind]:
+            configure_index(index, **params)
+            index.search(queries[:10], args.k)  # warm-up
+
+            t0 = time.perf_counter()
+            _, found = index.search(queries, args.k)
+            elapsed = time.perf_counter() - t0
+
+            row = {
+                "index_type": kind,
+                **params,
+                "recall_at_k": round(recall_at_k(found, truth), 4),
+                "qps": round(len(queries) / elapsed, 1),
+                "index_mb": round(nbytes / 1e6, 2),
+                "build_s": round(build_s, 2),
+            }
+            reports.append(row)
+            print(
+                f'{kind:<9}{json.dumps(params):<20} recall@{args.k}={row["recall_at_k"]:.4f} '
+                f'qps={row["qps"]:>9.1f} mem={row["index_mb"]:>8.2f}MB build={row["build_s"]:.2f}s'
+            )
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=0, help="Số vector mô phỏng (0 = giữ nguyên catalogue)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="", help="Danh sách index, vd: flat,hnsw")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    # Đo single-thread cho ổn định giữa các lần chạy
+    faiss.omp_set_num_threads(1)
+    reports = run(args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"[DONE] Report written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
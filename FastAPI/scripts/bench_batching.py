@@ -0,0 +1,111 @@
+"""
+Đo throughput encode + FAISS: gọi từng query vs micro-batching, ở nhiều mức đồng thời,
+và search_many (đường của /search/batch) với các kích thước batch.
+
+Query lấy từ title/genre trong metadata; cache embedding được xóa trước mỗi lượt
+để mọi query đều phải encode thật.
+
+    BATCH_MAX_WAIT_MS=3 BATCH_MAX_SIZE=32 python scripts/bench_batching.py [--requests 512] [--out batching.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comic_store import ComicStore  # noqa: E402
+
+
+def make_queries(store: ComicStore, n: int) -> List[str]:
+    titles = [t for t in store.meta.column("title") if t]
+    genres = [g for g in store.meta.column("genre") if g]
+    out: List[str] = []
+    i = 0
+    while len(out) < n and (titles or genres):
+        if titles:
+            out.append(f"truyện giống {titles[i % len(titles)]}")
+        if genres:
+            out.append(f"truyện thể loại {genres[i % len(genres)]} số {i}")
+        i += 1
+    return out[:n]
+
+
+def _percentile(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p * (len(xs) - 1))))]
+
+
+def run_concurrent(call: Callable[[str], Any], queries: List[str], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+
+    def one(q: str) -> None:
+        t0 = time.perf_counter()
+        call(q)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - t0
+    return {
+        "qps": round(len(queries) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--batch-sizes", default="1,8,32,128,256")
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    store = ComicStore()
+    store.warmup()
+    queries = make_queries(store, args.requests)
+    print(f"[INFO] {len(queries)} queries, batching={'on' if store.batching else 'off'}")
+
+    report: Dict[str, Any] = {"online": [], "offline": []}
+
+    for c in [int(x) for x in args.concurrency.split(",")]:
+        modes = {"single": lambda q: store.search_many([q])[0]}
+        if store.batching:
+            modes["micro_batch"] = lambda q: store.submit_search(q).result()
+        for mode, call in modes.items():
+            store.query_cache.clear()
+            before = store.search_batcher.stats() if store.batching else {}
+            row = {"mode": mode, "concurrency": c, **run_concurrent(call, queries, c)}
+            if mode == "micro_batch":
+                after = store.search_batcher.stats()
+                batches = after["batches"] - before["batches"]
+                row["avg_batch"] = round((after["items"] - before["items"]) / batches, 2) if batches else 0.0
+            report["online"].append(row)
+            print(f'{mode:<12} c={c:<4} qps={row["qps"]:>8.1f} p50={row["p50_ms"]:>8.2f}ms p95={row["p95_ms"]:>8.2f}ms'
+                  + (f' avg_batch={row["avg_batch"]}' if "avg_batch" in row else ""))
+
+    for bs in [int(x) for x in args.batch_sizes.split(",")]:
+        store.query_cache.clear()
+        t0 = time.perf_counter()
+        for i in range(0, len(queries), bs):
+            store.search_many(queries[i:i + bs])
+        elapsed = time.perf_counter() - t0
+        row = {"batch_size": bs, "qps": round(len(queries) / elapsed, 1)}
+        report["offline"].append(row)
+        print(f'search_many  bs={bs:<4} qps={row["qps"]:>8.1f}')
+
+    store.close()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[DONE] Report written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
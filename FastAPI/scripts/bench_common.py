@@ -0,0 +1,89 @@
+"""
+Phần dùng chung của bench_micro / bench_load / bench_compare: percentile,
+thông tin môi trường và định dạng file kết quả.
+
+File JSON: {"suite", "created_at", "env", "args", "results": [{"name": ..., số liệu...}]}
+-> bench_compare.py ghép hai lần chạy theo "name".
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Dict, List, Sequence
+
+FASTAPI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Biến môi trường ảnh hưởng tới kết quả, ghi kèm để so sánh hai lần chạy cho đúng
+ENV_KEYS = (
+    "EMBEDDING_BACKEND",
+    "ANN_INDEX_TYPE",
+    "BATCH_MAX_SIZE",
+    "BATCH_MAX_WAIT_MS",
+    "EMBED_MAX_WORKERS",
+    "HYBRID_ENABLED",
+    "PASSAGE_ENABLED",
+    "RESPONSE_CACHE_ENABLED",
+    "SPECULATIVE_RETRIEVAL",
+    "LOCAL_INTENT_ENABLED",
+    "LLM_PROVIDERS",
+    "LLM_HEDGE_ENABLED",
+    "LLM_STUB",
+    "LLM_STUB_LATENCY_MS",
+    "LLM_STUB_TOKENS_PER_S",
+    "ADMISSION_MAX_INFLIGHT",
+    "DEGRADE_INFLIGHT",
+)
+
+
+def percentile(sorted_xs: Sequence[float], p: float) -> float:
+    if not sorted_xs:
+        return 0.0
+    return sorted_xs[min(len(sorted_xs) - 1, int(round(p * (len(sorted_xs) - 1))))]
+
+
+def latency_summary(ms: List[float]) -> Dict[str, float]:
+    xs = sorted(ms)
+    if not xs:
+        return {"n": 0}
+    return {
+        "n": len(xs),
+        "mean_ms": round(sum(xs) / len(xs), 4),
+        "p50_ms": round(percentile(xs, 0.50), 4),
+        "p95_ms": round(percentile(xs, 0.95), 4),
+        "p99_ms": round(percentile(xs, 0.99), 4),
+        "max_ms": round(xs[-1], 4),
+    }
+
+
+def git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=FASTAPI_DIR, capture_output=True, text=True, timeout=5
+        )
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def env_info() -> Dict[str, Any]:
+    return {
+        "git": git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {k: os.environ[k] for k in ENV_KEYS if k in os.environ},
+    }
+
+
+def write_report(path: str, suite: str, args: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    report = {
+        "suite": suite,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "env": env_info(),
+        "args": args,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[DONE] Report written to '{path}'")
@@ -0,0 +1,66 @@
+"""
+So sánh hai file kết quả của bench_micro / bench_load (ghép dòng theo "name").
+
+    python scripts/bench_compare.py base.json new.json [--threshold 10]
+
+Latency tăng (hoặc rps / ops_per_s giảm) quá --threshold % bị đánh dấu REGRESSION;
+exit code 1 nếu có, để dùng được trong CI.
+"""
+import argparse
+import json
+import sys
+
+# Chỉ số -> True nếu lớn hơn là tốt hơn
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "rps": True,
+    "ops_per_s": True,
+}
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return report, {row["name"]: row for row in report.get("results", [])}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="% thay đổi coi là regression")
+    args = parser.parse_args()
+
+    base_report, base = load(args.base)
+    new_report, new = load(args.new)
+    if base_report.get("suite") != new_report.get("suite"):
+        print(f'[WARN] Comparing different suites: {base_report.get("suite")} vs {new_report.get("suite")}')
+    if base_report.get("env", {}).get("config") != new_report.get("env", {}).get("config"):
+        print(f'[WARN] Config differs: {base_report.get("env", {}).get("config")} -> {new_report.get("env", {}).get("config")}')
+    print(f'base {base_report.get("env", {}).get("git")}  ->  new {new_report.get("env", {}).get("git")}')
+
+    regressions = 0
+    for name in [n for n in base if n in new]:
+        cells = []
+        for metric, higher_better in METRICS.items():
+            a, b = base[name].get(metric), new[name].get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100.0
+            worse = -change if higher_better else change
+            flag = ""
+            if worse > args.threshold:
+                flag = " REGRESSION"
+                regressions += 1
+            cells.append(f"{metric} {a:g} -> {b:g} ({change:+.1f}%){flag}")
+        print(f"{name:<28} " + " | ".join(cells))
+    for name in sorted(set(base) ^ set(new)):
+        print(f"{name:<28} only in {'base' if name in base else 'new'}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+So sánh FaqIndex với cách quét tuyến tính cũ (score_faq_match trên từng FAQ).
+
+FAQ thật được nhân bản (đổi id, thêm hậu tố vào keyword) để mô phỏng vài nghìn
+mục; query lấy từ data/intent_fixtures.json. Báo cáo latency p50/p95 và tỉ lệ
+top-1 trùng với cách cũ trên FAQ thật.
+
+    python scripts/bench_faq.py [--scale 5000] [--out faq.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DATA_DIR, FAQ_BM25_WEIGHT, FAQ_JSON_PATH, FAQ_MIN_SCORE  # noqa: E402
+from faq_index import FaqIndex  # noqa: E402
+
+
+def legacy_score(query: str, faq: Dict[str, Any]) -> float:
+    q = (query or "").lower()
+    title = (faq.get("title") or "").lower()
+    content = (faq.get("content") or "").lower()
+    score = 0.0
+    for kw in faq.get("keywords") or []:
+        if kw and str(kw).lower().strip() in q:
+            score += 3.0
+    if q and (q in title or q in content):
+        score += 1.5
+    return score
+
+
+def legacy_best(query: str, faqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    scored = sorted(((legacy_score(query, f), f) for f in faqs), key=lambda x: x[0], reverse=True)
+    return [f for s, f in scored[:1] if s > 0 and s >= FAQ_MIN_SCORE]
+
+
+def scale_faqs(faqs: List[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    out = list(faqs)
+    i = 0
+    while len(out) < n:
+        f = faqs[i % len(faqs)]
+        out.append({
+            **f,
+            "id": f'{f["id"]}_{i}',
+            "keywords": [f"{kw} {i}" for kw in f.get("keywords") or []],
+            "content": f'{f.get("content") or ""} (bản {i})',
+        })
+        i += 1
+    return out
+
+
+def timed(fn, queries) -> List[float]:
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return lat
+
+
+def summary(lat: List[float]) -> Dict[str, float]:
+    lat = sorted(lat)
+    return {"p50_ms": round(statistics.median(lat), 4), "p95_ms": round(lat[int(0.95 * (len(lat) - 1))], 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    with open(FAQ_JSON_PATH, "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+    with open(DATA_DIR / "intent_fixtures.json", "r", encoding="utf-8") as f:
+        queries = [x["text"] for x in json.load(f)]
+
+    index = FaqIndex(faqs, bm25_weight=FAQ_BM25_WEIGHT)
+    agree = sum(
+        [f["id"] for f in legacy_best(q, faqs)] == [f["id"] for f in index.search(q, 1, FAQ_MIN_SCORE)]
+        for q in queries
+    )
+    report: Dict[str, Any] = {"queries": len(queries), "top1_agreement": round(agree / len(queries), 4), "runs": []}
+    print(f"[INFO] top-1 agreement with legacy scan on {len(faqs)} FAQs: {report['top1_agreement']:.2%}")
+
+    for n in sorted({len(faqs), 1000, args.scale}):
+        big = scale_faqs(faqs, n)
+        t0 = time.perf_counter()
+        big_index = FaqIndex(big, bm25_weight=FAQ_BM25_WEIGHT)
+        build_ms = (time.perf_counter() - t0) * 1000.0
+        qs = queries * args.repeat
+        row = {
+            "faqs": n,
+            "build_ms": round(build_ms, 1),
+            "legacy": summary(timed(lambda q: legacy_best(q, big), qs)),
+            "indexed": summary(timed(lambda q: big_index.search(q, 1, FAQ_MIN_SCORE), qs)),
+        }
+        report["runs"].append(row)
+        print(f'faqs={n:<6} build={row["build_ms"]:>8.1f}ms legacy p50={row["legacy"]["p50_ms"]:.4f}ms '
+              f'indexed p50={row["indexed"]["p50_ms"]:.4f}ms p95={row["indexed"]["p95_ms"]:.4f}ms')
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[DONE] Report written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
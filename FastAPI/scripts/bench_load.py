@@ -0,0 +1,192 @@
+"""
+Load generator cho /chat: closed-loop, mỗi mức đồng thời gửi --requests request,
+báo RPS, p50/p95/p99, lỗi (gồm 429/503 do admission control), phân bố intent, chế độ
+phục vụ (full / degraded / cache), token LLM trung bình / request (header X-LLM-Tokens) và (nếu server bật SERVER_TIMING_ENABLED) thời gian trung bình từng
+bước lấy từ header Server-Timing.
+
+Query lấy từ data/intent_fixtures.json (hoặc --queries), thứ tự cố định theo --seed.
+Query lặp lại sau mỗi vòng -> đo đường không cache thì chạy server với RESPONSE_CACHE_ENABLED=0.
+
+    # server đang chạy
+    python scripts/bench_load.py --url http://127.0.0.1:8000 --concurrency 1,8,32 --out load.json
+
+    # chạy app trong process (không cần port), LLM giả -> chạy offline
+    LLM_STUB=1 SERVER_TIMING_ENABLED=1 python scripts/bench_load.py --in-process --out load.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import FASTAPI_DIR, latency_summary, write_report  # noqa: E402
+
+DEFAULT_QUERIES = os.path.join(FASTAPI_DIR, "data", "intent_fixtures.json")
+HISTORY_TURNS = [
+    {"role": "user", "content": "mình thích truyện hành động"},
+    {"role": "assistant", "content": "Bạn thử One Piece hoặc Naruto nhé."},
+    {"role": "user", "content": "còn bộ nào khác không"},
+    {"role": "assistant", "content": "Mình gợi ý thêm vài bộ cùng thể loại nhé."},
+]
+
+
+def load_queries(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [x["text"] if isinstance(x, dict) else str(x) for x in data]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        if name and rest.startswith("dur="):
+            try:
+                out[name] = float(rest[4:])
+            except ValueError:
+                pass
+    return out
+
+
+def parse_llm_tokens(header: Optional[str]) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for part in (header or "").split(";"):
+        kind, _, n = part.strip().partition("=")
+        if kind and n.isdigit():
+            out[kind] = int(n)
+    return out
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    payloads: List[Dict[str, Any]],
+    concurrency: int,
+    requests: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    seq = itertools.count()
+    latencies: List[float] = []
+    errors = Counter()
+    intents = Counter()
+    modes = Counter()
+    stages: Dict[str, List[float]] = defaultdict(list)
+    tokens = Counter()
+
+    async def worker() -> None:
+        while True:
+            i = next(seq)
+            if i >= requests:
+                return
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/chat", json=payloads[i % len(payloads)], timeout=timeout)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if r.status_code != 200:
+                errors[str(r.status_code)] += 1
+                continue
+            latencies.append(elapsed)
+            body = r.json()
+            intents[body.get("intent")] += 1
+            modes[body.get("mode")] += 1
+            for name, ms in parse_server_timing(r.headers.get("server-timing")).items():
+                stages[name].append(ms)
+            tokens.update(parse_llm_tokens(r.headers.get("x-llm-tokens")))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    return {
+        "name": f"chat.c{concurrency}",
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        **latency_summary(latencies),
+        "intents": dict(intents),
+        "modes": dict(modes),
+        "llm_tokens_mean": {k: round(v / len(latencies), 1) for k, v in sorted(tokens.items())} if latencies else {},
+        "stages_mean_ms": {k: round(sum(v) / len(v), 3) for k, v in sorted(stages.items())},
+    }
+
+
+async def _in_process_client():
+    """Dựng app trong process (chạy lifespan) và chờ bot ready."""
+    import main
+
+    ctx = main.lifespan(main.app)
+    await ctx.__aenter__()
+    while not main.state.ready:
+        if main.state.error:
+            raise RuntimeError(f"Bot failed to start: {main.state.error}")
+        await asyncio.sleep(0.2)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    return client, ctx
+
+
+async def amain(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    queries = load_queries(args.queries)
+    rng.shuffle(queries)
+    payloads = [
+        {"message": q, "personaId": args.persona, **({"history": HISTORY_TURNS[-args.history:]} if args.history else {})}
+        for q in queries
+    ]
+
+    ctx = None
+    if args.in_process:
+        client, ctx = await _in_process_client()
+    else:
+        limits = httpx.Limits(max_connections=max(int(c) for c in args.concurrency.split(",")))
+        client = httpx.AsyncClient(base_url=args.url, limits=limits)
+
+    results = []
+    try:
+        for c in [int(x) for x in args.concurrency.split(",")]:
+            if args.warmup:
+                await run_level(client, payloads, c, args.warmup, args.timeout)
+            row = await run_level(client, payloads, c, args.requests, args.timeout)
+            results.append(row)
+            print(f'c={c:<4} rps={row["rps"]:>8.2f} p50={row.get("p50_ms", 0):>9.2f}ms '
+                  f'p95={row.get("p95_ms", 0):>9.2f}ms p99={row.get("p99_ms", 0):>9.2f}ms errors={row["errors"]} modes={row["modes"]}')
+    finally:
+        await client.aclose()
+        if ctx is not None:
+            await ctx.__aexit__(None, None, None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-process", action="store_true", help="Chạy app trong process qua ASGI, không cần server")
+    parser.add_argument("--concurrency", default="1,4,16,32")
+    parser.add_argument("--requests", type=int, default=200, help="Số request đo ở mỗi mức đồng thời")
+    parser.add_argument("--warmup", type=int, default=20, help="Số request làm nóng (không tính) ở mỗi mức")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES)
+    parser.add_argument("--history", type=int, default=0, help="Số lượt history gửi kèm (0-4)")
+    parser.add_argument("--persona", default="1")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    if args.out:
+        write_report(args.out, "load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
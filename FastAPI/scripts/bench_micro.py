@@ -0,0 +1,103 @@
+"""
+Micro-benchmark các bước trên đường /chat, gọi trực tiếp (không qua HTTP / LLM):
+
+- ComicStore.search: cold (xóa cache embedding -> encode + FAISS) và warm (chỉ FAISS + fusion)
+- find_best_faq, is_greeting: query trong data/intent_fixtures.json
+- RAGBot._extract_history: history 0 / 10 / 50 lượt, nội dung dài ngắn khác nhau
+
+Input cố định theo --seed để hai lần chạy so sánh được.
+
+    python scripts/bench_micro.py [--repeat 20] [--out micro.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import latency_summary, write_report  # noqa: E402
+from config import DATA_DIR  # noqa: E402
+from personas import is_greeting  # noqa: E402
+from rag import RAGBot, find_best_faq  # noqa: E402
+
+
+def bench(
+    name: str,
+    fn: Callable[[Any], Any],
+    inputs: Sequence[Any],
+    repeat: int,
+    before: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    # Một lượt làm nóng không tính
+    for x in inputs[: min(len(inputs), 5)]:
+        fn(x)
+    lat: List[float] = []
+    for _ in range(repeat):
+        for x in inputs:
+            if before is not None:
+                before()
+            t0 = time.perf_counter()
+            fn(x)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+    row = {"name": name, **latency_summary(lat)}
+    row["ops_per_s"] = round(1000.0 / row["mean_ms"], 1) if row["mean_ms"] else 0.0
+    print(f'{name:<28} n={row["n"]:<6} p50={row["p50_ms"]:>9.4f}ms p95={row["p95_ms"]:>9.4f}ms '
+          f'p99={row["p99_ms"]:>9.4f}ms')
+    return row
+
+
+def make_histories(rng: random.Random) -> List[Dict[str, Any]]:
+    words = "truyện hay quá bạn ơi mình muốn đọc thêm bộ nào giống vậy không nhỉ".split()
+    out = []
+    for turns in (0, 10, 50):
+        history = []
+        for i in range(turns):
+            n = rng.choice((5, 40, 300))
+            history.append({
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": " ".join(rng.choice(words) for _ in range(n)),
+            })
+        out.append({"history": history})
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--search-repeat", type=int, default=3, help="Lặp riêng cho search (chậm hơn nhiều)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with open(DATA_DIR / "intent_fixtures.json", "r", encoding="utf-8") as f:
+        queries = [x["text"] for x in json.load(f)]
+    rng.shuffle(queries)
+
+    bot = RAGBot()
+    store = bot.store
+    titles = [t for t in store.meta.column("title") if t]
+    search_queries = queries[:20] + [f"truyện giống {t}" for t in rng.sample(titles, min(20, len(titles)))]
+    store.warmup()
+
+    results = [
+        bench("store.search.cold", store.search, search_queries, args.search_repeat, before=store.query_cache.clear),
+        bench("store.search.warm", store.search, search_queries, args.search_repeat),
+        bench("find_best_faq", lambda q: find_best_faq(q, bot.faq_index), queries, args.repeat),
+        bench("is_greeting", is_greeting, queries, args.repeat),
+    ]
+    for ctx in make_histories(rng):
+        results.append(bench(f'extract_history.{len(ctx["history"])}', bot._extract_history, [ctx], args.repeat * 50))
+
+    asyncio.run(bot.aclose())
+    if args.out:
+        write_report(args.out, "micro", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
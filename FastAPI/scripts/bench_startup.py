@@ -0,0 +1,104 @@
+"""
+Đo thời gian khởi động của API: mở port, ready (sau warm-up) và latency request /chat đầu tiên.
+
+Chạy uvicorn ở subprocess với biến môi trường truyền vào, để so sánh các cấu hình:
+
+    python scripts/bench_startup.py --label torch
+    python scripts/bench_startup.py --label onnx-int8 --env EMBEDDING_BACKEND=onnx
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+FASTAPI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _get(url, timeout=1.0):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def _post(url, payload, timeout=30.0):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def run_once(port, extra_env, timeout_s):
+    env = {**os.environ, **extra_env}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=FASTAPI_DIR,
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    listening_s = ready_s = None
+    health = {}
+    try:
+        while time.perf_counter() - t0 < timeout_s:
+            try:
+                health = _get(f"{base}/health")
+                listening_s = listening_s or time.perf_counter() - t0
+                if health.get("ready"):
+                    ready_s = time.perf_counter() - t0
+                    break
+                if health.get("error"):
+                    break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.05)
+
+        first_ms = None
+        if ready_s is not None:
+            t1 = time.perf_counter()
+            _post(f"{base}/chat", {"message": "tìm truyện kinh dị học đường"})
+            first_ms = (time.perf_counter() - t1) * 1000
+        return {
+            "listening_s": round(listening_s, 3) if listening_s else None,
+            "ready_s": round(ready_s, 3) if ready_s else None,
+            "first_chat_ms": round(first_ms, 1) if first_ms else None,
+            "server_timings": health.get("startup"),
+            "error": health.get("error"),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--label", default="default")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE, lặp lại được")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    # Không gọi LLM để số đo chỉ phản ánh phần local
+    extra_env = {"GROQ_API_KEY": "", "GEMINI_API_KEY": "", "LLM_STUB": "0"}
+    extra_env.update(kv.split("=", 1) for kv in args.env)
+
+    runs = []
+    for i in range(args.runs):
+        res = run_once(args.port, extra_env, args.timeout)
+        print(f"[INFO] run {i + 1}: {res}")
+        runs.append(res)
+
+    report = {"label": args.label, "env": extra_env, "runs": runs}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[DONE] Report written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Kiểm tra admission.AdmissionController (không cần model / index / LLM):
+
+- capacity:      2 slot + hàng 2 -> request thứ 5 bị 429 ngay, 4 request còn lại chạy hết theo FIFO
+- queue_timeout: slot bị giữ lâu -> request trong hàng nhận 503 đúng hạn, slot không bị rò
+- cancel:        request bị hủy khi đang chờ không giữ slot / không chặn người sau
+- inflight:      vượt ngưỡng in-flight mềm -> request mới chạy degraded
+- queue_wait:    chờ trong hàng quá ngưỡng -> degraded
+- llm_errors:    tỉ lệ lỗi LLM vượt ngưỡng -> degraded trong hold_s rồi quay lại full
+- fallback:      note_llm_fallback trong task con thấy được ở request, không rò sang request khác
+
+Exit code 1 nếu có kịch bản FAIL.
+
+    python scripts/check_admission.py
+"""
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import (  # noqa: E402
+    DEGRADED,
+    FULL,
+    AdmissionController,
+    Overloaded,
+    llm_fell_back,
+    note_llm_fallback,
+    serving,
+)
+
+
+def controller(**kwargs) -> AdmissionController:
+    base = dict(
+        max_inflight=2,
+        max_queue=2,
+        queue_timeout_s=1.0,
+        degrade_inflight=0,
+        degrade_wait_s=0.0,
+        error_rate=0.5,
+        error_window_s=30.0,
+        error_min_samples=10,
+        hold_s=15.0,
+        enabled=True,
+    )
+    base.update(kwargs)
+    return AdmissionController(**base)
+
+
+async def hold(adm: AdmissionController, seconds: float, out: List[str]) -> None:
+    try:
+        async with adm.slot() as ticket:
+            out.append(ticket.mode)
+            await asyncio.sleep(seconds)
+    except Overloaded as e:
+        out.append(str(e.status))
+
+
+# ================= KỊCH BẢN =================
+
+async def capacity() -> str:
+    adm = controller()
+    out: List[str] = []
+    tasks = [asyncio.create_task(hold(adm, 0.05, out)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert out == [FULL, FULL, "429"] and adm.inflight == 2 and adm.waiting == 2, (out, adm.stats())
+    await asyncio.gather(*tasks)
+    assert sorted(out) == ["429", FULL, FULL, FULL, FULL] and adm.inflight == 0, (out, adm.stats())
+    return "2 running + 2 queued served, 5th shed with 429"
+
+
+async def queue_timeout() -> str:
+    adm = controller(max_inflight=1, queue_timeout_s=0.1)
+    out: List[str] = []
+    t0 = time.perf_counter()
+    await asyncio.gather(hold(adm, 0.5, out), hold(adm, 0.0, out))
+    assert out == [FULL, "503"] and adm.inflight == 0 and adm.waiting == 0, (out, adm.stats())
+    await hold(adm, 0.0, out)
+    assert out[-1] == FULL, out
+    return f"queued request got 503, slot free afterwards ({(time.perf_counter() - t0) * 1000:.0f}ms)"
+
+
+async def cancel() -> str:
+    adm = controller(max_inflight=1)
+    out: List[str] = []
+    first = asyncio.create_task(hold(adm, 0.05, out))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(hold(adm, 0.0, out))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.gather(first, waiter, return_exceptions=True)
+    await hold(adm, 0.0, out)
+    assert out == [FULL, FULL] and adm.inflight == 0 and adm.waiting == 0, (out, adm.stats())
+    return "cancelled waiter released its place, next request admitted"
+
+
+async def inflight() -> str:
+    adm = controller(max_inflight=10, degrade_inflight=3)
+    out: List[str] = []
+    await asyncio.gather(*(hold(adm, 0.02, out) for _ in range(5)))
+    assert out == [FULL, FULL, DEGRADED, DEGRADED, DEGRADED], out
+    return f"modes={out}"
+
+
+async def queue_wait() -> str:
+    adm = controller(max_inflight=1, degrade_wait_s=0.03)
+    out: List[str] = []
+    await asyncio.gather(hold(adm, 0.06, out), hold(adm, 0.0, out))
+    assert out == [FULL, DEGRADED], out
+    return "request queued 60ms served degraded"
+
+
+async def llm_errors() -> str:
+    now = [0.0]
+    adm = controller(clock=lambda: now[0])
+
+    async def mode() -> str:
+        async with adm.slot() as ticket:
+            return f"{ticket.mode}/{ticket.reason}" if ticket.reason else ticket.mode
+
+    for i in range(9):
+        adm.record_llm(i % 3 == 0)
+    assert await mode() == FULL  # 9 mẫu < min_samples
+    adm.record_llm(False)
+    assert await mode() == f"{DEGRADED}/llm_errors"
+    now[0] += 16
+    assert await mode() == FULL and adm.inflight == 0, adm.stats()
+    return "7/10 errors -> degraded for hold_s, full again afterwards"
+
+
+async def fallback() -> str:
+    async def fail(call: str) -> None:
+        note_llm_fallback(call)
+
+    note_llm_fallback("intent")  # ngoài request: bỏ qua
+    assert not llm_fell_back()
+    with serving(FULL):
+        assert not llm_fell_back()
+        await asyncio.create_task(fail("search"))
+        assert llm_fell_back()
+    with serving(FULL):
+        assert not llm_fell_back()
+    assert not llm_fell_back()
+    return "fallback noted in child task, reset per request"
+
+
+SCENARIOS = [capacity, queue_timeout, cancel, inflight, queue_wait, llm_errors, fallback]
+
+
+async def amain() -> int:
+    failed = 0
+    for fn in SCENARIOS:
+        try:
+            detail = await fn()
+            print(f"[PASS] {fn.__name__:<13} {detail}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {fn.__name__:<13} {type(e).__name__}: {e}")
+    return failed
+
+
+def main():
+    failed = asyncio.run(amain())
+    if failed:
+        print(f"[FAIL] {failed}/{len(SCENARIOS)} scenarios failed")
+        sys.exit(1)
+    print(f"[DONE] {len(SCENARIOS)} scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Kiểm tra batcher.MicroBatcher (không cần model / index):
+
+- batching:      submit đồng thời được gom batch, mỗi caller nhận đúng kết quả của mình
+- fn_error:      fn lỗi -> mọi Future trong batch nhận exception
+- close_pending: close() khi còn item trong hàng -> item đó nhận RuntimeError ngay, batch đang chạy vẫn xong
+- after_close:   submit sau close() trả Future đã lỗi, .result() không treo
+
+Exit code 1 nếu có kịch bản FAIL.
+
+    python scripts/check_batcher.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batcher import MicroBatcher  # noqa: E402
+
+TIMEOUT_S = 2.0
+
+
+def double(xs: List[int]) -> List[int]:
+    time.sleep(0.005)
+    return [2 * x for x in xs]
+
+
+# ================= KỊCH BẢN =================
+
+def batching() -> str:
+    mb = MicroBatcher(double, max_batch=8, max_wait_ms=20)
+    try:
+        with ThreadPoolExecutor(16) as ex:
+            out = list(ex.map(mb, range(32)))
+        st = mb.stats()
+    finally:
+        mb.close()
+    assert out == [2 * x for x in range(32)], out
+    assert st["items"] == 32 and st["batches"] < 32, st
+    return f"32 calls -> {st['batches']} batches (avg {st['avg_batch']})"
+
+
+def fn_error() -> str:
+    def boom(xs: List[int]) -> List[int]:
+        raise ValueError("encode failed")
+
+    mb = MicroBatcher(boom, max_batch=4, max_wait_ms=5)
+    try:
+        futs = [mb.submit(i) for i in range(3)]
+        errors = [type(f.exception(TIMEOUT_S)).__name__ for f in futs]
+    finally:
+        mb.close()
+    assert errors == ["ValueError"] * 3, errors
+    return "every caller got ValueError"
+
+
+def close_pending() -> str:
+    started, release = threading.Event(), threading.Event()
+
+    def slow(xs: List[int]) -> List[int]:
+        started.set()
+        release.wait(TIMEOUT_S)
+        return xs
+
+    mb = MicroBatcher(slow, max_batch=1, max_wait_ms=0)
+    running = mb.submit(1)
+    assert started.wait(TIMEOUT_S)
+    queued = [mb.submit(i) for i in range(2, 5)]
+    t0 = time.perf_counter()
+    mb.close()
+    errors = [type(f.exception(TIMEOUT_S)).__name__ for f in queued]
+    failed_ms = (time.perf_counter() - t0) * 1000.0
+    release.set()
+    assert errors == ["RuntimeError"] * 3, errors
+    assert running.result(TIMEOUT_S) == 1
+    return f"3 queued failed in {failed_ms:.1f}ms, running batch finished"
+
+
+def after_close() -> str:
+    mb = MicroBatcher(double, max_batch=4, max_wait_ms=1)
+    mb.close()
+    mb.close()
+    fut = mb.submit(1)
+    assert fut.done() and isinstance(fut.exception(0), RuntimeError), fut
+    try:
+        mb(2)
+    except RuntimeError as e:
+        return f"submit after close -> {e}"
+    raise AssertionError("call after close did not raise")
+
+
+SCENARIOS = [batching, fn_error, close_pending, after_close]
+
+
+def main():
+    failed = 0
+    for fn in SCENARIOS:
+        try:
+            detail = fn()
+            print(f"[PASS] {fn.__name__:<13} {detail}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {fn.__name__:<13} {type(e).__name__}: {e}")
+    if failed:
+        print(f"[FAIL] {failed}/{len(SCENARIOS)} scenarios failed")
+        sys.exit(1)
+    print(f"[DONE] {len(SCENARIOS)} scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
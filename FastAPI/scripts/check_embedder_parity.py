@@ -0,0 +1,71 @@
+"""
+So sánh backend ONNX với SentenceTransformer (torch) trên cùng bộ câu.
+
+Báo cáo cosine giữa hai vector của từng câu, độ trùng top-k khi search trên
+index hiện tại và latency encode. Exit code 1 nếu cosine nhỏ nhất < --min-cos.
+
+    python scripts/check_embedder_parity.py [--onnx storage/embedder/model.int8.onnx] [--min-cos 0.97]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from config import DATA_DIR, FAISS_INDEX_PATH, ONNX_MODEL_PATH, TOP_K_CANDIDATES  # noqa: E402
+from embedder import OnnxEmbedder, TorchEmbedder  # noqa: E402
+
+
+def load_texts():
+    with open(DATA_DIR / "intent_fixtures.json", "r", encoding="utf-8") as f:
+        return [item["text"] for item in json.load(f)]
+
+
+def encode_timed(embedder, texts):
+    embedder.encode(texts[:2])  # warm-up
+    t0 = time.perf_counter()
+    vecs = np.vstack([embedder.encode([t]) for t in texts]).astype("float32")
+    per_query_ms = (time.perf_counter() - t0) * 1000 / len(texts)
+    faiss.normalize_L2(vecs)
+    return vecs, per_query_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--onnx", default=str(ONNX_MODEL_PATH))
+    parser.add_argument("--min-cos", type=float, default=0.97)
+    parser.add_argument("--k", type=int, default=TOP_K_CANDIDATES)
+    args = parser.parse_args()
+
+    texts = load_texts()
+    ref, ref_ms = encode_timed(TorchEmbedder(), texts)
+    got, got_ms = encode_timed(OnnxEmbedder(model_path=args.onnx), texts)
+
+    cos = (ref * got).sum(axis=1)
+    index = faiss.read_index(str(FAISS_INDEX_PATH))
+    _, ref_ids = index.search(ref, args.k)
+    _, got_ids = index.search(got, args.k)
+    overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ref_ids.tolist(), got_ids.tolist())])
+
+    print(f"[INFO] {len(texts)} texts")
+    print(f"[INFO] cosine min={cos.min():.4f} mean={cos.mean():.4f}")
+    print(f"[INFO] top-{args.k} overlap: {overlap:.3f}")
+    print(f"[INFO] encode latency/query: torch={ref_ms:.2f} ms, onnx={got_ms:.2f} ms")
+
+    worst = np.argsort(cos)[:3]
+    for i in worst:
+        print(f"       worst: {cos[i]:.4f}  {texts[i]}")
+
+    if cos.min() < args.min_cos:
+        print(f"[FAIL] min cosine {cos.min():.4f} < {args.min_cos}")
+        sys.exit(1)
+    print("[DONE] ONNX backend within tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Kiểm tra filters.parse_filters và ComicStore.parse_filters (không cần model / index):
+
+- Tên truyện chứa "Long" ("Long Tộc", "Ẩn Long Đô Thị", "Cửu Long Saroka") hay câu "hài lòng"
+  không sinh filter số chương
+- Câu thường có chữ giống từ trạng thái ("đang rảnh", "con rắn", "kết thúc có hậu", "main bị drop")
+  không sinh filter status; "dưới 0 chương" không ra số chương âm
+- Cụm rõ nghĩa ("truyện dài", "long series", "truyện ngắn", "trên 100 chương", "đã hoàn thành") vẫn sinh filter
+- Câu trùng đúng tên truyện bỏ filter (từ khóa filter là một phần của tên), câu thường vẫn lọc
+
+Exit code 1 nếu có case FAIL.
+
+    python scripts/check_filters.py
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comic_store import ComicStore  # noqa: E402
+from filters import LONG_MIN_CHAPTERS, NO_FILTER, SHORT_MAX_CHAPTERS, SearchFilter, parse_filters  # noqa: E402
+from lexical import LexicalIndex  # noqa: E402
+
+GENRES = ["Action", "Romance", "Horror", "School Life"]
+
+
+def chapters(lo=None, hi=None, genres=()) -> SearchFilter:
+    return SearchFilter(frozenset(genres), frozenset(), lo, hi)
+
+
+def status(*statuses, genres=()) -> SearchFilter:
+    return SearchFilter(frozenset(genres), frozenset(statuses))
+
+
+PARSE_CASES = [
+    ("Long Tộc", NO_FILTER),
+    ("Ẩn Long Đô Thị", NO_FILTER),
+    ("Cửu Long Saroka", NO_FILTER),
+    ("tìm truyện long tộc", NO_FILTER),
+    ("đọc xong mình rất hài lòng", NO_FILTER),
+    ("short", NO_FILTER),
+    ("Đại Kỷ Nguyên", NO_FILTER),
+    ("truyện dài", chapters(lo=LONG_MIN_CHAPTERS)),
+    ("long series romance", chapters(lo=LONG_MIN_CHAPTERS, genres=["Romance"])),
+    ("truyện ngắn hành động", chapters(hi=SHORT_MAX_CHAPTERS, genres=["Action"])),
+    ("bộ nào nhiều chương", chapters(lo=LONG_MIN_CHAPTERS)),
+    ("trên 100 chương", chapters(lo=101)),
+    ("dưới 0 chương", chapters(hi=0)),
+    ("mình đang rảnh, gợi ý truyện hay", NO_FILTER),
+    ("con rắn", NO_FILTER),
+    ("truyện có kết thúc có hậu", NO_FILTER),
+    ("truyện về main bị drop", NO_FILTER),
+    ("truyện hành động đã hoàn thành", status("Completed", genres=["Action"])),
+    ("truyện hành động chưa hoàn thành", status("In Progress", genres=["Action"])),
+    ("truyện đang ra", status("In Progress")),
+    ("bộ nào full rồi", status("Completed")),
+    ("truyện bị drop", status("On Hold")),
+]
+
+ITEMS = [
+    {"comicId": 1, "title": "Long Tộc", "slug": "long-toc", "alternateNames": ""},
+    {"comicId": 2, "title": "Kinh Dị Học Đường", "slug": "kinh-di-hoc-duong", "alternateNames": ""},
+    {"comicId": 3, "title": "Naruto", "slug": "naruto", "alternateNames": ""},
+]
+
+STORE_CASES = [
+    ("Kinh Dị Học Đường", NO_FILTER),
+    ("tìm truyện kinh dị học đường", NO_FILTER),
+    ("truyện kinh dị", chapters(genres=["Horror"])),
+    ("Long Tộc", NO_FILTER),
+]
+
+
+def main():
+    store = ComicStore.__new__(ComicStore)
+    store._snap = SimpleNamespace(filters=SimpleNamespace(genres=GENRES), lexical=LexicalIndex.build(ITEMS))
+
+    failed = 0
+    cases = [("parse", q, exp, parse_filters(q, GENRES)) for q, exp in PARSE_CASES]
+    cases += [("store", q, exp, store.parse_filters(q)) for q, exp in STORE_CASES]
+    for kind, query, expected, got in cases:
+        ok = got == expected
+        failed += not ok
+        print(f"[{'PASS' if ok else 'FAIL'}] {kind:<5} {query!r:<36} -> {got.as_dict()}")
+    if failed:
+        print(f"[FAIL] {failed}/{len(cases)} cases failed")
+        sys.exit(1)
+    print(f"[DONE] {len(cases)} cases passed")
+
+
+if __name__ == "__main__":
+    main()
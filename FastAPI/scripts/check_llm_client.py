@@ -0,0 +1,262 @@
+"""
+Kiểm tra llm_client.LLMClient với provider giả chạy local (không gọi mạng, không cần API key).
+
+Groq / Gemini giả là handler của httpx.MockTransport nói đúng định dạng REST của từng
+bên (JSON thường + SSE), độ trễ / mã lỗi chỉnh được theo từng kịch bản:
+
+- healthy:      Groq khỏe -> mọi lượt qua Groq, không hedge, không chạm Gemini
+- tail_hedge:   Groq chậm 1.5s mỗi 25 lượt (dưới p95) -> p99 có hedge thấp hơn hẳn không hedge
+- failover:     Groq trả 503 -> trả lời qua Gemini, breaker mở sau N lỗi, half-open thử lại khi hết cooldown
+- bad_request:  Groq trả 400 -> vẫn failover nhưng breaker không tính lỗi
+- stream_hedge: token đầu của Groq chậm -> bản hedge trên Gemini thắng, stream đọc hết từ Gemini
+- deadline:     cả hai chậm -> LLMUnavailable đúng hạn chót
+- stub:         SDKProvider bọc llm_stub.StubLLM (JSON mode + stream)
+
+Exit code 1 nếu có kịch bản FAIL.
+
+    python scripts/check_llm_client.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import percentile  # noqa: E402
+from llm_client import (  # noqa: E402
+    CircuitBreaker,
+    GeminiProvider,
+    LLMClient,
+    LLMUnavailable,
+    OpenAICompatProvider,
+    SDKProvider,
+)
+from llm_stub import StubLLM  # noqa: E402
+
+MESSAGES = [
+    {"role": "system", "content": "Bạn là trợ lý website truyện tranh."},
+    {"role": "user", "content": "tìm truyện ninja"},
+]
+
+
+class FakeProvider:
+    """Một provider giả; `kind` = "openai" (Groq) hoặc "gemini"."""
+
+    def __init__(self, name: str, kind: str, latency_s: float = 0.03):
+        self.name = name
+        self.kind = kind
+        self.latency_s = latency_s
+        self.slow_every = 0
+        self.slow_s = 0.0
+        self.status = 200
+        self.token_gap_s = 0.005
+        self.calls = 0
+
+    def _chunks(self, text: str) -> List[Dict[str, Any]]:
+        words = [w + " " for w in text.split()]
+        if self.kind == "openai":
+            return (
+                [{"choices": [{"delta": {"role": "assistant", "content": ""}}]}]
+                + [{"choices": [{"delta": {"content": w}}]} for w in words]
+                + [{"choices": [], "x_groq": {"usage": {"prompt_tokens": 12, "completion_tokens": len(words)}}}]
+            )
+        return [
+            {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": w}]}}],
+                "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": i + 1},
+            }
+            for i, w in enumerate(words)
+        ]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        slow = self.slow_every and self.calls % self.slow_every == 0
+        await asyncio.sleep(self.slow_s if slow else self.latency_s)
+        if self.status != 200:
+            return httpx.Response(self.status, json={"error": {"message": f"fake {self.status}"}})
+
+        body = json.loads(request.content)
+        text = f"trả lời từ {self.name} số {self.calls}"
+        stream = body.get("stream") or request.url.path.endswith(":streamGenerateContent")
+        if not stream:
+            if self.kind == "openai":
+                return httpx.Response(200, json={
+                    "choices": [{"message": {"role": "assistant", "content": text}}],
+                    "usage": {"prompt_tokens": 12, "completion_tokens": 6},
+                })
+            return httpx.Response(200, json={
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 6},
+            })
+
+        chunks = self._chunks(text)
+        gap = self.token_gap_s
+        done = self.kind == "openai"
+
+        async def sse():
+            for i, obj in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(gap)
+                yield f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8")
+            if done:
+                yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=sse())
+
+
+def make_client(groq: FakeProvider, gemini: FakeProvider, hedge: bool = True, breaker: Optional[CircuitBreaker] = None):
+    fakes = {"groq.fake": groq, "gemini.fake": gemini}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return await fakes[request.url.host].handle(request)
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    providers = [
+        OpenAICompatProvider("groq", "http://groq.fake/openai/v1", "k", "fake-model", http),
+        GeminiProvider("http://gemini.fake/v1beta", "k", "fake-model", http),
+    ]
+    if breaker is not None:
+        providers[0].breaker = breaker
+    return LLMClient(providers, http=http, hedge=hedge)
+
+
+def fakes(groq_latency: float = 0.03, gemini_latency: float = 0.06):
+    return FakeProvider("groq", "openai", groq_latency), FakeProvider("gemini", "gemini", gemini_latency)
+
+
+async def run_many(client: LLMClient, n: int, timeout: float = 5.0) -> List[float]:
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await client.complete(MESSAGES, call="check", timeout=timeout)
+        lat.append(time.perf_counter() - t0)
+    return lat
+
+
+async def collect(client: LLMClient, timeout: float = 5.0) -> str:
+    return "".join([c.text async for c in client.stream(MESSAGES, call="check", timeout=timeout)])
+
+
+# ================= KỊCH BẢN =================
+
+async def healthy() -> str:
+    groq, gemini = fakes()
+    client = make_client(groq, gemini)
+    res = await client.complete(MESSAGES, call="check", timeout=2.0)
+    await run_many(client, 29)
+    await client.aclose()
+    assert res.provider == "groq" and res.completion_tokens == 6, res
+    assert groq.calls == 30 and gemini.calls == 0, (groq.calls, gemini.calls)
+    return f"30/30 via groq, gemini calls={gemini.calls}"
+
+
+async def tail_hedge() -> str:
+    out = {}
+    for hedge in (False, True):
+        groq, gemini = fakes()
+        groq.slow_every, groq.slow_s = 25, 1.5
+        client = make_client(groq, gemini, hedge=hedge)
+        await run_many(client, 30)  # đủ mẫu để tính p95
+        lat = sorted(await run_many(client, 60))
+        await client.aclose()
+        out[hedge] = (percentile(lat, 0.99) * 1000.0, gemini.calls)
+    (p99_off, _), (p99_on, hedges) = out[False], out[True]
+    assert p99_on < 500 < p99_off, out
+    return f"p99 no-hedge={p99_off:.0f}ms hedge={p99_on:.0f}ms (gemini hedges={hedges})"
+
+
+async def failover() -> str:
+    groq, gemini = fakes()
+    groq.status = 503
+    now = [0.0]
+    breaker = CircuitBreaker(failures=3, cooldown_s=30, clock=lambda: now[0])
+    client = make_client(groq, gemini, breaker=breaker)
+    providers = [(await client.complete(MESSAGES, call="check", timeout=2.0)).provider for _ in range(10)]
+    assert set(providers) == {"gemini"} and groq.calls == 3 and breaker.state == "open", (providers, groq.calls)
+
+    groq.status = 200
+    now[0] += 31
+    probe = await client.complete(MESSAGES, call="check", timeout=2.0)
+    await client.aclose()
+    assert probe.provider == "groq" and breaker.state == "closed", (probe, breaker.state)
+    return "10/10 via gemini, groq calls=3 before open, half-open probe closed breaker"
+
+
+async def bad_request() -> str:
+    groq, gemini = fakes()
+    groq.status = 400
+    breaker = CircuitBreaker(failures=3, cooldown_s=30)
+    client = make_client(groq, gemini, breaker=breaker)
+    providers = [(await client.complete(MESSAGES, call="check", timeout=2.0)).provider for _ in range(6)]
+    await client.aclose()
+    assert set(providers) == {"gemini"} and groq.calls == 6 and breaker.state == "closed", (groq.calls, breaker.state)
+    return "6/6 via gemini, breaker stays closed on 4xx"
+
+
+async def stream_hedge() -> str:
+    groq, gemini = fakes()
+    client = make_client(groq, gemini)
+    for _ in range(25):
+        await collect(client)  # p95 thời gian tới token đầu
+    groq.latency_s = 1.0
+    t0 = time.perf_counter()
+    text = await collect(client)
+    elapsed = (time.perf_counter() - t0) * 1000.0
+    await client.aclose()
+    assert "gemini" in text and elapsed < 600, (text, elapsed)
+    return f"hedged stream served by gemini in {elapsed:.0f}ms: {text.strip()!r}"
+
+
+async def deadline() -> str:
+    groq, gemini = fakes(2.0, 2.0)
+    client = make_client(groq, gemini)
+    t0 = time.perf_counter()
+    try:
+        await client.complete(MESSAGES, call="check", timeout=0.5)
+    except LLMUnavailable as e:
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        await client.aclose()
+        assert elapsed < 700, elapsed
+        return f"LLMUnavailable after {elapsed:.0f}ms ({e})"
+    raise AssertionError("expected LLMUnavailable")
+
+
+async def stub() -> str:
+    client = LLMClient([SDKProvider("stub", StubLLM(20, 2000), "stub")])
+    res = await client.complete(MESSAGES, call="intent", timeout=2.0, json_mode=True)
+    text = await collect(client)
+    await client.aclose()
+    assert json.loads(res.content)["intent"] == "SEARCH" and text, (res, text)
+    return f"json={res.content} stream={len(text)} chars"
+
+
+SCENARIOS = [healthy, tail_hedge, failover, bad_request, stream_hedge, deadline, stub]
+
+
+async def amain() -> int:
+    failed = 0
+    for fn in SCENARIOS:
+        try:
+            detail = await fn()
+            print(f"[PASS] {fn.__name__:<13} {detail}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {fn.__name__:<13} {type(e).__name__}: {e}")
+    return failed
+
+
+def main():
+    failed = asyncio.run(amain())
+    if failed:
+        print(f"[FAIL] {failed}/{len(SCENARIOS)} scenarios failed")
+        sys.exit(1)
+    print(f"[DONE] {len(SCENARIOS)} scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Chuyển comic_faiss_metadata.json (định dạng cũ) sang file nhị phân mmap.
+
+    python scripts/convert_metadata.py [--src storage/comic_faiss_metadata.json] [--dst storage/comic_faiss_metadata.bin]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import METADATA_BIN_PATH, METADATA_PATH  # noqa: E402
+from metadata_store import MetadataStore, write_metadata_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", default=str(METADATA_PATH))
+    parser.add_argument("--dst", default=str(METADATA_BIN_PATH))
+    args = parser.parse_args()
+
+    src = MetadataStore.from_json(args.src)
+    header = {k: v for k, v in src.header.items() if k in ("embedding_model", "index_type", "id_mode")}
+    write_metadata_store(args.dst, src.to_items(), **header)
+
+    dst = MetadataStore.open(args.dst)
+    assert dst.to_items() == src.to_items(), "round-trip mismatch"
+    print(f"[DONE] {len(dst)} items: {os.path.getsize(args.src)} B json -> {os.path.getsize(args.dst)} B binary")
+
+
+if __name__ == "__main__":
+    main()
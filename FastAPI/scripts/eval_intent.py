@@ -0,0 +1,141 @@
+"""
+Đánh giá intent classifier cục bộ trên data/intent_fixtures.json.
+
+Báo cáo accuracy / coverage (tỉ lệ câu xử lý được mà không cần LLM) / latency
+cho từng tầng: rules, rules+centroid, và (tùy chọn --llm) LLM-only.
+Fixture phải không trùng seed centroid (intent_seeds.json + tiêu đề FAQ), nếu không
+tầng centroid được chấm trên chính câu nó học -> script dừng với danh sách câu trùng.
+
+    python scripts/eval_intent.py [--llm | --rules-only] [--out report.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DATA_DIR  # noqa: E402
+
+FIXTURES_PATH = DATA_DIR / "intent_fixtures.json"
+DEFAULT_INTENT = "SEARCH"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def seed_overlap(fixtures: List[Dict[str, str]], seeds: Dict[str, List[str]], faq_titles: List[str]) -> List[str]:
+    """Fixture trùng seed centroid (so sau chuẩn hóa + bỏ dấu)."""
+    from text_utils import normalize_text, strip_accents
+
+    def key(t: str) -> str:
+        return strip_accents(normalize_text(t))
+
+    known = {key(t) for examples in seeds.values() for t in examples} | {key(t) for t in faq_titles}
+    return [item["text"] for item in fixtures if key(item["text"]) in known]
+
+
+def evaluate(
+    name: str,
+    fixtures: List[Dict[str, str]],
+    classify: Callable[[str], Optional[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    resolved = correct_resolved = correct_total = 0
+    errors: List[Dict[str, str]] = []
+
+    for item in fixtures:
+        t0 = time.perf_counter()
+        res = classify(item["text"])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+        predicted = (res or {}).get("intent") or DEFAULT_INTENT
+        if res is not None:
+            resolved += 1
+            correct_resolved += int(predicted == item["intent"])
+        correct_total += int(predicted == item["intent"])
+        if predicted != item["intent"]:
+            errors.append({"text": item["text"], "expected": item["intent"], "got": predicted})
+
+    n = len(fixtures) or 1
+    return {
+        "tier": name,
+        "n": len(fixtures),
+        "coverage": round(resolved / n, 4),
+        "accuracy_resolved": round(correct_resolved / resolved, 4) if resolved else None,
+        "accuracy_overall": round(correct_total / n, 4),
+        "latency_ms_mean": round(sum(latencies) / n, 3),
+        "latency_ms_p95": round(percentile(latencies, 95), 3),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", action="store_true", help="Đo thêm tầng LLM-only (cần GROQ_API_KEY / GEMINI_API_KEY)")
+    parser.add_argument("--rules-only", action="store_true", help="Chỉ đo tầng rules (không cần model embedding)")
+    parser.add_argument("--out", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    with open(FIXTURES_PATH, "r", encoding="utf-8") as f:
+        fixtures = json.load(f)
+    print(f"[INFO] Loaded {len(fixtures)} labelled messages")
+
+    from intent import IntentClassifier, load_intent_seeds
+    from rag import load_faq_items
+
+    faqs = load_faq_items()
+    leaked = seed_overlap(fixtures, load_intent_seeds(), [f["title"] for f in faqs if f.get("title")])
+    if leaked:
+        print(f"[ERROR] {len(leaked)} fixtures are also centroid seeds: {leaked}")
+        sys.exit(1)
+
+    if args.rules_only:
+        reports = [evaluate("rules", fixtures, IntentClassifier().classify_rules)]
+    else:
+        from comic_store import ComicStore
+
+        store = ComicStore()
+        clf = IntentClassifier(encode_fn=store.encode_texts, faqs=faqs)
+        # Warm-up để lần encode đầu không làm lệch latency
+        store.encode_query("warm up")
+
+        reports = [
+            evaluate("rules", fixtures, clf.classify_rules),
+            evaluate("rules+centroid", fixtures, clf.classify),
+        ]
+
+    if args.llm:
+        from rag import RAGBot
+
+        bot = RAGBot()
+        if bot.llm is None:
+            print("[WARN] Chưa cấu hình provider LLM nào, bỏ qua tầng LLM")
+        else:
+            reports.append(
+                evaluate("llm", fixtures, lambda m: bot._run_sync(bot._aclassify_with_llm(m)))
+            )
+
+    print(f"{'tier':<16}{'coverage':>10}{'acc(res)':>10}{'acc(all)':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for r in reports:
+        acc_res = "-" if r["accuracy_resolved"] is None else f'{r["accuracy_resolved"]:.3f}'
+        print(
+            f'{r["tier"]:<16}{r["coverage"]:>10.3f}{acc_res:>10}{r["accuracy_overall"]:>10.3f}'
+            f'{r["latency_ms_mean"]:>10.2f}{r["latency_ms_p95"]:>10.2f}'
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"[DONE] Report written to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Export transformer của EMBEDDING_MODEL_NAME sang ONNX (fp32) và bản int8 dynamic-quantized.
+
+    python scripts/export_onnx_embedder.py [--out-dir storage/embedder]
+
+Sau đó chạy với EMBEDDING_BACKEND=onnx (ONNX_MODEL_PATH trỏ tới model.int8.onnx mặc định)
+và kiểm tra bằng scripts/check_embedder_parity.py.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_MODEL_NAME, STORAGE_DIR  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out-dir", default=str(STORAGE_DIR / "embedder"))
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    fp32_path = os.path.join(args.out_dir, "model.onnx")
+    int8_path = os.path.join(args.out_dir, "model.int8.onnx")
+
+    print(f"[INFO] Loading {EMBEDDING_MODEL_NAME}")
+    st_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    transformer.config.return_dict = False
+    dummy = st_model.tokenizer(["xin chào", "truyện tranh hành động"], padding=True, return_tensors="pt")
+
+    print(f"[INFO] Exporting fp32 ONNX to '{fp32_path}'")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=args.opset,
+        )
+
+    print(f"[INFO] Quantizing (dynamic int8) to '{int8_path}'")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    for p in (fp32_path, int8_path):
+        print(f"[DONE] {p}: {os.path.getsize(p) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
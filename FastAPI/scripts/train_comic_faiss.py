@@ -1,11 +1,34 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 import mysql.connector
 from mysql.connector import Error
 import numpy as np
 import faiss
+import hashlib
 import json
 import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import (  # noqa: E402
+    build_index,
+    choose_index_type,
+    configure_index,
+    describe_index,
+    reconstruct_all,
+    supports_remove,
+    train_rows_needed,
+    with_ids,
+)
+from config import ANN_INDEX_TYPE, PASSAGE_INDEX_TYPE, PASSAGE_MEMORY_BUDGET_MB, SIMILAR_TOP_N  # noqa: E402
+from lexical import LexicalIndex  # noqa: E402
+from metadata_store import MetadataStore, write_metadata_store  # noqa: E402
+from passages import build_passages, write_passage_meta  # noqa: E402
+from similar import SimilarTable, build_similar, refresh_similar, write_similar  # noqa: E402
 
 MYSQL_CONFIG = {
     "host": "localhost",
@@ -18,9 +41,33 @@ MYSQL_CONFIG = {
 EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
 
 FAISS_INDEX_PATH = "storage/comic_faiss.index"
-METADATA_PATH = "storage/comic_faiss_metadata.json"
+METADATA_PATH = "storage/comic_faiss_metadata.bin"
+MANIFEST_PATH = "storage/comic_faiss_manifest.json"
+LEXICAL_PATH = "storage/comic_lexical.npz"
+
+# Trạng thái build dở dang: vector (memmap), metadata + hash từng dòng (jsonl), tiến độ (json)
+VECTORS_PATH = "storage/comic_faiss_build.vectors.f32"
+CHECKPOINT_META_PATH = "storage/comic_faiss_build.meta.jsonl"
+CHECKPOINT_PATH = "storage/comic_faiss_build.ckpt.json"
+
+PASSAGE_INDEX_PATH = "storage/comic_passages.index"
+PASSAGE_META_PATH = "storage/comic_passages.npz"
+PASSAGE_VECTORS_PATH = "storage/comic_passages.vectors.f32"
+
+# Bảng top-N comic tương tự (similar.py), build lại / refresh cùng index comic
+SIMILAR_PATH = "storage/comic_similar.npz"
 
 BATCH_SIZE = 128
+# Số passage tối đa dùng để train IVF-PQ của index passage
+PASSAGE_TRAIN_SAMPLE = 100_000
+# Số comic mỗi lần query MySQL (keyset theo comicId) = đơn vị checkpoint
+PAGE_SIZE = 2048
+COMIC_ID_RANGE = (3, 1131)
+
+# Bump khi đổi build_comic_profile để buộc re-embed toàn bộ
+PROFILE_VERSION = 1
+# Đổi quá tỉ lệ này thì build lại hẳn (centroid IVF cũ không còn đại diện)
+INCREMENTAL_REBUILD_RATIO = 0.3
 
 
 def build_comic_profile(row: Dict[str, Any]) -> str:
@@ -52,137 +99,685 @@ Summary: {description}
     return profile
 
 
-def fetch_comics_from_mysql(mysql_config: Dict[str, Any]) -> List[Dict[str, Any]]:
-    conn = mysql.connector.connect(**mysql_config)
-    cursor = conn.cursor(dictionary=True)
+def profile_hash(profile: str) -> str:
+    return hashlib.sha1(profile.encode("utf-8")).hexdigest()
 
-    query = """
-        SELECT
-            c.comicId,
-            c.slug,
-            c.title,
-            c.description,
-            c.status,
 
-            COUNT(DISTINCT ch.chapterId) AS chapterCount,
+def build_metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "comicId": int(row.get("comicId")),
+        "title": row.get("title"),
+        "slug": row.get("slug"),
+        "genre": row.get("genre") or "",
+        "alternateNames": row.get("alternateNames") or "",
+        "status": row.get("status"),
+        "chapterCount": int(row.get("chapterCount") or 0),
+        "description": row.get("description") or "",
+    }
 
-            GROUP_CONCAT(DISTINCT g.name ORDER BY g.name SEPARATOR ', ') AS genre,
 
-            GROUP_CONCAT(DISTINCT an.name ORDER BY an.name SEPARATOR '; ') AS alternateNames
+COMIC_PAGE_QUERY = """
+    SELECT
+        c.comicId,
+        c.slug,
+        c.title,
+        c.description,
+        c.status,
 
-        FROM Comic c
+        COUNT(DISTINCT ch.chapterId) AS chapterCount,
 
-        LEFT JOIN Chapters ch 
-            ON ch.comicId = c.comicId
+        GROUP_CONCAT(DISTINCT g.name ORDER BY g.name SEPARATOR ', ') AS genre,
 
-        LEFT JOIN GenreComic gc 
-            ON gc.comicId = c.comicId
-        LEFT JOIN Genre g 
-            ON g.genreId = gc.genreId
+        GROUP_CONCAT(DISTINCT an.name ORDER BY an.name SEPARATOR '; ') AS alternateNames
 
-        LEFT JOIN AlternateNames an 
-            ON an.comicId = c.comicId
+    FROM Comic c
 
-        WHERE c.comicId BETWEEN 3 AND 1131
+    LEFT JOIN Chapters ch 
+        ON ch.comicId = c.comicId
 
-        GROUP BY
-            c.comicId,
-            c.slug,
-            c.title,
-            c.description,
-            c.status
+    LEFT JOIN GenreComic gc 
+        ON gc.comicId = c.comicId
+    LEFT JOIN Genre g 
+        ON g.genreId = gc.genreId
 
-        ORDER BY c.comicId;
-    """
+    LEFT JOIN AlternateNames an 
+        ON an.comicId = c.comicId
 
-    cursor.execute(query)
-    comics = cursor.fetchall()
+    WHERE c.comicId BETWEEN %s AND %s
+      AND c.comicId > %s
 
+    GROUP BY
+        c.comicId,
+        c.slug,
+        c.title,
+        c.description,
+        c.status
+
+    ORDER BY c.comicId
+    LIMIT %s;
+"""
+
+COMIC_COUNT_QUERY = "SELECT COUNT(*) AS n FROM Comic c WHERE c.comicId BETWEEN %s AND %s"
+
+
+def count_comics(conn) -> int:
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(COMIC_COUNT_QUERY, COMIC_ID_RANGE)
+    n = int(cursor.fetchone()["n"])
     cursor.close()
-    conn.close()
-    return comics
+    return n
 
 
-def train_and_save_faiss():
-    try:
-        os.makedirs("storage", exist_ok=True)
+def iter_comic_pages(conn, after_id: int = 0, page_size: int = PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Đọc theo trang bằng keyset (comicId > id cuối trang trước): mỗi trang một query ngắn,
+    không giữ cả bảng trong RAM, và resume được từ comicId bất kỳ.
+    """
+    while True:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(COMIC_PAGE_QUERY, (*COMIC_ID_RANGE, after_id, page_size))
+        rows = cursor.fetchall()
+        cursor.close()
+        if not rows:
+            return
+        yield rows
+        after_id = int(rows[-1]["comicId"])
+        if len(rows) < page_size:
+            return
+
 
-        print(f"[INFO] Loading embedding model: {EMBEDDING_MODEL_NAME}")
-        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        embedding_dim = model.get_sentence_embedding_dimension()
-        print(f"[INFO] Embedding dimension: {embedding_dim}")
+CHAPTER_TITLES_QUERY = """
+    SELECT ch.comicId, ch.title
+    FROM Chapters ch
+    WHERE ch.comicId IN ({ids})
+    ORDER BY ch.comicId, ch.chapterNumber
+"""
 
-        print("[INFO] Fetching comics from MySQL...")
-        comics = fetch_comics_from_mysql(MYSQL_CONFIG)
-        print(f"[INFO] Fetched {len(comics)} comics")
 
-        if not comics:
-            print("[WARN] No comics found. Abort.")
+def fetch_chapter_titles(conn, comic_ids: List[int]) -> Dict[int, List[str]]:
+    if not comic_ids:
+        return {}
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(CHAPTER_TITLES_QUERY.format(ids=", ".join(["%s"] * len(comic_ids))), comic_ids)
+    out: Dict[int, List[str]] = {}
+    for row in cursor.fetchall():
+        if row.get("title"):
+            out.setdefault(int(row["comicId"]), []).append(row["title"])
+    cursor.close()
+    return out
+
+
+def prefetch(pages: Iterable[List[Dict[str, Any]]], depth: int = 2) -> Iterator[List[Dict[str, Any]]]:
+    """Đọc trang kế tiếp ở thread nền trong lúc trang hiện tại đang encode."""
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+    done = object()
+
+    def _worker():
+        try:
+            for page in pages:
+                q.put(page)
+        except Exception as e:
+            q.put(e)
+        q.put(done)
+
+    threading.Thread(target=_worker, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
             return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
 
-        profiles: List[str] = []
-        metadata_list: List[Dict[str, Any]] = []
-
-        for row in comics:
-            profiles.append(build_comic_profile(row))
-            metadata_list.append(
-                {
-                    "comicId": int(row.get("comicId")),
-                    "title": row.get("title"),
-                    "slug": row.get("slug"),
-                    "genre": row.get("genre") or "",
-                    "alternateNames": row.get("alternateNames") or "",
-                    "status": row.get("status"),
-                    "chapterCount": int(row.get("chapterCount") or 0),
-                    "description": row.get("description") or "",
-                }
-            )
-
-        print("[INFO] Encoding embeddings...")
-        all_embeddings = []
-        total = len(profiles)
-
-        for start in range(0, total, BATCH_SIZE):
-            end = min(start + BATCH_SIZE, total)
-            batch_profiles = profiles[start:end]
-            batch_emb = model.encode(batch_profiles, convert_to_numpy=True)
-            all_embeddings.append(batch_emb)
-            print(f"[INFO] Encoded {end}/{total} profiles")
-
-        embeddings = np.vstack(all_embeddings).astype("float32")
-        print(f"[INFO] Final embeddings shape: {embeddings.shape}")
-
-        faiss.normalize_L2(embeddings)
-
-        print("[INFO] Building FAISS index...")
-        index = faiss.IndexFlatIP(embedding_dim)
-        index.add(embeddings)
-        print(f"[INFO] Indexed {index.ntotal} vectors")
-
-        print(f"[INFO] Saving FAISS index to '{FAISS_INDEX_PATH}'...")
-        faiss.write_index(index, FAISS_INDEX_PATH)
-
-        print(f"[INFO] Saving metadata to '{METADATA_PATH}'...")
-        with open(METADATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(
-                {
-                    "embedding_model": EMBEDDING_MODEL_NAME,
-                    "count": len(metadata_list),
-                    "items": metadata_list,
-                },
-                f,
-                ensure_ascii=False,
-                indent=2,
-            )
-
-        print("[DONE] Training/indexing finished.")
-        print(f"[DONE] Saved FAISS index + metadata for {len(metadata_list)} comics.")
+class ProfileEncoder:
+    """
+    Encode profile theo thứ tự độ dài (batch ít padding), trả lại đúng thứ tự gốc.
+    workers > 1 -> pool nhiều process của sentence-transformers.
+    """
+
+    def __init__(self, model: SentenceTransformer, workers: int = 1):
+        self.model = model
+        self.pool = model.start_multi_process_pool(["cpu"] * workers) if workers > 1 else None
+        self.dim = int(model.get_sentence_embedding_dimension())
+
+    def encode(self, profiles: List[str]) -> np.ndarray:
+        if not profiles:
+            return np.zeros((0, self.dim), dtype="float32")
+        order = np.argsort([-len(p) for p in profiles], kind="stable")
+        ordered = [profiles[i] for i in order]
+        if self.pool is not None:
+            emb = self.model.encode_multi_process(ordered, self.pool, batch_size=BATCH_SIZE)
+        else:
+            emb = self.model.encode(ordered, batch_size=BATCH_SIZE, convert_to_numpy=True)
+
+        out = np.empty((len(profiles), emb.shape[1]), dtype="float32")
+        out[order] = emb
+        faiss.normalize_L2(out)
+        return out
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+def load_model() -> SentenceTransformer:
+    print(f"[INFO] Loading embedding model: {EMBEDDING_MODEL_NAME}")
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    print(f"[INFO] Embedding dimension: {model.get_sentence_embedding_dimension()}")
+    return model
+
+
+def load_manifest() -> Optional[Dict[str, Any]]:
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _atomic_write_json(path: str, payload: Dict[str, Any], **kwargs: Any) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def save_outputs(
+    index: faiss.Index,
+    metadata_list: List[Dict[str, Any]],
+    hashes: Dict[int, str],
+    index_type: str,
+) -> None:
+    """Ghi index -> metadata -> lexical -> manifest, mỗi file qua file tạm + os.replace."""
+    print(f"[INFO] Saving FAISS index to '{FAISS_INDEX_PATH}'...")
+    faiss.write_index(index, FAISS_INDEX_PATH + ".tmp")
+    os.replace(FAISS_INDEX_PATH + ".tmp", FAISS_INDEX_PATH)
+
+    print(f"[INFO] Saving metadata to '{METADATA_PATH}'...")
+    write_metadata_store(
+        METADATA_PATH,
+        metadata_list,
+        embedding_model=EMBEDDING_MODEL_NAME,
+        index_type=index_type,
+        id_mode="comicId",
+    )
+
+    # BM25 + bảng tên chính xác dựng lại toàn bộ mỗi lần (rẻ so với encode)
+    print(f"[INFO] Saving lexical index to '{LEXICAL_PATH}'...")
+    LexicalIndex.build(metadata_list, embedding_model=EMBEDDING_MODEL_NAME).save(LEXICAL_PATH)
+
+    # Manifest ghi sau cùng: nếu chết giữa chừng, lần chạy sau sẽ thấy hash cũ và làm lại
+    _atomic_write_json(
+        MANIFEST_PATH,
+        {
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "index_type": index_type,
+            "profile_version": PROFILE_VERSION,
+            "id_mode": "comicId",
+            "hashes": {str(k): v for k, v in hashes.items()},
+        },
+    )
+
+
+class VectorSpill:
+    """Vector đã encode ghi thẳng vào memmap (rows, dim) float32; tự nới file khi vượt số ước lượng."""
+
+    def __init__(self, path: str, dim: int, capacity: int, fresh: bool):
+        self.path = path
+        self.dim = dim
+        if fresh or not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(max(1, capacity) * dim * 4)
+        self._map()
+
+    def _map(self) -> None:
+        rows = os.path.getsize(self.path) // (self.dim * 4)
+        self.arr = np.memmap(self.path, dtype="float32", mode="r+", shape=(rows, self.dim))
+
+    def write(self, start: int, vecs: np.ndarray) -> None:
+        end = start + len(vecs)
+        if end > len(self.arr):
+            rows = max(end, 2 * len(self.arr))
+            self.arr.flush()
+            self.arr = None
+            with open(self.path, "r+b") as f:
+                f.truncate(rows * self.dim * 4)
+            self._map()
+        self.arr[start:end] = vecs
+
+    def flush(self) -> None:
+        self.arr.flush()
+
+    def close(self) -> None:
+        self.arr = None
+
+
+def _checkpoint_key(index_type: str, dim: int) -> Dict[str, Any]:
+    return {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "profile_version": PROFILE_VERSION,
+        "index_type": index_type,
+        "id_range": list(COMIC_ID_RANGE),
+        "dim": dim,
+    }
+
+
+def load_checkpoint(index_type: str, dim: int) -> Optional[Dict[str, Any]]:
+    if not all(os.path.exists(p) for p in (CHECKPOINT_PATH, CHECKPOINT_META_PATH, VECTORS_PATH)):
+        return None
+    with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+        ckpt = json.load(f)
+    if any(ckpt.get(k) != v for k, v in _checkpoint_key(index_type, dim).items()):
+        print("[INFO] Checkpoint from a different build config, starting fresh")
+        return None
+    return ckpt
+
+
+def read_checkpoint_meta(rows_done: int) -> Tuple[List[Dict[str, Any]], Dict[int, str]]:
+    """Đọc rows_done dòng đầu của jsonl và ghi lại đúng chừng đó (bỏ phần ghi dở sau checkpoint cuối)."""
+    metadata_list: List[Dict[str, Any]] = []
+    hashes: Dict[int, str] = {}
+    lines: List[str] = []
+    with open(CHECKPOINT_META_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if len(lines) >= rows_done:
+                break
+            rec = json.loads(line)
+            metadata_list.append(rec["meta"])
+            hashes[int(rec["meta"]["comicId"])] = rec["hash"]
+            lines.append(line)
+    if len(lines) != rows_done:
+        raise ValueError(f"Checkpoint metadata has {len(lines)} rows, expected {rows_done}")
+    with open(CHECKPOINT_META_PATH + ".tmp", "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(CHECKPOINT_META_PATH + ".tmp", CHECKPOINT_META_PATH)
+    return metadata_list, hashes
+
+
+def clear_checkpoint() -> None:
+    for path in (CHECKPOINT_PATH, CHECKPOINT_META_PATH, VECTORS_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def full_rebuild(
+    pages_after: Callable[[int], Iterable[List[Dict[str, Any]]]],
+    total: int,
+    index_type: str,
+    workers: int = 1,
+    resume: bool = True,
+    similar: bool = True,
+) -> None:
+    """
+    Pipeline streaming: trang MySQL (đọc trước ở thread nền) -> profile -> encode sắp theo độ dài
+    -> memmap + index. Sau mỗi trang ghi checkpoint; chạy lại sẽ tiếp tục từ comicId cuối.
+    """
+    model = load_model()
+    encoder = ProfileEncoder(model, workers)
+    dim = encoder.dim
+
+    ckpt = load_checkpoint(index_type, dim) if resume else None
+    if ckpt is None:
+        metadata_list, hashes, last_id = [], {}, 0
+    else:
+        metadata_list, hashes = read_checkpoint_meta(int(ckpt["rows_done"]))
+        last_id = int(ckpt["last_id"])
+        print(f"[INFO] Resuming from checkpoint: {len(metadata_list)} comics done (comicId <= {last_id})")
+
+    rows_done = len(metadata_list)
+    ids: List[int] = [int(m["comicId"]) for m in metadata_list]
+    vectors = VectorSpill(VECTORS_PATH, dim, max(total, rows_done), fresh=ckpt is None)
+
+    # label = comicId -> lần sau có thể thêm / thay / xóa theo comicId
+    index: Optional[faiss.Index] = None
+    need_train = train_rows_needed(index_type)
+
+    def ensure_index(final: bool) -> None:
+        """Flat/HNSW tạo ngay; IVF chờ đủ vector (hoặc hết dữ liệu) để train, rồi nạp phần đã encode."""
+        nonlocal index
+        if index is not None or (rows_done < need_train and not final):
+            return
+        train = np.ascontiguousarray(vectors.arr[:rows_done]) if need_train else np.zeros((0, dim), dtype="float32")
+        index = with_ids(build_index(train, kind=index_type, add=False))
+        for start in range(0, rows_done, PAGE_SIZE):
+            end = min(start + PAGE_SIZE, rows_done)
+            index.add_with_ids(np.ascontiguousarray(vectors.arr[start:end]), np.asarray(ids[start:end], dtype="int64"))
+
+    ensure_index(final=False)
+
+    meta_log = open(CHECKPOINT_META_PATH, "a" if ckpt else "w", encoding="utf-8")
+    try:
+        for page in prefetch(pages_after(last_id)):
+            t0 = time.perf_counter()
+            profiles = [build_comic_profile(row) for row in page]
+            embeddings = encoder.encode(profiles)
+
+            start = rows_done
+            vectors.write(start, embeddings)
+            for row, profile in zip(page, profiles):
+                meta = build_metadata(row)
+                h = profile_hash(profile)
+                metadata_list.append(meta)
+                hashes[meta["comicId"]] = h
+                ids.append(meta["comicId"])
+                meta_log.write(json.dumps({"meta": meta, "hash": h}, ensure_ascii=False) + "\n")
+            rows_done += len(page)
+            last_id = ids[-1]
+
+            if index is not None:
+                index.add_with_ids(embeddings, np.asarray(ids[start:], dtype="int64"))
+            else:
+                ensure_index(final=False)
+
+            # Thứ tự: vector + metadata xuống đĩa trước, checkpoint sau
+            vectors.flush()
+            meta_log.flush()
+            os.fsync(meta_log.fileno())
+            _atomic_write_json(CHECKPOINT_PATH, {**_checkpoint_key(index_type, dim), "rows_done": rows_done, "last_id": last_id})
+
+            rate = len(page) / max(time.perf_counter() - t0, 1e-9)
+            print(f"[INFO] Encoded {rows_done}/{max(total, rows_done)} profiles ({rate:.1f}/s)")
+    finally:
+        meta_log.close()
+        encoder.close()
+
+    if rows_done == 0:
+        print("[WARN] No comics found. Abort.")
+        vectors.arr = None
+        clear_checkpoint()
+        return
+
+    ensure_index(final=True)
+    configure_index(index)
+    print(f"[INFO] Indexed {index.ntotal} vectors: {describe_index(index)}")
+
+    save_outputs(index, metadata_list, hashes, index_type)
+    if similar:
+        # Vector gốc còn trong memmap -> không phải reconstruct (IVF-PQ reconstruct chỉ gần đúng)
+        save_similar(vectors.arr[:rows_done], ids)
+    vectors.arr = None
+    clear_checkpoint()
+    print(f"[DONE] Saved FAISS index + metadata for {len(metadata_list)} comics.")
+
+
+def save_similar(vectors: np.ndarray, ids: List[int], top_n: int = SIMILAR_TOP_N) -> None:
+    """kNN all-pairs (IndexFlatIP, theo lô) -> top-N láng giềng mỗi comic."""
+    t0 = time.perf_counter()
+    neighbors, scores = build_similar(vectors, np.asarray(ids, dtype="int64"), top_n)
+    write_similar(SIMILAR_PATH, ids, neighbors, scores, embedding_model=EMBEDDING_MODEL_NAME)
+    print(f"[INFO] Saved similar table ({len(ids)} x top-{top_n}) to '{SIMILAR_PATH}' in {time.perf_counter() - t0:.1f}s")
+
+
+def refresh_similar_table(index: faiss.Index, touched: List[int], top_n: int = SIMILAR_TOP_N) -> None:
+    """Sau incremental update: chỉ tính lại dòng bị ảnh hưởng; thiếu bảng cũ / đổi top-N thì build lại."""
+    vecs, ids = reconstruct_all(index)
+    faiss.normalize_L2(vecs)
+    old = None
+    if os.path.exists(SIMILAR_PATH):
+        try:
+            old = SimilarTable.load(SIMILAR_PATH)
+        except Exception as e:
+            print(f"[WARN] Similar table unreadable ({e}), rebuilding")
+    if old is None or old.top_n != top_n or old.header.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        return save_similar(vecs, ids.tolist(), top_n)
+
+    t0 = time.perf_counter()
+    neighbors, scores, stats = refresh_similar(old, vecs, ids, touched)
+    write_similar(SIMILAR_PATH, ids, neighbors, scores, embedding_model=EMBEDDING_MODEL_NAME)
+    print(
+        f"[INFO] Refreshed similar table: {stats['searched']} rows re-searched, "
+        f"{stats['merged']} merged in {time.perf_counter() - t0:.1f}s"
+    )
+
+
+def rebuild_similar_from_index(top_n: int = SIMILAR_TOP_N) -> None:
+    """Chỉ build lại bảng similar từ index đang có (không cần MySQL / model)."""
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    vecs, ids = reconstruct_all(index)
+    faiss.normalize_L2(vecs)
+    save_similar(vecs, ids.tolist(), top_n)
+
+
+def build_passage_index(
+    pages: Iterable[List[Dict[str, Any]]],
+    workers: int = 1,
+    chapters_fn: Optional[Callable[[List[int]], Dict[int, List[str]]]] = None,
+    index_type: str = PASSAGE_INDEX_TYPE,
+    budget_mb: float = PASSAGE_MEMORY_BUDGET_MB,
+) -> None:
+    """
+    Index thứ hai: cửa sổ description (+ tên chương nếu có chapters_fn) -> vector passage.
+    Vector ghi vào memmap theo trang; loại index chọn theo ngân sách bộ nhớ khi đã biết tổng số passage.
+    """
+    encoder = ProfileEncoder(load_model(), workers)
+    dim = encoder.dim
+    vectors = VectorSpill(PASSAGE_VECTORS_PATH, dim, 1, fresh=True)
+    passage_comic_ids: List[int] = []
+
+    try:
+        for page in prefetch(pages):
+            chapters = chapters_fn([int(r["comicId"]) for r in page]) if chapters_fn else {}
+            texts: List[str] = []
+            owners: List[int] = []
+            for row in page:
+                meta = build_metadata(row)
+                for text in build_passages(meta, chapters.get(meta["comicId"], [])):
+                    texts.append(text)
+                    owners.append(meta["comicId"])
+            vectors.write(len(passage_comic_ids), encoder.encode(texts))
+            passage_comic_ids.extend(owners)
+            print(f"[INFO] Encoded {len(passage_comic_ids)} passages (last comicId {page[-1]['comicId']})")
+    finally:
+        encoder.close()
+
+    n = len(passage_comic_ids)
+    if n == 0:
+        print("[WARN] No passages. Abort.")
+        vectors.arr = None
+        os.remove(PASSAGE_VECTORS_PATH)
+        return
+
+    kind, params = choose_index_type(n, dim, budget_mb * 1e6, index_type)
+    print(f"[INFO] Building passage index ({kind} {params}) for {n} passages, budget {budget_mb:.0f} MB...")
+    if train_rows_needed(kind):
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(n, size=min(n, PASSAGE_TRAIN_SAMPLE), replace=False))
+        train = np.ascontiguousarray(vectors.arr[sample])
+    else:
+        train = np.zeros((0, dim), dtype="float32")
+    index = build_index(train, kind=kind, add=False, **params)
+    # label = số thứ tự passage (add tuần tự)
+    for start in range(0, n, PAGE_SIZE):
+        index.add(np.ascontiguousarray(vectors.arr[start:min(start + PAGE_SIZE, n)]))
+    configure_index(index)
+    print(f"[INFO] Indexed {index.ntotal} passages: {describe_index(index)}")
+
+    faiss.write_index(index, PASSAGE_INDEX_PATH + ".tmp")
+    os.replace(PASSAGE_INDEX_PATH + ".tmp", PASSAGE_INDEX_PATH)
+    write_passage_meta(
+        PASSAGE_META_PATH,
+        np.asarray(passage_comic_ids, dtype="int32"),
+        embedding_model=EMBEDDING_MODEL_NAME,
+        index_type=kind,
+        chapters=chapters_fn is not None,
+    )
+    vectors.arr = None
+    os.remove(PASSAGE_VECTORS_PATH)
+    print(f"[DONE] Saved passage index for {len(set(passage_comic_ids))} comics.")
+
+
+def list_pages(comics: List[Dict[str, Any]]) -> Callable[[int], Iterator[List[Dict[str, Any]]]]:
+    """Nguồn trang từ danh sách đã có trong RAM (incremental chuyển sang full rebuild)."""
+    def _pages(after_id: int) -> Iterator[List[Dict[str, Any]]]:
+        rest = [row for row in comics if int(row["comicId"]) > after_id]
+        for i in range(0, len(rest), PAGE_SIZE):
+            yield rest[i:i + PAGE_SIZE]
+    return _pages
+
+
+def diff_comics(
+    comics: List[Dict[str, Any]], old_hashes: Dict[int, str]
+) -> Tuple[Dict[int, str], List[int], List[int], List[int]]:
+    """Trả về (hash mới, id thêm, id đổi nội dung, id bị xóa)."""
+    new_hashes: Dict[int, str] = {}
+    for row in comics:
+        new_hashes[int(row["comicId"])] = profile_hash(build_comic_profile(row))
+
+    added = [cid for cid in new_hashes if cid not in old_hashes]
+    changed = [cid for cid, h in new_hashes.items() if cid in old_hashes and old_hashes[cid] != h]
+    removed = [cid for cid in old_hashes if cid not in new_hashes]
+    return new_hashes, added, changed, removed
+
+
+def incremental_update(
+    comics: List[Dict[str, Any]], index_type: str, workers: int = 1, similar: bool = True
+) -> None:
+    manifest = load_manifest()
+    reason = None
+    if manifest is None or not os.path.exists(FAISS_INDEX_PATH) or not os.path.exists(METADATA_PATH):
+        reason = "no manifest"
+    elif manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        reason = "embedding model changed"
+    elif manifest.get("profile_version") != PROFILE_VERSION:
+        reason = "profile format changed"
+    elif manifest.get("index_type") != index_type:
+        reason = "index type changed"
+    elif manifest.get("id_mode") != "comicId":
+        reason = "index is not ID-mapped"
+
+    if reason is not None:
+        print(f"[INFO] Full rebuild required ({reason})")
+        return full_rebuild(list_pages(comics), len(comics), index_type, workers, resume=False, similar=similar)
+
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    old_hashes = {int(k): v for k, v in manifest.get("hashes", {}).items()}
+    new_hashes, added, changed, removed = diff_comics(comics, old_hashes)
+    print(f"[INFO] Diff: +{len(added)} added, ~{len(changed)} changed, -{len(removed)} removed")
+
+    if not (added or changed or removed):
+        print("[DONE] Index already up to date.")
+        return
+
+    touched = len(added) + len(changed) + len(removed)
+    if touched > INCREMENTAL_REBUILD_RATIO * max(1, len(old_hashes)):
+        print(f"[INFO] {touched} rows touched (> {INCREMENTAL_REBUILD_RATIO:.0%}), full rebuild")
+        return full_rebuild(list_pages(comics), len(comics), index_type, workers, resume=False, similar=similar)
+    if (changed or removed) and not supports_remove(index):
+        print(f"[INFO] Index type '{index_type}' cannot remove vectors, full rebuild")
+        return full_rebuild(list_pages(comics), len(comics), index_type, workers, resume=False, similar=similar)
+
+    meta_by_id = {int(m["comicId"]): m for m in MetadataStore.open(METADATA_PATH).to_items()}
+
+    drop = changed + removed
+    if drop:
+        index.remove_ids(np.array(drop, dtype="int64"))
+    for cid in removed:
+        meta_by_id.pop(cid, None)
+
+    upsert_ids = set(added + changed)
+    upsert = [row for row in comics if int(row["comicId"]) in upsert_ids]
+    if upsert:
+        encoder = ProfileEncoder(load_model(), workers)
+        print(f"[INFO] Encoding {len(upsert)} changed profiles...")
+        try:
+            embeddings = encoder.encode([build_comic_profile(row) for row in upsert])
+        finally:
+            encoder.close()
+        ids = np.array([int(row["comicId"]) for row in upsert], dtype="int64")
+        index.add_with_ids(embeddings, ids)
+        for row in upsert:
+            meta_by_id[int(row["comicId"])] = build_metadata(row)
+
+    configure_index(index)
+    metadata_list = [meta_by_id[cid] for cid in sorted(meta_by_id)]
+    if index.ntotal != len(metadata_list):
+        print(f"[WARN] Index/metadata mismatch ({index.ntotal} vs {len(metadata_list)}), full rebuild")
+        return full_rebuild(list_pages(comics), len(comics), index_type, workers, resume=False, similar=similar)
+
+    save_outputs(index, metadata_list, new_hashes, index_type)
+    if similar:
+        refresh_similar_table(index, added + changed + removed)
+    print(f"[DONE] Incremental update finished: {index.ntotal} comics indexed.")
+
+
+def train_and_save_faiss(
+    index_type: str = ANN_INDEX_TYPE,
+    incremental: bool = False,
+    workers: int = 1,
+    resume: bool = True,
+    passages: str = "",
+    similar: bool = True,
+):
+    """
+    passages: "" = không build index passage, "also" = build thêm, "only" = chỉ build passage.
+    similar: build / refresh bảng comic tương tự cùng index comic.
+    """
+    conn = None
+    try:
+        os.makedirs("storage", exist_ok=True)
+        conn = mysql.connector.connect(**MYSQL_CONFIG)
+
+        if passages != "only":
+            if incremental:
+                print("[INFO] Fetching comics from MySQL...")
+                comics = [row for page in iter_comic_pages(conn) for row in page]
+                print(f"[INFO] Fetched {len(comics)} comics")
+                if not comics:
+                    print("[WARN] No comics found. Abort.")
+                    return
+                incremental_update(comics, index_type, workers, similar)
+            else:
+                total = count_comics(conn)
+                print(f"[INFO] Streaming {total} comics from MySQL in pages of {PAGE_SIZE}...")
+                full_rebuild(
+                    lambda after_id: iter_comic_pages(conn, after_id), total, index_type, workers, resume, similar
+                )
+
+        if passages:
+            # Connection riêng cho tên chương: connection chính đang được thread prefetch dùng
+            chapter_conn = mysql.connector.connect(**MYSQL_CONFIG)
+            try:
+                build_passage_index(
+                    iter_comic_pages(conn),
+                    workers,
+                    chapters_fn=lambda ids: fetch_chapter_titles(chapter_conn, ids),
+                )
+            finally:
+                chapter_conn.close()
 
     except Error as e:
         print("[MYSQL ERROR]", e)
     except Exception as e:
         print("[ERROR]", e)
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 if __name__ == "__main__":
-    train_and_save_faiss()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-type", default=ANN_INDEX_TYPE, help="flat | ivf_flat | hnsw | ivf_pq")
+    parser.add_argument("--incremental", action="store_true", help="Chỉ re-embed comic thêm/đổi/xóa theo manifest")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                        help="Số process encode (1 = không dùng pool)")
+    parser.add_argument("--no-resume", action="store_true", help="Bỏ checkpoint cũ, build lại từ đầu")
+    parser.add_argument("--passages", choices=["also", "only"], default="",
+                        help="Build index passage (description + tên chương): thêm sau index comic, hoặc chỉ passage")
+    parser.add_argument("--no-similar", action="store_true", help="Không build / refresh bảng comic tương tự")
+    parser.add_argument("--similar-only", action="store_true",
+                        help="Chỉ build lại bảng comic tương tự từ index đang có (không đọc MySQL)")
+    args = parser.parse_args()
+    if args.similar_only:
+        rebuild_similar_from_index()
+        sys.exit(0)
+    train_and_save_faiss(
+        args.index_type,
+        incremental=args.incremental,
+        workers=args.workers,
+        resume=not args.no_resume,
+        passages=args.passages,
+        similar=not args.no_similar,
+    )
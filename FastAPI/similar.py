@@ -0,0 +1,192 @@
+"""
+Bảng "truyện tương tự" tính trước từ index comic: mỗi comic -> top-N comic gần nhất
+theo cosine của vector profile. Trang truyện gợi ý được mà không cần encode / FAISS / LLM.
+
+File storage/comic_similar.npz:
+- ids (n,) int32: comicId của từng dòng
+- neighbors (n, N) int32: comicId láng giềng, điểm giảm dần; -1 = trống (ít hơn N comic)
+- scores (n, N) float16: cosine
+- header JSON: embedding_model, top_n, count
+
+Build: kNN all-pairs theo lô trên IndexFlatIP (chính xác). Refresh sau cập nhật incremental:
+chỉ tìm lại từ đầu cho comic thêm / đổi và comic có láng giềng bị đổi / xóa; các dòng còn lại
+trộn danh sách cũ với điểm tới comic thêm / đổi (vẫn chính xác, vì top-N cũ không mất phần tử nào).
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+BATCH_SIZE = 1024
+
+
+def _knn(base: np.ndarray, queries: np.ndarray, k: int, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    index = faiss.IndexFlatIP(base.shape[1])
+    index.add(base)
+    D = np.empty((len(queries), k), dtype="float32")
+    I = np.empty((len(queries), k), dtype="int64")
+    for start in range(0, len(queries), batch_size):
+        end = min(start + batch_size, len(queries))
+        D[start:end], I[start:end] = index.search(queries[start:end], k)
+    return D, I
+
+
+def _pack(D: np.ndarray, I: np.ndarray, ids: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vị trí trong `ids` -> comicId int32, điểm float16; thiếu cột thì đệm -1 / 0."""
+    neighbors = np.full((len(D), top_n), -1, dtype="int32")
+    scores = np.zeros((len(D), top_n), dtype="float16")
+    w = min(D.shape[1], top_n)
+    valid = I[:, :w] >= 0
+    neighbors[:, :w] = np.where(valid, ids[np.clip(I[:, :w], 0, None)], -1)
+    scores[:, :w] = np.where(valid, D[:, :w], 0.0)
+    return neighbors, scores
+
+
+def _search_rows(
+    vectors: np.ndarray, ids: np.ndarray, rows: np.ndarray, top_n: int, batch_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-N láng giềng (trừ chính nó) cho các dòng `rows`, tìm trên toàn bộ `vectors`."""
+    k = min(top_n + 1, len(ids))
+    D, I = _knn(vectors, np.ascontiguousarray(vectors[rows]), k, batch_size)
+    # Bỏ cột là chính comic đó; không thấy (trùng vector) thì bỏ cột cuối
+    keep = I != rows[:, None]
+    order = np.argsort(~keep, axis=1, kind="stable")[:, : k - 1 if k > 1 else 0]
+    return _pack(np.take_along_axis(D, order, 1), np.take_along_axis(I, order, 1), ids, top_n)
+
+
+def build_similar(
+    vectors: np.ndarray, ids: np.ndarray, top_n: int, batch_size: int = BATCH_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(neighbors, scores) cho mọi comic; `vectors` đã chuẩn hóa L2, cùng thứ tự với `ids`."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.asarray(ids, dtype="int64")
+    return _search_rows(vectors, ids, np.arange(len(ids)), top_n, batch_size)
+
+
+def refresh_similar(
+    old: "SimilarTable",
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    touched: Iterable[int],
+    batch_size: int = BATCH_SIZE,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, int]]:
+    """
+    Cập nhật bảng cũ sau khi `touched` (comicId thêm / đổi / xóa) thay đổi.
+    Trả về (neighbors, scores, {"searched": số dòng tìm lại, "merged": số dòng chỉ trộn}).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.asarray(ids, dtype="int64")
+    top_n = old.top_n
+    touched_ids = np.fromiter((int(x) for x in touched), dtype="int64")
+
+    old_pos = np.array([old.position(int(cid)) for cid in ids], dtype="int64")
+    in_old = old_pos >= 0
+    is_touched = np.isin(ids, touched_ids)
+    lost_neighbor = np.zeros(len(ids), dtype=bool)
+    lost_neighbor[in_old] = np.isin(old.neighbors[old_pos[in_old]], touched_ids).any(axis=1)
+
+    neighbors = np.full((len(ids), top_n), -1, dtype="int32")
+    scores = np.zeros((len(ids), top_n), dtype="float16")
+
+    search_rows = np.flatnonzero(~in_old | is_touched | lost_neighbor)
+    if len(search_rows):
+        neighbors[search_rows], scores[search_rows] = _search_rows(vectors, ids, search_rows, top_n, batch_size)
+
+    merge_rows = np.flatnonzero(in_old & ~is_touched & ~lost_neighbor)
+    fresh = np.flatnonzero(is_touched)
+    if len(merge_rows):
+        neighbors[merge_rows] = old.neighbors[old_pos[merge_rows]]
+        scores[merge_rows] = old.scores[old_pos[merge_rows]]
+    if len(merge_rows) and len(fresh):
+        fresh_vecs = vectors[fresh]
+        fresh_ids = ids[fresh].astype("int32")
+        for start in range(0, len(merge_rows), batch_size):
+            rows = merge_rows[start:start + batch_size]
+            cand_ids = np.hstack([neighbors[rows], np.broadcast_to(fresh_ids, (len(rows), len(fresh)))])
+            cand_sc = np.hstack([scores[rows].astype("float32"), vectors[rows] @ fresh_vecs.T])
+            cand_sc[cand_ids < 0] = -np.inf
+            order = np.argsort(-cand_sc, axis=1, kind="stable")[:, :top_n]
+            top_ids = np.take_along_axis(cand_ids, order, 1)
+            top_sc = np.take_along_axis(cand_sc, order, 1)
+            neighbors[rows] = np.where(np.isfinite(top_sc), top_ids, -1)
+            scores[rows] = np.where(np.isfinite(top_sc), top_sc, 0.0)
+
+    return neighbors, scores, {"searched": int(len(search_rows)), "merged": int(len(merge_rows))}
+
+
+def write_similar(path: Any, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, **header: Any) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(
+        tmp,
+        ids=np.asarray(ids, dtype="int32"),
+        neighbors=np.asarray(neighbors, dtype="int32"),
+        scores=np.asarray(scores, dtype="float16"),
+        header=np.array(
+            json.dumps({**header, "top_n": int(neighbors.shape[1]), "count": int(len(ids))}, ensure_ascii=False)
+        ),
+    )
+    os.replace(tmp, path)
+
+
+class SimilarTable:
+    def __init__(self, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, header: Dict[str, Any]):
+        if neighbors.shape != scores.shape or len(neighbors) != len(ids):
+            raise ValueError(f"Similar table shape mismatch: ids {ids.shape}, neighbors {neighbors.shape}")
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.header = header
+        # comicId -> dòng: mảng đặc khi id đủ gọn (auto-increment), ngược lại dict
+        max_id = int(ids.max()) if len(ids) else -1
+        self._pos: Optional[np.ndarray] = None
+        self._pos_map: Optional[Dict[int, int]] = None
+        if max_id < 4 * len(ids) + 1024:
+            self._pos = np.full(max_id + 1, -1, dtype="int32")
+            self._pos[ids] = np.arange(len(ids), dtype="int32")
+        else:
+            self._pos_map = {int(cid): i for i, cid in enumerate(ids.tolist())}
+
+    @classmethod
+    def load(cls, path: Any) -> "SimilarTable":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["ids"], z["neighbors"], z["scores"], json.loads(str(z["header"])))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def top_n(self) -> int:
+        return int(self.neighbors.shape[1])
+
+    def position(self, comic_id: int) -> int:
+        if self._pos is not None:
+            return int(self._pos[comic_id]) if 0 <= comic_id < len(self._pos) else -1
+        return self._pos_map.get(comic_id, -1)
+
+    def lookup(
+        self,
+        comic_id: int,
+        limit: int,
+        row_of_id: Callable[[int], Optional[int]],
+        row_mask: Optional[np.ndarray] = None,
+    ) -> Optional[List[Tuple[int, float]]]:
+        """(dòng metadata, điểm) của tối đa `limit` láng giềng; None nếu comic không có trong bảng.
+        Filter (row_mask) chỉ lọc trong top-N đã tính sẵn."""
+        pos = self.position(int(comic_id))
+        if pos < 0:
+            return None
+        out: List[Tuple[int, float]] = []
+        for cid, score in zip(self.neighbors[pos].tolist(), self.scores[pos].tolist()):
+            if cid < 0:
+                break
+            row = row_of_id(cid)
+            if row is None or (row_mask is not None and not row_mask[row]):
+                continue
+            out.append((row, float(score)))
+            if len(out) >= limit:
+                break
+        return out
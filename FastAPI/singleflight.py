@@ -0,0 +1,72 @@
+"""
+Gộp các lời gọi trùng key đang chạy (single-flight): lời gọi đầu (leader) tạo một task
+chung, các lời gọi tới trong lúc task chưa xong (follower) chờ đúng task đó và nhận cùng
+kết quả / cùng exception. Task xong là bỏ khỏi bảng, lời gọi sau chạy lại từ đầu.
+
+- Task chung được shield: leader bị hủy (client ngắt) không kéo theo các follower.
+- note_upstream("llm_search")...: đếm lời gọi upstream của lượt xử lý chung; mỗi follower
+  cộng số đó vào rag_coalesce_saved_calls_total (số lời gọi đã không phải chạy lại).
+"""
+import asyncio
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from metrics import COALESCE_SAVED, COALESCED
+
+T = TypeVar("T")
+
+_upstream: ContextVar[Optional[Counter]] = ContextVar("upstream_calls", default=None)
+
+
+def note_upstream(kind: str) -> None:
+    calls = _upstream.get()
+    if calls is not None:
+        calls[kind] += 1
+
+
+class SingleFlight:
+    def __init__(self):
+        # (loop, key) -> (task, bộ đếm upstream); task gắn với loop nên key kèm loop
+        self._inflight: Dict[Tuple[Any, Hashable], Tuple["asyncio.Task[Any]", Counter]] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """(kết quả, shared); shared=True nếu lời gọi này dùng kết quả của leader."""
+        k = (asyncio.get_running_loop(), key)
+        entry = self._inflight.get(k)
+        if entry is not None:
+            task, calls = entry
+            self.followers += 1
+            COALESCED.inc("follower")
+            try:
+                return await asyncio.shield(task), True
+            finally:
+                for kind, n in calls.items():
+                    COALESCE_SAVED.inc(kind, amount=n)
+
+        calls: Counter = Counter()
+
+        async def run() -> T:
+            _upstream.set(calls)
+            return await fn()
+
+        task = asyncio.ensure_future(run())
+        self._inflight[k] = (task, calls)
+        task.add_done_callback(lambda t: self._forget(k, t))
+        self.leaders += 1
+        COALESCED.inc("leader")
+        return await asyncio.shield(task), False
+
+    def _forget(self, k: Tuple[Any, Hashable], task: "asyncio.Task[Any]") -> None:
+        entry = self._inflight.get(k)
+        if entry is not None and entry[0] is task:
+            del self._inflight[k]
+        # Mọi người chờ đã bị hủy -> không ai đọc exception, tránh log "never retrieved"
+        if not task.cancelled():
+            task.exception()
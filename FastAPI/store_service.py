@@ -0,0 +1,375 @@
+"""
+Chạy nhiều worker uvicorn mà không nhân bản model + index theo số worker.
+
+Một process service giữ ComicStore (model embedding, FAISS, metadata, micro-batcher)
+và nghe trên Unix socket; worker API (STORE_MODE=remote) dùng RemoteComicStore cùng
+interface với ComicStore mà RAGBot cần. Request từ mọi worker đổ về cùng batcher
+nên encode vẫn gom batch và dùng hết các core qua thread nội bộ của torch/onnx.
+
+    python store_service.py                     # 1 process: model + index
+    STORE_MODE=remote uvicorn main:app --workers 4
+
+Giao thức: multiprocessing.connection (pickle, có authkey), mỗi lời gọi
+(method, args) -> ("ok", kết quả) | ("err", thông báo). Mỗi worker giữ một pool
+kết nối, mỗi kết nối một thread phía service.
+
+Authkey: STORE_SERVICE_AUTHKEY, hoặc file STORE_SERVICE_KEY_FILE do service sinh lúc chạy lần đầu.
+Socket và file key đều chỉ user chạy service đọc / kết nối được (0600).
+"""
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    EMBED_MAX_WORKERS,
+    STORE_SERVICE_AUTHKEY,
+    STORE_SERVICE_KEY_FILE,
+    STORE_SERVICE_SOCKET,
+    STORE_VERSION_TTL_S,
+    TOP_K_CANDIDATES,
+)
+from filters import NO_FILTER, SearchFilter, parse_filters
+
+logger = logging.getLogger(__name__)
+
+# Chỉ các method này được gọi qua socket
+REMOTE_METHODS = {
+    "encode_query",
+    "encode_texts",
+    "search",
+    "search_many",
+    "similar",
+    "has_exact_name",
+    "version",
+    "genres",
+    "warmup",
+    "reload",
+    "batch_stats",
+    "cache_stats",
+    "cache_clear",
+    "ping",
+}
+
+
+class RemoteError(RuntimeError):
+    pass
+
+
+def load_authkey(create: bool = False, key_file: Path = STORE_SERVICE_KEY_FILE) -> bytes:
+    """
+    Key từ STORE_SERVICE_AUTHKEY, không có thì đọc `key_file`; `create` (phía service) sinh file
+    nếu chưa có. File mà group / other đọc được thì từ chối.
+    """
+    if STORE_SERVICE_AUTHKEY:
+        return STORE_SERVICE_AUTHKEY
+    if create and not key_file.exists():
+        key_file.parent.mkdir(parents=True, exist_ok=True)
+        # Ghi file tạm 0600 rồi link sang tên thật: worker không bao giờ đọc phải file rỗng,
+        # key có sẵn (service khác vừa tạo) không bị ghi đè
+        tmp = key_file.with_name(f"{key_file.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            os.link(tmp, key_file)
+            logger.info("Generated store service key at %s", key_file)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    if os.stat(key_file).st_mode & 0o077:
+        raise PermissionError(f"{key_file} is accessible by other users, chmod 600 it")
+    key = key_file.read_bytes().strip()
+    if not key:
+        raise ValueError(f"{key_file} is empty")
+    return key
+
+
+# ================= SERVICE =================
+
+class StoreService:
+    def __init__(self, store: Any, address: str = str(STORE_SERVICE_SOCKET), authkey: Optional[bytes] = None):
+        self.store = store
+        self.address = address
+        self.authkey = authkey if authkey is not None else load_authkey(create=True)
+        self._listener: Optional[Listener] = None
+        self._stop = threading.Event()
+
+    # ---------- Method gọi từ xa ----------
+    def _dispatch(self, method: str, args: Tuple[Any, ...]) -> Any:
+        store = self.store
+        if method == "version":
+            return store.version
+        if method == "genres":
+            return store.snapshot.version, store.snapshot.filters.genres
+        if method == "cache_stats":
+            return store.query_cache.stats()
+        if method == "cache_clear":
+            return store.query_cache.clear()
+        if method == "ping":
+            return "pong"
+        return getattr(store, method)(*args)
+
+    def _serve_conn(self, conn: Connection) -> None:
+        with conn:
+            while not self._stop.is_set():
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if method not in REMOTE_METHODS:
+                    reply = ("err", f"Unknown method {method!r}")
+                else:
+                    try:
+                        reply = ("ok", self._dispatch(method, args))
+                    except Exception as e:
+                        logger.exception("Store call %s failed", method)
+                        reply = ("err", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        # Chỉ user chạy service (và worker cùng user) được kết nối: socket tạo ra đã là 0600,
+        # không có khoảng hở giữa bind và chmod (umask là của cả process, chỉ đổi trong lúc bind)
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        logger.info("Store service listening on %s", self.address)
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError) as e:
+                if self._stop.is_set():
+                    break
+                # Sai authkey / client ngắt giữa handshake: bỏ qua kết nối đó
+                logger.warning("Rejected store connection: %s", e)
+                continue
+            threading.Thread(target=self._serve_conn, args=(conn,), name="store-conn", daemon=True).start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+# ================= CLIENT =================
+
+class _RemoteCache:
+    """Thay cho store.query_cache ở worker (stats / clear nằm ở service)."""
+
+    def __init__(self, remote: "RemoteComicStore"):
+        self._remote = remote
+
+    def stats(self) -> Dict[str, Any]:
+        return self._remote._call("cache_stats")
+
+    def clear(self) -> None:
+        self._remote._call("cache_clear")
+
+
+class RemoteComicStore:
+    """
+    Interface như ComicStore cho RAGBot, mỗi lời gọi là một round-trip Unix socket.
+    batching = False: RAGBot gọi thẳng search/encode_query trong executor; gom batch nằm ở service.
+    """
+
+    batching = False
+
+    def __init__(
+        self,
+        address: str = str(STORE_SERVICE_SOCKET),
+        authkey: Optional[bytes] = None,
+        pool_size: int = EMBED_MAX_WORKERS,
+        connect_timeout_s: float = 60.0,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self._pool: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self._pool_size = max(1, pool_size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self.query_cache = _RemoteCache(self)
+
+        self._version: Optional[str] = None
+        self._version_at = 0.0
+        self._genres: Tuple[Optional[str], List[str]] = (None, [])
+
+        # Service có thể khởi động chậm hơn worker (load model) -> chờ file key và socket
+        deadline = time.monotonic() + connect_timeout_s
+        while True:
+            try:
+                if self.authkey is None:
+                    self.authkey = load_authkey()
+                self._release(self._acquire())
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+        self.dim = int(self._call("encode_texts", ["ping"]).shape[1])
+
+    # ---------- Pool kết nối ----------
+    def _acquire(self) -> Connection:
+        while True:
+            try:
+                return self._pool.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._opened < self._pool_size:
+                    self._opened += 1
+                    break
+            # Pool đầy: chờ kết nối được trả về, định kỳ kiểm tra lại (kết nối hỏng bị bỏ khỏi pool)
+            try:
+                return self._pool.get(timeout=0.05)
+            except queue.Empty:
+                continue
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _release(self, conn: Connection) -> None:
+        self._pool.put(conn)
+
+    def _discard(self, conn: Connection) -> None:
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def _call(self, method: str, *args: Any) -> Any:
+        # Kết nối hỏng (service restart) -> bỏ cả pool (đều đã chết), mở lại và thử đúng một lần
+        for attempt in (0, 1):
+            conn = self._acquire()
+            try:
+                conn.send((method, args))
+                status, payload = conn.recv()
+            except (EOFError, OSError):
+                self._discard(conn)
+                self.close()
+                if attempt:
+                    raise
+                continue
+            self._release(conn)
+            if status != "ok":
+                raise RemoteError(payload)
+            return payload
+
+    # ---------- Interface ComicStore ----------
+    @property
+    def version(self) -> str:
+        # Gọi ở mọi request (cache response) -> nhớ trong STORE_VERSION_TTL_S
+        now = time.monotonic()
+        if self._version is None or now - self._version_at > STORE_VERSION_TTL_S:
+            self._version = self._call("version")
+            self._version_at = now
+        return self._version
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        return self._call("encode_texts", list(texts))
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return self._call("encode_query", query)
+
+    def search(
+        self, query: str, top_k: int = TOP_K_CANDIDATES, filters: SearchFilter = NO_FILTER
+    ) -> Tuple[List[Dict[str, Any]], List[float]]:
+        return self._call("search", query, top_k, filters)
+
+    def search_many(
+        self, queries: List[str], top_k: int = TOP_K_CANDIDATES, filters: SearchFilter = NO_FILTER
+    ) -> List[Tuple[List[Dict[str, Any]], List[float]]]:
+        return self._call("search_many", list(queries), top_k, filters)
+
+    def similar(
+        self, comic_id: int, limit: int, filters: SearchFilter = NO_FILTER
+    ) -> Optional[Tuple[List[Dict[str, Any]], List[float]]]:
+        return self._call("similar", comic_id, limit, filters)
+
+    def parse_filters(self, message: str) -> SearchFilter:
+        # Danh sách genre chỉ đổi khi index đổi -> parse ngay ở worker, không tốn round-trip
+        version = self.version
+        if self._genres[0] != version:
+            self._genres = self._call("genres")
+        flt = parse_filters(message, self._genres[1])
+        # Chỉ tốn round-trip khi câu có filter: xem có phải đúng tên truyện không
+        if not flt.is_empty and self._call("has_exact_name", message):
+            return NO_FILTER
+        return flt
+
+    def warmup(self) -> Dict[str, float]:
+        t0 = time.perf_counter()
+        self._call("ping")
+        rtt_ms = (time.perf_counter() - t0) * 1000.0
+        return {**self._call("warmup"), "ipc_rtt_ms": round(rtt_ms, 3)}
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        self._version = None
+        return self._call("reload", force)
+
+    def batch_stats(self) -> Dict[str, Any]:
+        return self._call("batch_stats")
+
+    # Service tự theo dõi file index
+    def start_watcher(self, *_: Any) -> None:
+        return None
+
+    def stop_watcher(self) -> None:
+        return None
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+def main() -> None:
+    import signal
+
+    from comic_store import ComicStore
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    store = ComicStore()
+    logger.info("Store warm-up: %s", store.warmup())
+    store.start_watcher()
+    service = StoreService(store)
+
+    def _shutdown(*_: Any) -> None:
+        service.close()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    try:
+        service.serve_forever()
+    finally:
+        service.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import re
+import unicodedata
+
+_WS_RE = re.compile(r"\s+")
+
+
+def strip_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Truyện đã hoàn thành' -> 'Truyen da hoan thanh'."""
+    text = (text or "").replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa NFC, lower-case, gộp khoảng trắng."""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return _WS_RE.sub(" ", text).strip()
+
+
+def fold_chars(text: str) -> str:
+    """Bỏ dấu từng ký tự, giữ nguyên độ dài -> vị trí khớp trên chuỗi bỏ dấu dùng được cho chuỗi gốc."""
+    out = []
+    for ch in text or "":
+        base = strip_accents(ch)
+        out.append(base if len(base) == 1 else ch)
+    return "".join(out)